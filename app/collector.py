@@ -0,0 +1,231 @@
+"""Background collector: the single writer of session state and snapshots."""
+
+from __future__ import annotations
+
+import atexit
+import datetime
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from .config import (
+    COLLECTOR_DEBOUNCE,
+    COLLECTOR_INTERVAL,
+    COLLECTOR_WATCH,
+    COLLECTOR_WORKERS,
+    LOCAL_TZ,
+    MANAGEMENT_ADDRESS,
+    MANAGEMENT_BYTECOUNT_INTERVAL,
+    MANAGEMENT_CLIENT_AUTH,
+    MANAGEMENT_PASSWORD,
+)
+from .geo_store import flush_geo_db, sync_geo_db
+from .history_store import get_history_store, migrate_legacy_history
+from .instances import StatusInstance, parse_instances
+from .management import ManagementClient, ManagementError, ManagementSessionSource
+from .metrics import collector_metrics, publish_collector_metrics
+from .parser import parse_status_log
+from .rates import record_snapshot
+from .rollups import record_traffic
+from .snapshot import ClientSnapshot, publish_snapshot
+from .status_watcher import StatusFileWatcher
+
+logger = logging.getLogger(__name__)
+
+
+def collect_instance(instance: StatusInstance) -> List[Dict[str, Any]]:
+    """Parse one instance's status file, tagging rows of named instances."""
+
+    try:
+        age = time.time() - os.stat(instance.status_path).st_mtime
+    except OSError:
+        age = None
+
+    started = time.perf_counter()
+    clients = parse_status_log(instance.status_path, instance.sessions_path)
+    elapsed = time.perf_counter() - started
+    collector_metrics.observe("parse_duration_seconds", elapsed, instance.name)
+    if age is not None:
+        collector_metrics.observe("status_file_age_seconds", max(age, 0.0), instance.name)
+
+    if instance.name:
+        for client in clients:
+            client["instance"] = instance.name
+    return clients
+
+
+def collect_once(
+    instances: Optional[Sequence[StatusInstance]] = None,
+    executor: Optional[Executor] = None,
+) -> ClientSnapshot:
+    """Parse every instance's status file once and publish one combined snapshot.
+
+    With an ``executor`` the instances are parsed in parallel; rows are
+    published in instance order either way.
+    """
+
+    if instances is None:
+        instances = parse_instances()
+
+    if executor is None or len(instances) < 2:
+        results = [collect_instance(instance) for instance in instances]
+    else:
+        results = list(executor.map(collect_instance, instances))
+
+    snapshot = publish_snapshot([client for clients in results for client in clients])
+    record_snapshot(snapshot)
+    record_traffic(snapshot)
+    sync_geo_db()
+    publish_collector_metrics()
+    return snapshot
+
+
+def _publish_management(source: ManagementSessionSource, now: datetime.datetime) -> None:
+    started = time.perf_counter()
+    clients = source.apply(now)
+    collector_metrics.observe("parse_duration_seconds", time.perf_counter() - started)
+    snapshot = publish_snapshot(clients)
+    record_snapshot(snapshot)
+    record_traffic(snapshot)
+    sync_geo_db()
+    publish_collector_metrics()
+
+
+def follow_management(
+    client: ManagementClient,
+    source: Optional[ManagementSessionSource] = None,
+    resync_interval: float = COLLECTOR_INTERVAL,
+    bytecount_interval: int = MANAGEMENT_BYTECOUNT_INTERVAL,
+    approve_clients: bool = MANAGEMENT_CLIENT_AUTH,
+    max_batches: Optional[int] = None,
+) -> ManagementSessionSource:
+    """Publish snapshots from a connected management interface.
+
+    Starts from a ``status 3`` baseline, then applies push notifications as
+    they arrive and re-reads ``status 3`` every ``resync_interval`` seconds to
+    repair anything the notifications missed. Runs until the connection
+    fails, or for ``max_batches`` batches.
+    """
+
+    if source is None:
+        source = ManagementSessionSource()
+
+    source.load_status(client.status())
+    _publish_management(source, datetime.datetime.now(LOCAL_TZ))
+    if bytecount_interval > 0:
+        client.command(f"bytecount {bytecount_interval}")
+    last_sync = time.monotonic()
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        timeout = max(resync_interval - (time.monotonic() - last_sync), 0)
+        events = client.read_events(timeout)
+        now = datetime.datetime.now(LOCAL_TZ)
+
+        for line in events:
+            source.handle_event(line, now)
+
+        if approve_clients:
+            for client_id, key_id in source.auth_requests:
+                client.command(f"client-auth-nt {client_id} {key_id}")
+        source.auth_requests.clear()
+
+        if time.monotonic() - last_sync >= resync_interval:
+            source.load_status(client.status())
+            last_sync = time.monotonic()
+
+        _publish_management(source, now)
+        batches += 1
+
+    return source
+
+
+def run_management_collector(
+    address: str = MANAGEMENT_ADDRESS,
+    password: Optional[str] = MANAGEMENT_PASSWORD,
+    interval: float = COLLECTOR_INTERVAL,
+) -> None:
+    """Follow the management interface forever, reconnecting on failures."""
+
+    while True:
+        try:
+            with ManagementClient(address, password) as client:
+                logger.info("Connected to OpenVPN management interface at %s", address)
+                follow_management(client, resync_interval=interval)
+        except (OSError, ManagementError) as exc:
+            logger.warning("Management interface %s unavailable: %s", address, exc)
+        except Exception:  # pragma: no cover - keep the collector alive
+            logger.exception("Management collector failed")
+        time.sleep(interval)
+
+
+def _terminate(signum, frame) -> None:
+    """Flush pending geo DB changes and exit on SIGTERM.
+
+    supervisord stops the collector with SIGTERM, whose default action skips
+    ``atexit`` handlers.
+    """
+
+    flush_geo_db(True)
+    raise SystemExit(0)
+
+
+def _install_shutdown_handler() -> None:
+    # Signal handlers can only be installed from the main thread.
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _terminate)
+
+
+def run_collector(
+    interval: float = COLLECTOR_INTERVAL,
+    watch: bool = COLLECTOR_WATCH,
+    watcher: Optional[StatusFileWatcher] = None,
+) -> None:
+    """Collect forever.
+
+    With ``MANAGEMENT_ADDRESS`` configured the management interface is the
+    data source. Otherwise the status files of all configured instances are
+    parsed, in parallel on up to ``COLLECTOR_WORKERS`` threads. With ``watch``
+    enabled a cycle runs right after each status flush and at least every
+    ``interval`` seconds; without it (or when inotify is not available) the
+    collector simply sleeps ``interval`` between cycles.
+    """
+
+    store = get_history_store()
+    if store.backend == "jsonl":
+        migrate_legacy_history(store.path)
+    # Geo DB changes are written behind; do not leave them pending on exit.
+    atexit.register(flush_geo_db, True)
+    _install_shutdown_handler()
+
+    if MANAGEMENT_ADDRESS:
+        run_management_collector(interval=interval)
+        return
+
+    instances = parse_instances()
+    executor = None
+    if len(instances) > 1:
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(COLLECTOR_WORKERS, len(instances))),
+            thread_name_prefix="collector",
+        )
+
+    if watch and watcher is None:
+        watcher = StatusFileWatcher(
+            [instance.status_path for instance in instances], debounce=COLLECTOR_DEBOUNCE
+        )
+
+    while True:
+        try:
+            collect_once(instances, executor)
+        except Exception:  # pragma: no cover - keep the collector alive
+            logger.exception("Collector cycle failed")
+
+        if watcher is not None:
+            watcher.wait(interval)
+        else:
+            time.sleep(interval)
@@ -25,6 +25,13 @@ def _load_path(env_var: str, default: str) -> str:
     return os.path.expanduser(path)
 
 
+def _load_bool(env_var: str, default: bool = False) -> bool:
+    value = os.getenv(env_var)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
 def _default_data_path(filename: str) -> str:
     return str(_DEFAULT_DATA_DIR / filename)
 
@@ -51,7 +58,24 @@ def _ensure_data_files(targets) -> None:
 
 LOCAL_TZ = _load_timezone()
 STATUS_LOG_PATH = _load_path("OPENVPN_STATUS_LOG", "/var/log/openvpn/status.log")
+# Also hash the status file contents when deciding whether it changed. Only
+# needed on filesystems with coarse mtime resolution.
+STATUS_LOG_HASH = _load_bool("OPENVPN_STATUS_HASH")
 HISTORY_LOG_PATH = _load_path("OPENVPN_HISTORY_LOG", _default_data_path("session_history.json"))
+# "jsonl" (default) keeps history in HISTORY_LOG_PATH, "sqlite" uses HISTORY_DB_PATH.
+HISTORY_BACKEND = os.getenv("OPENVPN_HISTORY_BACKEND", "jsonl").strip().lower()
+HISTORY_DB_PATH = _load_path("OPENVPN_HISTORY_DB", _default_data_path("session_history.sqlite3"))
+# Events older than HISTORY_RETENTION_DAYS are moved out of the JSON Lines history by
+# compact_history.py into compressed monthly segments in HISTORY_ARCHIVE_DIR (see
+# app/history_archive.py). 0 keeps the whole history in HISTORY_LOG_PATH.
+HISTORY_RETENTION_DAYS = float(os.getenv("OPENVPN_HISTORY_RETENTION_DAYS", "90"))
+HISTORY_ARCHIVE_DIR = _load_path(
+    "OPENVPN_HISTORY_ARCHIVE", str(Path(HISTORY_LOG_PATH).parent / "history_archive")
+)
+# Per-client totals maintained alongside the JSON Lines history.
+HISTORY_AGGREGATES_PATH = _load_path(
+    "OPENVPN_HISTORY_AGGREGATES", str(Path(HISTORY_LOG_PATH).parent / "client_aggregates.json")
+)
 ACTIVE_SESSIONS_PATH = _load_path(
     "OPENVPN_ACTIVE_SESSIONS", _default_data_path("active_sessions.json")
 )
@@ -59,10 +83,62 @@ SERVER_STATUS_PATH = _load_path("OPENVPN_SERVER_STATUS", _default_data_path("ser
 CLIENT_GEO_DB_PATH = _load_path(
     "OPENVPN_CLIENT_GEO_DB", _default_data_path("client_geolocation.json")
 )
+# Write-behind of the geolocation DB: flush after this many pending changes or
+# once the oldest pending change is this many seconds old (see app/geo_store.py).
+GEO_FLUSH_CHANGES = int(os.getenv("OPENVPN_GEO_FLUSH_CHANGES", "1000"))
+GEO_FLUSH_INTERVAL = float(os.getenv("OPENVPN_GEO_FLUSH_INTERVAL", "30"))
+# Local IP geolocation database: MaxMind .mmdb or a CSV of IP ranges (see app/geoip.py).
+GEOIP_DB_PATH = _load_path("OPENVPN_GEOIP_DB", "")
+CLIENT_SNAPSHOT_PATH = _load_path(
+    "OPENVPN_CLIENT_SNAPSHOT", _default_data_path("client_snapshot.json")
+)
+# Per-client throughput rates published by the collector (see app/rates.py).
+CLIENT_RATES_PATH = _load_path("OPENVPN_CLIENT_RATES", _default_data_path("client_rates.json"))
+# Samples kept per session, and the time constant of the smoothed rate (seconds).
+RATES_WINDOW = int(os.getenv("OPENVPN_RATES_WINDOW", "360"))
+RATES_SMOOTHING = float(os.getenv("OPENVPN_RATES_SMOOTHING", "60"))
+# Per-client and server traffic in 1 min / 1 h / 1 day buckets (see app/rollups.py)
+# and how long each resolution is kept, in days.
+ROLLUPS_DB_PATH = _load_path("OPENVPN_ROLLUPS_DB", _default_data_path("traffic_rollups.sqlite3"))
+ROLLUP_MINUTE_RETENTION_DAYS = float(os.getenv("OPENVPN_ROLLUP_MINUTE_DAYS", "2"))
+ROLLUP_HOUR_RETENTION_DAYS = float(os.getenv("OPENVPN_ROLLUP_HOUR_DAYS", "90"))
+ROLLUP_DAY_RETENTION_DAYS = float(os.getenv("OPENVPN_ROLLUP_DAY_DAYS", "1825"))
+# Counters and timings published by the collector for /metrics.
+COLLECTOR_METRICS_PATH = _load_path(
+    "OPENVPN_COLLECTOR_METRICS", _default_data_path("collector_metrics.json")
+)
+# Several OpenVPN instances monitored by one deployment, as "name=status_path"
+# pairs separated by ";" (see app/instances.py). Empty: only STATUS_LOG_PATH.
+INSTANCES = os.getenv("OPENVPN_INSTANCES", "").strip()
+# Upper bound on status files parsed in parallel.
+COLLECTOR_WORKERS = int(os.getenv("OPENVPN_COLLECTOR_WORKERS", "4"))
+COLLECTOR_INTERVAL = float(os.getenv("OPENVPN_COLLECTOR_INTERVAL", "10"))
+# Wake the collector through inotify as soon as status.log is rewritten;
+# COLLECTOR_INTERVAL then only bounds the time between forced re-checks.
+COLLECTOR_WATCH = _load_bool("OPENVPN_COLLECTOR_WATCH", True)
+COLLECTOR_DEBOUNCE = float(os.getenv("OPENVPN_COLLECTOR_DEBOUNCE", "0.05"))
+# OpenVPN management interface ("host:port", "unix:/path" or "/path"). When
+# set, the collector follows it instead of polling STATUS_LOG_PATH.
+MANAGEMENT_ADDRESS = os.getenv("OPENVPN_MANAGEMENT", "").strip()
+MANAGEMENT_PASSWORD = os.getenv("OPENVPN_MANAGEMENT_PASSWORD") or None
+MANAGEMENT_BYTECOUNT_INTERVAL = int(os.getenv("OPENVPN_MANAGEMENT_BYTECOUNT", "5"))
+# Approve connections with client-auth-nt (for --management-client-auth).
+MANAGEMENT_CLIENT_AUTH = _load_bool("OPENVPN_MANAGEMENT_CLIENT_AUTH", False)
+# How often /api/stream connections check for a new snapshot, and how long
+# they may stay silent before a keep-alive comment is sent (seconds).
+STREAM_POLL_INTERVAL = float(os.getenv("OPENVPN_STREAM_POLL_INTERVAL", "0.5"))
+STREAM_KEEPALIVE_INTERVAL = float(os.getenv("OPENVPN_STREAM_KEEPALIVE", "15"))
+
+# Timing spans around lock waits, parsing and file I/O (see app/timing.py),
+# reported at /api/debug/timings. Spans slower than TIMING_SLOW_MS are logged
+# (0 disables the log); percentiles cover the last TIMING_WINDOW samples.
+TIMING_ENABLED = _load_bool("OPENVPN_TIMING", False)
+TIMING_SLOW_MS = float(os.getenv("OPENVPN_TIMING_SLOW_MS", "0"))
+TIMING_WINDOW = int(os.getenv("OPENVPN_TIMING_WINDOW", "1024"))
 
 _ensure_data_files(
     {
-        HISTORY_LOG_PATH: [],
+        HISTORY_LOG_PATH: None,
         ACTIVE_SESSIONS_PATH: {},
         SERVER_STATUS_PATH: {},
         CLIENT_GEO_DB_PATH: {"clients": {}, "updated_at": None},
@@ -0,0 +1,141 @@
+"""Helpers for the data files shared between the collector and the web app.
+
+The collector publishes its results as small JSON files (client snapshot,
+rates, collector metrics, geo DB, history archive manifest) and the web
+workers read them. Writers replace a file atomically with
+:func:`atomic_write_json`; readers decode it with :func:`load_cached_json`,
+which keeps the result per process until the file's :func:`stat_key`
+changes, so polling an unchanged file costs one ``stat()``.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+StatKey = Tuple[int, int, int]
+
+_cache_lock = threading.Lock()
+# {(path, build): (stat key, value)}
+_cache: Dict[Tuple[str, Optional[Callable[[Any], Any]]], Tuple[StatKey, Any]] = {}
+
+
+def stat_key(path: str) -> Optional[StatKey]:
+    """(inode, mtime_ns, size) of ``path``, or ``None`` if it does not exist."""
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def file_version(path: str) -> str:
+    """Opaque version of ``path`` that changes whenever the file is rewritten.
+
+    Built from the inode, size and modification time; ``"0"`` if the file
+    does not exist.
+    """
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "0"
+    return f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def load_cached_json(path: str, build: Optional[Callable[[Any], Any]] = None) -> Any:
+    """Decoded content of the JSON file ``path``, passed through ``build``.
+
+    ``build`` receives the decoded value, or ``None`` when the file is
+    missing or unreadable, and returns what the caller wants to keep (a
+    validated dict, a dataclass). The result is cached per ``(path, build)``
+    until the file's :func:`stat_key` changes; callers must treat it as
+    read-only.
+    """
+
+    target_path = os.path.abspath(path)
+    key = stat_key(target_path)
+    if key is None:
+        return build(None) if build is not None else None
+
+    cache_key = (target_path, build)
+    with _cache_lock:
+        cached = _cache.get(cache_key)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    try:
+        with open(target_path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except OSError:
+        data = None
+    except json.JSONDecodeError:
+        logger.warning("Ignoring malformed JSON in %s", target_path)
+        data = None
+    value = build(data) if build is not None else data
+
+    with _cache_lock:
+        _cache[cache_key] = (key, value)
+    return value
+
+
+def atomic_write_json(
+    path: str,
+    obj: Any,
+    *,
+    build: Optional[Callable[[Any], Any]] = None,
+    indent: Optional[int] = None,
+    fsync: bool = False,
+) -> Optional[StatKey]:
+    """Replace ``path`` with ``obj`` as JSON; readers see the old or the new file.
+
+    The data goes to a unique temporary file in the same directory that is
+    then renamed over ``path``. With ``fsync`` the data reaches the disk
+    before the rename, so a crash cannot leave a truncated file behind.
+    With ``build``, ``build(obj)`` is cached for :func:`load_cached_json`
+    so the writer does not read its own file back. Returns the new
+    :func:`stat_key`.
+    """
+
+    target_path = os.path.abspath(path)
+    directory = os.path.dirname(target_path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(target_path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            if indent is None:
+                json.dump(obj, fh, ensure_ascii=False, separators=(",", ":"))
+            else:
+                json.dump(obj, fh, ensure_ascii=False, indent=indent)
+            if fsync:
+                fh.flush()
+                os.fsync(fh.fileno())
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    key = stat_key(target_path)
+    if build is not None and key is not None:
+        value = build(obj)
+        with _cache_lock:
+            _cache[(target_path, build)] = (key, value)
+    return key
+
+
+def clear_caches() -> None:
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,143 @@
+"""Grid clustering of the resolved client locations for the dashboard maps.
+
+Every IP with a location in the geolocation DB is a point. For a map zoom
+level ``z`` the world is cut into square cells of ``360 / 2**z / 4`` degrees
+(about 64 px on a 256 px Leaflet tile), and the points of one cell become a
+single cluster with a count, a centroid and the bounds of its points. The
+cells of a zoom level are built once per version of the geolocation and
+GeoIP databases and reused by every request; a request only filters the
+cells of its bounding box.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .geo_store import known_points, locations_key
+
+MAX_ZOOM = 20
+# Cells per 256 px tile edge.
+_CELLS_PER_TILE = 4
+
+# (ip, latitude, longitude, city, country, client names)
+Point = Tuple[str, float, float, str, str, Tuple[str, ...]]
+
+
+def cell_size(zoom: int) -> float:
+    """Edge of a grid cell at ``zoom``, in degrees."""
+
+    return 360.0 / (2**zoom) / _CELLS_PER_TILE
+
+
+def _cluster(points: Sequence[Point]) -> Dict[str, Any]:
+    lats = [point[1] for point in points]
+    lons = [point[2] for point in points]
+    cluster: Dict[str, Any] = {
+        "latitude": sum(lats) / len(points),
+        "longitude": sum(lons) / len(points),
+        "count": len(points),
+        "bounds": [min(lats), min(lons), max(lats), max(lons)],
+    }
+    if len(points) == 1:
+        ip, _, _, city, country, clients = points[0]
+        cluster.update({"ip": ip, "city": city, "country": country, "clients": list(clients)})
+    return cluster
+
+
+class ClusterIndex:
+    """Points bucketed into grid cells, built lazily per zoom level."""
+
+    def __init__(self, points: Iterable[Point]):
+        self.points: List[Point] = list(points)
+        self._levels: Dict[int, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def level(self, zoom: int) -> List[Dict[str, Any]]:
+        """Clusters of every non-empty cell at ``zoom``."""
+
+        with self._lock:
+            clusters = self._levels.get(zoom)
+            if clusters is None:
+                size = cell_size(zoom)
+                cells: Dict[Tuple[int, int], List[Point]] = {}
+                for point in self.points:
+                    cell = (math.floor(point[1] / size), math.floor(point[2] / size))
+                    cells.setdefault(cell, []).append(point)
+                clusters = [_cluster(cell_points) for cell_points in cells.values()]
+                self._levels[zoom] = clusters
+            return clusters
+
+    def query(
+        self,
+        zoom: int,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        clients: Optional[Iterable[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Clusters at ``zoom`` whose centroid lies in ``bbox``.
+
+        ``bbox`` is ``(west, south, east, north)``; ``west > east`` crosses
+        the antimeridian. With ``clients`` only those clients' IPs are
+        clustered (on the fly, the cells are not cached).
+        """
+
+        if clients is not None:
+            wanted = set(clients)
+            index = ClusterIndex(point for point in self.points if wanted.intersection(point[5]))
+            return index.query(zoom, bbox)
+
+        clusters = self.level(zoom)
+        if bbox is None:
+            return clusters
+
+        west, south, east, north = bbox
+
+        def visible(cluster: Dict[str, Any]) -> bool:
+            if not south <= cluster["latitude"] <= north:
+                return False
+            lon = cluster["longitude"]
+            if west <= east:
+                return west <= lon <= east
+            return lon >= west or lon <= east
+
+        return [cluster for cluster in clusters if visible(cluster)]
+
+
+_index_lock = threading.Lock()
+_index: Optional[Tuple[Any, ClusterIndex]] = None
+
+
+def get_cluster_index() -> ClusterIndex:
+    """Index of the current resolved locations, rebuilt when they change."""
+
+    global _index
+
+    key = locations_key()
+    with _index_lock:
+        if _index is None or _index[0] != key:
+            _index = (key, ClusterIndex(known_points()))
+        return _index[1]
+
+
+def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    """Parse ``west,south,east,north`` (Leaflet's ``toBBoxString``).
+
+    Raises ``ValueError`` for anything else.
+    """
+
+    parts = [part.strip() for part in value.split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox must be west,south,east,north")
+    west, south, east, north = (float(part) for part in parts)
+    if not all(math.isfinite(v) for v in (west, south, east, north)):
+        raise ValueError("bbox must be west,south,east,north")
+    if south > north:
+        raise ValueError("bbox south must not be above north")
+    # Leaflet reports longitudes beyond +-180 after panning around the world.
+    if east - west >= 360:
+        west, east = -180.0, 180.0
+    else:
+        west = (west + 180) % 360 - 180
+        east = (east + 180) % 360 - 180
+    return west, south, east, north
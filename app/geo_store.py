@@ -1,15 +1,26 @@
-"""Helpers for maintaining the local client geolocation database."""
+"""Helpers for maintaining the local client geolocation database.
+
+The DB is parsed once per file version, keyed by (inode, mtime_ns, size), and
+kept in memory. Changes are written behind: they accumulate in the cached DB
+and :func:`flush_geo_db` writes it once ``GEO_FLUSH_CHANGES`` changes are
+pending or the oldest one is ``GEO_FLUSH_INTERVAL`` seconds old. The history
+marks live in the same document, so events not flushed before a crash are
+simply read again.
+"""
 
 from __future__ import annotations
 
-import json
-import os
+import threading
+import time
 from copy import deepcopy
 from datetime import UTC, datetime
-from typing import Any, Dict, Iterable, MutableMapping
-
-from .config import CLIENT_GEO_DB_PATH
+from typing import Any, Dict, List, MutableMapping, Optional, Set, Tuple
 
+from .config import CLIENT_GEO_DB_PATH, GEO_FLUSH_CHANGES, GEO_FLUSH_INTERVAL, GEOIP_DB_PATH
+from .fileutil import StatKey, atomic_write_json, file_version, load_cached_json, stat_key
+from .geoip import get_resolver, lookup
+from .history_store import get_history_store, has_required_fields, vpn_addresses
+from .timing import span
 
 _EMPTY_DB: Dict[str, Any] = {"clients": {}, "updated_at": None}
 
@@ -18,37 +29,72 @@ def _now_utc_iso() -> str:
     return datetime.now(tz=UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
-def _safe_read_json(path: str) -> Dict[str, Any]:
-    if not os.path.exists(path):
+def _db_from_data(data: Any) -> Dict[str, Any]:
+    if not isinstance(data, MutableMapping):
         return deepcopy(_EMPTY_DB)
 
-    try:
-        with open(path, "r", encoding="utf-8") as fh:
-            data = json.load(fh)
-    except (OSError, json.JSONDecodeError):
-        return deepcopy(_EMPTY_DB)
+    if not isinstance(data.get("clients"), MutableMapping):
+        return dict(data, clients={})
+    return data
 
-    if not isinstance(data, MutableMapping):
-        return deepcopy(_EMPTY_DB)
 
-    clients = data.get("clients")
-    if not isinstance(clients, MutableMapping):
-        data["clients"] = {}
+_cache_lock = threading.RLock()
+_cached_db: Optional[Dict[str, Any]] = None
+# stat_key() of the file version _cached_db was read from or written to.
+_cached_key: Optional[StatKey] = None
+_dirty = 0
+_dirty_since = 0.0
 
-    return data
+
+def _load_db() -> Dict[str, Any]:
+    """The cached DB, re-read only when the file changed on disk.
+
+    While changes are pending the in-memory DB is authoritative. The DB is
+    a private copy of what :func:`load_cached_json` shares, so callers may
+    modify it, but only while holding ``_cache_lock`` and calling
+    :func:`_mark_dirty`.
+    """
+
+    global _cached_db, _cached_key, _address_index
+
+    with _cache_lock:
+        key = stat_key(CLIENT_GEO_DB_PATH)
+        if _cached_db is not None and (_dirty or key == _cached_key):
+            return _cached_db
+        with span("geo.read"):
+            db = deepcopy(load_cached_json(CLIENT_GEO_DB_PATH, _db_from_data))
+        _cached_db = db
+        _cached_key = key
+        _address_index = _AddressIndex()
+        return _cached_db
+
+
+def _mark_dirty(changes: int = 1) -> None:
+    global _dirty, _dirty_since
+
+    if not _dirty:
+        _dirty_since = time.monotonic()
+    _dirty += changes
 
 
-def _safe_write_json(path: str, payload: Dict[str, Any]) -> None:
-    directory = os.path.dirname(path)
-    if directory:
-        os.makedirs(directory, exist_ok=True)
+def flush_geo_db(force: bool = False) -> bool:
+    """Write pending changes if due (or ``force``); returns whether it wrote."""
 
-    tmp_path = f"{path}.tmp"
-    with open(tmp_path, "w", encoding="utf-8") as fh:
-        json.dump(payload, fh, indent=2, sort_keys=True, ensure_ascii=False)
-        fh.write("\n")
+    global _cached_key, _dirty
 
-    os.replace(tmp_path, path)
+    with _cache_lock:
+        if not _dirty or _cached_db is None:
+            return False
+        if (
+            not force
+            and _dirty < GEO_FLUSH_CHANGES
+            and time.monotonic() - _dirty_since < GEO_FLUSH_INTERVAL
+        ):
+            return False
+        with span("geo.write"):
+            _cached_key = atomic_write_json(CLIENT_GEO_DB_PATH, _cached_db)
+        _dirty = 0
+        return True
 
 
 def _ensure_client_record(db: Dict[str, Any], name: str) -> Dict[str, Any]:
@@ -94,48 +140,193 @@ def _ensure_ip_record(client: Dict[str, Any], ip: str) -> Dict[str, Any]:
     return ip_record
 
 
-def _append_unique(sequence: list, value: str) -> bool:
-    if not value:
+def _resolve_location(ip_record: Dict[str, Any], resolver) -> bool:
+    location = ip_record.setdefault("location", {})
+    if resolver is None or location.get("latitude") is not None:
         return False
-    if value in sequence:
+
+    resolved = lookup(ip_record.get("ip") or "", resolver)
+    if resolved is None:
         return False
-    sequence.append(value)
+    location.update(resolved)
     return True
 
 
-def ensure_geo_db_entries(history_entries: Iterable[Dict[str, Any]]) -> None:
-    """Ensure that the geolocation DB knows about every client/IP in history."""
+class _AddressIndex:
+    """Set views of the ``vpn_ipv4``/``vpn_ipv6`` lists, built on first use.
 
-    db = _safe_read_json(CLIENT_GEO_DB_PATH)
-    changed = False
+    Keeps duplicate checks O(1) while the DB stores plain JSON lists.
+    """
+
+    def __init__(self):
+        self._seen: Dict[Tuple[str, str, str], Set[str]] = {}
+
+    def append(self, name: str, ip_record: Dict[str, Any], field: str, value: str) -> bool:
+        if not value:
+            return False
+        key = (name, ip_record["ip"], field)
+        seen = self._seen.get(key)
+        if seen is None:
+            seen = self._seen[key] = set(ip_record[field])
+        if value in seen:
+            return False
+        seen.add(value)
+        ip_record[field].append(value)
+        return True
 
-    for entry in history_entries:
-        name = entry.get("name")
-        if not name:
-            continue
 
-        client = _ensure_client_record(db, name)
+# Set views of the cached DB; replaced whenever the DB is re-read.
+_address_index = _AddressIndex()
 
-        timestamp = entry.get("timestamp") or ""
-        if _update_seen(client, timestamp):
-            changed = True
 
-        ip = entry.get("ip") or ""
-        if not ip:
-            # Nothing to record if we don't have an external IP.
-            continue
+def _ingest_entry(
+    db: Dict[str, Any], index: _AddressIndex, entry: Dict[str, Any], resolver
+) -> bool:
+    name = entry.get("name")
+    if not name:
+        return False
+
+    client = _ensure_client_record(db, name)
 
-        ip_record = _ensure_ip_record(client, ip)
-        if _update_seen(ip_record, timestamp):
-            changed = True
+    timestamp = entry.get("timestamp") or ""
+    changed = _update_seen(client, timestamp)
 
-        if _append_unique(ip_record["vpn_ipv4"], entry.get("vpn_ipv4")):
-            changed = True
+    ip = entry.get("ip") or ""
+    if not ip:
+        # Nothing to record if we don't have an external IP.
+        return changed
+
+    ip_record = _ensure_ip_record(client, ip)
+    if _update_seen(ip_record, timestamp):
+        changed = True
 
-        if _append_unique(ip_record["vpn_ipv6"], entry.get("vpn_ipv6")):
-            changed = True
+    if _resolve_location(ip_record, resolver):
+        changed = True
+
+    if index.append(name, ip_record, "vpn_ipv4", entry.get("vpn_ipv4")):
+        changed = True
+
+    if index.append(name, ip_record, "vpn_ipv6", entry.get("vpn_ipv6")):
+        changed = True
+
+    return changed
 
-    if changed:
-        db["updated_at"] = _now_utc_iso()
-        _safe_write_json(CLIENT_GEO_DB_PATH, db)
 
+def _geo_entry(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The fields of a stored event the geolocation DB needs.
+
+    Skips the same incomplete events as ``normalize_history_entry`` (see
+    ``has_required_fields``) without its date parsing.
+    """
+
+    if not has_required_fields(raw):
+        return None
+    _, vpn_ipv4, vpn_ipv6 = vpn_addresses(raw)
+    return {
+        "name": str(raw["name"]),
+        "ip": str(raw["ip"]),
+        "timestamp": str(raw["timestamp"]),
+        "vpn_ipv4": vpn_ipv4,
+        "vpn_ipv6": vpn_ipv6,
+    }
+
+
+# (history store, history version, geo DB version, GeoIP version) after the last sync.
+_synced_key: Optional[Tuple[str, str, str, str]] = None
+
+
+def sync_geo_db(store=None) -> int:
+    """Record history events added since the last sync in the geolocation DB.
+
+    The DB keeps a high-water mark per history store (see
+    ``iter_entries_since``), so each call only reads new events, and a call
+    when neither the history, the DB nor the GeoIP database changed returns
+    without reading anything. When the GeoIP database changes, IPs without a
+    location are resolved again. Returns the number of events read.
+    """
+
+    global _synced_key
+
+    flush_geo_db()
+
+    store = store or get_history_store()
+    source = f"{store.backend}:{store.path}"
+    geoip_version = file_version(GEOIP_DB_PATH)
+    key = (source, store.version(), file_version(CLIENT_GEO_DB_PATH), geoip_version)
+    if key == _synced_key:
+        return 0
+
+    resolver = get_resolver()
+    count = 0
+    with _cache_lock:
+        db = _load_db()
+        marks = db.get("history_marks")
+        if not isinstance(marks, dict):
+            marks = db["history_marks"] = {}
+
+        changes = 0
+        for mark, raw in store.iter_entries_since(marks.get(source)):
+            count += 1
+            marks[source] = mark
+            entry = _geo_entry(raw)
+            if entry and _ingest_entry(db, _address_index, entry, resolver):
+                changes += 1
+
+        if db.get("geoip_version") != geoip_version:
+            db["geoip_version"] = geoip_version
+            for client in db["clients"].values():
+                for ip_record in (client.get("ips") or {}).values():
+                    _resolve_location(ip_record, resolver)
+            changes += 1
+
+        if changes:
+            db["updated_at"] = _now_utc_iso()
+        if changes or count:
+            # A moved mark alone is worth one change.
+            _mark_dirty(max(changes, 1))
+
+    flush_geo_db()
+    _synced_key = (source, key[1], file_version(CLIENT_GEO_DB_PATH), geoip_version)
+    return count
+
+
+def known_points() -> List[Tuple[str, float, float, str, str, Tuple[str, ...]]]:
+    """``(ip, latitude, longitude, city, country, client names)`` of every located IP."""
+
+    names: Dict[str, List[str]] = {}
+    locations: Dict[str, Dict[str, Any]] = {}
+    with _cache_lock:
+        for name, client in _load_db()["clients"].items():
+            for ip, ip_record in (client.get("ips") or {}).items():
+                location = ip_record.get("location") or {}
+                if location.get("latitude") is None or location.get("longitude") is None:
+                    continue
+                locations[ip] = location
+                names.setdefault(ip, []).append(name)
+
+    return [
+        (
+            ip,
+            float(location["latitude"]),
+            float(location["longitude"]),
+            location.get("city") or "",
+            location.get("country") or "",
+            tuple(sorted(names[ip])),
+        )
+        for ip, location in locations.items()
+    ]
+
+
+def known_locations() -> Dict[str, Dict[str, Any]]:
+    """Resolved ``location`` of every IP in the geolocation DB."""
+
+    return {
+        ip: {"latitude": lat, "longitude": lon, "city": city, "country": country}
+        for ip, lat, lon, city, country, _ in known_points()
+    }
+
+
+def locations_key() -> tuple:
+    """Changes whenever the geolocation DB or the GeoIP database changes."""
+
+    return (file_version(CLIENT_GEO_DB_PATH), file_version(GEOIP_DB_PATH))
@@ -0,0 +1,176 @@
+"""Offline IP geolocation from a local database file.
+
+``OPENVPN_GEOIP_DB`` points either at a MaxMind ``.mmdb`` database (read with
+the optional ``maxminddb`` package) or at a CSV file of IP ranges::
+
+    start,end,latitude,longitude,city,country
+    81.2.69.0,81.2.69.255,51.51,-0.13,London,United Kingdom
+    2a02:ec0::/29,,48.85,2.35,Paris,France
+
+``start``/``end`` are addresses or integers; a CIDR network in ``start`` with
+an empty ``end`` covers the whole network. A header row is allowed. The CSV
+is compiled once into sorted range arrays per IP version and looked up with
+:func:`bisect.bisect_right`. The resolver is reloaded when the file changes.
+
+Lookups return the ``location`` block stored by :mod:`app.geo_store`
+(``latitude``, ``longitude``, ``city``, ``country``) or ``None`` for private
+and unknown addresses.
+"""
+
+from __future__ import annotations
+
+import csv
+import ipaddress
+import logging
+import threading
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import GEOIP_DB_PATH
+from .fileutil import file_version
+
+logger = logging.getLogger(__name__)
+
+Location = Dict[str, Any]
+
+
+def _parse_ip(value: str):
+    try:
+        return ipaddress.ip_address(value.strip())
+    except ValueError:
+        return None
+
+
+def _range_bounds(start: str, end: str) -> Tuple[int, int, int]:
+    """``(version, first, last)`` of a CSV range; raises ``ValueError``."""
+
+    start, end = start.strip(), end.strip()
+    if "/" in start and not end:
+        network = ipaddress.ip_network(start, strict=False)
+        return (
+            network.version,
+            int(network.network_address),
+            int(network.broadcast_address),
+        )
+    if start.isdigit() and end.isdigit():
+        first, last = int(start), int(end)
+        version = 4 if last < 2**32 else 6
+        return version, first, last
+
+    first_ip, last_ip = ipaddress.ip_address(start), ipaddress.ip_address(end)
+    if first_ip.version != last_ip.version:
+        raise ValueError("mixed IP versions")
+    return first_ip.version, int(first_ip), int(last_ip)
+
+
+class CsvGeoIP:
+    """IP range CSV compiled into sorted arrays for bisect lookups."""
+
+    def __init__(self, path: str):
+        self.path = path
+        rows: Dict[int, List[Tuple[int, int, Location]]] = {4: [], 6: []}
+        with open(path, "r", encoding="utf-8", newline="") as fh:
+            for line_no, row in enumerate(csv.reader(fh), 1):
+                if not row or row[0].lstrip().startswith("#"):
+                    continue
+                row = (row + [""] * 6)[:6]
+                try:
+                    version, first, last = _range_bounds(row[0], row[1])
+                    location = {
+                        "latitude": float(row[2]),
+                        "longitude": float(row[3]),
+                        "city": row[4].strip(),
+                        "country": row[5].strip(),
+                    }
+                except ValueError:
+                    if line_no > 1:
+                        logger.warning("Skipping malformed GeoIP row %d in %s", line_no, path)
+                    continue
+                rows[version].append((first, last, location))
+
+        self._starts: Dict[int, List[int]] = {}
+        self._ends: Dict[int, List[int]] = {}
+        self._locations: Dict[int, List[Location]] = {}
+        for version, ranges in rows.items():
+            ranges.sort(key=lambda item: item[0])
+            self._starts[version] = [first for first, _, _ in ranges]
+            self._ends[version] = [last for _, last, _ in ranges]
+            self._locations[version] = [location for _, _, location in ranges]
+
+    def __len__(self) -> int:
+        return sum(len(starts) for starts in self._starts.values())
+
+    def lookup(self, ip) -> Optional[Location]:
+        value = int(ip)
+        starts = self._starts[ip.version]
+        index = bisect_right(starts, value) - 1
+        if index < 0 or value > self._ends[ip.version][index]:
+            return None
+        return dict(self._locations[ip.version][index])
+
+
+class MmdbGeoIP:
+    """MaxMind database read through the optional ``maxminddb`` package."""
+
+    def __init__(self, path: str):
+        import maxminddb
+
+        self.path = path
+        self._reader = maxminddb.open_database(path)
+
+    def lookup(self, ip) -> Optional[Location]:
+        record = self._reader.get(str(ip))
+        if not isinstance(record, dict):
+            return None
+        coords = record.get("location") or {}
+        if coords.get("latitude") is None or coords.get("longitude") is None:
+            return None
+        return {
+            "latitude": coords["latitude"],
+            "longitude": coords["longitude"],
+            "city": (record.get("city") or {}).get("names", {}).get("en", ""),
+            "country": (record.get("country") or {}).get("names", {}).get("en", ""),
+        }
+
+
+_resolvers: Dict[str, Tuple[str, Any]] = {}
+_resolvers_lock = threading.Lock()
+
+
+def get_resolver(path: str = GEOIP_DB_PATH):
+    """Resolver for ``path``, reloaded when the file changes; ``None`` if unavailable."""
+
+    if not path:
+        return None
+
+    key = file_version(path)
+    with _resolvers_lock:
+        cached = _resolvers.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        resolver = None
+        if key != "0":
+            try:
+                if path.endswith(".mmdb"):
+                    resolver = MmdbGeoIP(path)
+                else:
+                    resolver = CsvGeoIP(path)
+            except ImportError:
+                logger.warning("maxminddb is not installed; cannot read %s", path)
+            except (OSError, ValueError) as exc:
+                logger.warning("Failed to load GeoIP database %s: %s", path, exc)
+        _resolvers[path] = (key, resolver)
+        return resolver
+
+
+def lookup(ip: str, resolver=None) -> Optional[Location]:
+    """Location of public address ``ip``, or ``None``."""
+
+    address = _parse_ip(ip or "")
+    if address is None or not address.is_global:
+        return None
+    resolver = resolver if resolver is not None else get_resolver()
+    if resolver is None:
+        return None
+    return resolver.lookup(address)
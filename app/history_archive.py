@@ -0,0 +1,191 @@
+"""Compressed monthly archive of old session history events.
+
+Events older than the retention period are moved out of the hot JSON Lines
+log (see ``JsonLinesHistoryStore.compact``) into gzip-compressed JSON Lines
+segments: one per calendar month of the event timestamp, sorted by
+timestamp. A segment file is never modified. Archiving more events of a
+month writes a new segment with the old and the new events, and the swap
+happens in the manifest, a small JSON file listing each segment with the
+time range it covers. Readers take the manifest, then decompress only the
+segments that overlap the time range they need.
+
+Replaced segments stay on disk for ``_RETIRE_GRACE`` seconds, so a reader
+that loaded the previous manifest can still open them.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import fcntl
+
+from .fileutil import atomic_write_json, load_cached_json
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+_SEGMENT_SUFFIX = ".jsonl.gz"
+_RETIRE_GRACE = 3600
+
+
+def _manifest_from_data(data: Any) -> Dict[str, Any]:
+    if not isinstance(data, dict):
+        data = {}
+    data.setdefault("segments", [])
+    data.setdefault("retired", [])
+    return data
+
+
+class HistoryArchive:
+    """Segments of archived history events in ``directory``.
+
+    Each manifest entry is ``{"month", "file", "start", "end", "count"}``,
+    where ``start`` and ``end`` are the first and last event timestamps.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        self.manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+
+    def manifest(self) -> Dict[str, Any]:
+        """The current manifest (``segments`` in month order, ``retired``)."""
+
+        return load_cached_json(self.manifest_path, _manifest_from_data)
+
+    def segments(self, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict]:
+        """Segments holding events with ``start <= timestamp <= end``, oldest first."""
+
+        return [
+            segment
+            for segment in self.manifest()["segments"]
+            if (start is None or segment["end"] >= start)
+            and (end is None or segment["start"] <= end)
+        ]
+
+    def entries(self, segment: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Events of ``segment`` in timestamp order."""
+
+        with gzip.open(os.path.join(self.directory, segment["file"]), "rb") as fh:
+            for line in fh:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(item, dict):
+                    yield item
+
+    @contextmanager
+    def lock(self):
+        """Serialize archive writers (one compaction at a time)."""
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_lines(self, segment: Dict[str, Any]) -> Iterator[Tuple[str, bytes]]:
+        with gzip.open(os.path.join(self.directory, segment["file"]), "rb") as fh:
+            for line in fh:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(item, dict):
+                    yield item["timestamp"], line
+
+    def _write_segment(self, month: str, lines: List[Tuple[str, bytes]]) -> Dict[str, Any]:
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix=f"{month}.", suffix=_SEGMENT_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as fh:
+                    for _, line in lines:
+                        fh.write(line)
+                raw.flush()
+                os.fsync(raw.fileno())
+        except BaseException:
+            os.unlink(path)
+            raise
+        return {
+            "month": month,
+            "file": os.path.basename(path),
+            "start": lines[0][0],
+            "end": lines[-1][0],
+            "count": len(lines),
+        }
+
+    def prepare(self, events: Dict[str, List[Tuple[str, bytes]]]) -> List[Dict[str, Any]]:
+        """Write the segments that add ``events`` to the archive, unpublished.
+
+        ``events`` maps a month (``YYYY-MM``) to ``(timestamp, line)`` pairs.
+        Each month's segment holds its current events plus the new ones;
+        lines that are already archived are not added twice, so archiving the
+        same events again (a compaction interrupted before the hot log was
+        rewritten) is harmless. Call with :meth:`lock` held, then
+        :meth:`publish` or :meth:`discard` the result.
+        """
+
+        current = {segment["month"]: segment for segment in self.manifest()["segments"]}
+        prepared = []
+        try:
+            for month in sorted(events):
+                lines: List[Tuple[str, bytes]] = []
+                if month in current:
+                    lines.extend(self._read_lines(current[month]))
+                archived = {line for _, line in lines}
+                for timestamp, line in events[month]:
+                    if line not in archived:
+                        archived.add(line)
+                        lines.append((timestamp, line))
+                lines.sort(key=lambda item: item[0])
+                prepared.append(self._write_segment(month, lines))
+        except BaseException:
+            self.discard(prepared)
+            raise
+        return prepared
+
+    def discard(self, segments: Iterable[Dict[str, Any]]) -> None:
+        for segment in segments:
+            try:
+                os.unlink(os.path.join(self.directory, segment["file"]))
+            except FileNotFoundError:
+                pass
+
+    def publish(self, segments: List[Dict[str, Any]], now: Optional[float] = None) -> None:
+        """Swap prepared ``segments`` into the manifest.
+
+        The segments they replace are retired and deleted on a later publish
+        once ``_RETIRE_GRACE`` has passed.
+        """
+
+        now = time.time() if now is None else now
+        manifest = self.manifest()
+        by_month = {segment["month"]: segment for segment in manifest["segments"]}
+        retired = list(manifest["retired"])
+        for segment in segments:
+            replaced = by_month.get(segment["month"])
+            if replaced is not None:
+                retired.append({"file": replaced["file"], "retired_at": now})
+            by_month[segment["month"]] = segment
+
+        expired = [item for item in retired if now - item["retired_at"] >= _RETIRE_GRACE]
+        retired = [item for item in retired if now - item["retired_at"] < _RETIRE_GRACE]
+
+        payload = {
+            "segments": [by_month[month] for month in sorted(by_month)],
+            "retired": retired,
+        }
+        atomic_write_json(
+            self.manifest_path, payload, build=_manifest_from_data, indent=2, fsync=True
+        )
+
+        self.discard(expired)
@@ -0,0 +1,1349 @@
+"""Storage backends for the session history log.
+
+The default backend keeps one JSON object per line. Appending an event is a
+single ``write()`` on a file opened with ``O_APPEND`` followed by ``fsync``,
+so the cost of recording a connect/disconnect no longer depends on the size
+of the history. Files written by older releases (one JSON array) are migrated
+once, the first time a writer touches them. Events past the retention period
+are moved into a compressed archive (see ``app/history_archive.py``) by
+``JsonLinesHistoryStore.compact``; reads cover the archive and the hot log.
+
+The optional SQLite backend (``OPENVPN_HISTORY_BACKEND=sqlite``) stores the
+same events in an indexed table so that lookups by client, time range or
+session scale with the size of the result rather than the whole history.
+"""
+
+from __future__ import annotations
+
+import base64
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import fcntl
+
+from .config import (
+    HISTORY_AGGREGATES_PATH,
+    HISTORY_ARCHIVE_DIR,
+    HISTORY_BACKEND,
+    HISTORY_DB_PATH,
+    HISTORY_LOG_PATH,
+    HISTORY_RETENTION_DAYS,
+    LOCAL_TZ,
+)
+from .fileutil import atomic_write_json, file_version, load_cached_json
+from .history_archive import HistoryArchive
+from .timing import span
+
+logger = logging.getLogger(__name__)
+
+_PEEK_SIZE = 64
+_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_REQUIRED_FIELDS = ("timestamp", "name", "ip", "session_id")
+# Closed session ids a JSON Lines store remembers to drop repeated disconnects,
+# and how much of the end of the log it reads them from on start.
+_RECENT_CLOSED_SESSIONS = 4096
+_RECENT_CLOSED_BYTES = 1 << 20
+# Cursor positions of archived events: negative, ordered by month then by line,
+# so that they sort below the byte offsets of the hot log.
+_ARCHIVE_POSITION_BASE = -(2**50)
+_ENTRY_FIELDS = (
+    "timestamp",
+    "name",
+    "ip",
+    "session_id",
+    "rx",
+    "tx",
+    "vpn_ip",
+    "vpn_ipv4",
+    "vpn_ipv6",
+    "port",
+    "session_end",
+)
+
+
+def is_valid_datetime(value: str) -> bool:
+    try:
+        datetime.strptime(value, _DATETIME_FORMAT)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+
+    try:
+        return datetime.strptime(value, _DATETIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_optional_float(value: Any) -> Optional[float]:
+    if value in (None, ""):
+        return None
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _calculate_duration(start: str, end: Optional[str]) -> Optional[str]:
+    start_dt = parse_datetime(start)
+    end_dt = parse_datetime(end)
+    if not (start_dt and end_dt):
+        return None
+
+    return str(end_dt - start_dt)
+
+
+def vpn_addresses(raw: Dict[str, Any]) -> Tuple[str, str, str]:
+    """``(vpn_ip, vpn_ipv4, vpn_ipv6)`` of an event, filling in the missing ones."""
+
+    vpn_ipv4 = (raw.get("vpn_ipv4") or "").strip()
+    vpn_ipv6 = (raw.get("vpn_ipv6") or "").strip()
+    vpn_ip = (raw.get("vpn_ip") or "").strip() or vpn_ipv4 or vpn_ipv6
+    return (
+        vpn_ip,
+        vpn_ipv4 or (vpn_ip if "." in vpn_ip else ""),
+        vpn_ipv6 or (vpn_ip if ":" in vpn_ip else ""),
+    )
+
+
+def has_required_fields(raw: Dict[str, Any]) -> bool:
+    """Whether a stored event has every field an event cannot do without."""
+
+    return all(raw.get(field) for field in _REQUIRED_FIELDS)
+
+
+def normalize_history_entry(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Convert a stored history event into the shape served by the API."""
+
+    if not has_required_fields(raw):
+        return None
+
+    timestamp = str(raw["timestamp"])
+    session_end_raw = raw.get("session_end")
+    session_end = (
+        session_end_raw
+        if isinstance(session_end_raw, str) and is_valid_datetime(session_end_raw)
+        else None
+    )
+
+    vpn_ip, vpn_ipv4, vpn_ipv6 = vpn_addresses(raw)
+    port = raw.get("port")
+    if port is not None:
+        port = str(port)
+
+    return {
+        "timestamp": timestamp,
+        "name": str(raw.get("name", "")),
+        "ip": str(raw.get("ip", "")),
+        "session_id": str(raw.get("session_id", "")),
+        "rx": _parse_optional_float(raw.get("rx")),
+        "tx": _parse_optional_float(raw.get("tx")),
+        "vpn_ip": vpn_ip,
+        "vpn_ipv4": vpn_ipv4,
+        "vpn_ipv6": vpn_ipv6,
+        "port": port or "",
+        "session_end": session_end,
+        "duration": _calculate_duration(timestamp, session_end),
+    }
+
+
+def _matches(entry: Dict[str, Any], name, start, end) -> bool:
+    if name is not None and entry.get("name") != name:
+        return False
+    timestamp = str(entry.get("timestamp") or "")
+    if start is not None and timestamp < start:
+        return False
+    if end is not None and timestamp > end:
+        return False
+    return True
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {
+        "sessions": 0,
+        "total_rx_mb": 0.0,
+        "total_tx_mb": 0.0,
+        "total_duration_seconds": 0,
+        "last_seen": None,
+    }
+
+
+def _entry_totals(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Contribution of one normalized history event to its client's totals."""
+
+    delta = _empty_totals()
+    if entry["session_end"]:
+        delta["sessions"] = 1
+    if entry["rx"] is not None:
+        delta["total_rx_mb"] = entry["rx"]
+    if entry["tx"] is not None:
+        delta["total_tx_mb"] = entry["tx"]
+
+    start_dt = parse_datetime(entry["timestamp"])
+    end_dt = parse_datetime(entry["session_end"])
+    if start_dt and end_dt and end_dt >= start_dt:
+        delta["total_duration_seconds"] = int((end_dt - start_dt).total_seconds())
+
+    candidates = ((entry["session_end"], end_dt), (entry["timestamp"], start_dt))
+    delta["last_seen"] = max((value for value, dt in candidates if dt), default=None)
+    return delta
+
+
+def _add_totals(info: Dict[str, Any], delta: Dict[str, Any]) -> None:
+    info["sessions"] += delta["sessions"]
+    info["total_rx_mb"] += delta["total_rx_mb"]
+    info["total_tx_mb"] += delta["total_tx_mb"]
+    info["total_duration_seconds"] += delta["total_duration_seconds"]
+    last_seen = delta["last_seen"]
+    if last_seen and (info["last_seen"] is None or last_seen > info["last_seen"]):
+        info["last_seen"] = last_seen
+
+
+def _add_entry(
+    totals: Dict[str, Dict[str, Any]], closed_sessions: Set[str], entry: Dict[str, Any]
+) -> None:
+    """Add one normalized event to ``totals``.
+
+    A session contributes to ``sessions`` once, however many disconnect
+    events were recorded for it; ``closed_sessions`` holds the session ids
+    already counted.
+    """
+
+    info = totals.setdefault(entry["name"], _empty_totals())
+    delta = _entry_totals(entry)
+    if delta["sessions"]:
+        if entry["session_id"] in closed_sessions:
+            delta["sessions"] = 0
+        closed_sessions.add(entry["session_id"])
+    _add_totals(info, delta)
+
+
+def compute_client_totals(entries: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Per-client totals over raw history events (full scan)."""
+
+    totals: Dict[str, Dict[str, Any]] = {}
+    closed_sessions: Set[str] = set()
+    for raw in entries:
+        entry = normalize_history_entry(raw)
+        if entry:
+            _add_entry(totals, closed_sessions, entry)
+    return totals
+
+
+def timestamp_key(value: Any) -> int:
+    """Order-preserving integer for a ``%Y-%m-%d %H:%M:%S`` string (0 if invalid)."""
+
+    if not isinstance(value, str) or len(value) != 19:
+        return 0
+    digits = value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19]
+    if not digits.isdigit():
+        return 0
+    return int(digits)
+
+
+def encode_cursor(timestamp: str, position: int, log_id: Optional[int] = None) -> str:
+    """Opaque page cursor; ``log_id`` pins it to one version of a rewritable log."""
+
+    fields: List[Any] = [timestamp, position]
+    if log_id is not None:
+        fields.append(log_id)
+    raw = json.dumps(fields, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int, Optional[int]]:
+    """Inverse of :func:`encode_cursor`; raises ``ValueError`` on garbage."""
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, position, *rest = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (TypeError, ValueError, UnicodeError) as exc:
+        raise ValueError("invalid cursor") from exc
+    log_id = rest[0] if len(rest) == 1 else None
+    if (
+        not isinstance(timestamp, str)
+        or not isinstance(position, int)
+        or len(rest) > 1
+        or not isinstance(log_id, (int, type(None)))
+    ):
+        raise ValueError("invalid cursor")
+    return timestamp, position, log_id
+
+
+def _query_scan(
+    entries: Iterable[Dict[str, Any]],
+    *,
+    name: Optional[str],
+    start: Optional[str],
+    end: Optional[str],
+    limit: Optional[int],
+    cursor: Optional[str],
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Newest-first query by full scan, for stores without an index."""
+
+    cursor_key = None
+    if cursor:
+        cursor_ts, cursor_pos, _ = decode_cursor(cursor)
+        cursor_key = (timestamp_key(cursor_ts), cursor_pos)
+
+    matched = []
+    for position, entry in enumerate(entries):
+        if not _matches(entry, name, start, end):
+            continue
+        key = (timestamp_key(entry.get("timestamp")), position)
+        if cursor_key is not None and key >= cursor_key:
+            continue
+        matched.append((key, position, entry))
+
+    matched.sort(key=lambda item: item[0], reverse=True)
+    if limit is None or len(matched) <= limit:
+        return [entry for _, _, entry in matched], None
+
+    page = matched[:limit]
+    _, last_position, last_entry = page[-1]
+    return [entry for _, _, entry in page], encode_cursor(
+        str(last_entry.get("timestamp") or ""), last_position
+    )
+
+
+class _TimestampIndex:
+    """In-memory (timestamp, byte offset) index over a JSON Lines history.
+
+    Keys and offsets live in parallel ``array('q')`` columns sorted by
+    timestamp, overall and per client name. The index is extended with just
+    the bytes appended since the last refresh and rebuilt when the file is
+    replaced or shrinks. It is refreshed from and read through an open file,
+    so the offsets always refer to the file that is read, even if the log is
+    replaced meanwhile.
+    """
+
+    def __init__(self):
+        self.file_id: Optional[Tuple[int, int]] = None
+        self.size = 0
+        self.columns = (array("q"), array("q"))
+        self.by_name: Dict[str, Tuple[array, array]] = {}
+
+    @staticmethod
+    def _insert(columns: Tuple[array, array], key: int, offset: int) -> None:
+        keys, offsets = columns
+        position = bisect_right(keys, key)
+        keys.insert(position, key)
+        offsets.insert(position, offset)
+
+    def refresh(self, fh: Optional[BinaryIO]) -> None:
+        if fh is None:
+            self.__init__()
+            return
+
+        st = os.fstat(fh.fileno())
+        file_id = (st.st_dev, st.st_ino)
+        if file_id != self.file_id or st.st_size < self.size:
+            self.__init__()
+            self.file_id = file_id
+
+        if st.st_size == self.size:
+            return
+
+        fh.seek(self.size)
+        offset = self.size
+        for line in fh:
+            if not line.endswith(b"\n"):
+                break
+            line_offset = offset
+            offset += len(line)
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(item, dict):
+                continue
+            key = timestamp_key(item.get("timestamp"))
+            self._insert(self.columns, key, line_offset)
+            name = item.get("name")
+            if isinstance(name, str):
+                columns = self.by_name.get(name)
+                if columns is None:
+                    columns = self.by_name[name] = (array("q"), array("q"))
+                self._insert(columns, key, line_offset)
+        self.size = offset
+
+    def rows(
+        self,
+        fh: BinaryIO,
+        *,
+        name: Optional[str],
+        start: Optional[str],
+        end: Optional[str],
+        cursor: Optional[str],
+    ) -> Iterator[Tuple[Tuple[int, int], Dict[str, Any]]]:
+        """Matching events newest first, as ``((timestamp key, offset), event)``."""
+
+        if name is not None:
+            keys, offsets = self.by_name.get(name, (array("q"), array("q")))
+        else:
+            keys, offsets = self.columns
+
+        lo = bisect_left(keys, timestamp_key(start)) if start is not None else 0
+        hi = bisect_right(keys, timestamp_key(end)) if end is not None else len(keys)
+        if cursor:
+            cursor_ts, cursor_offset, _ = decode_cursor(cursor)
+            cursor_key = timestamp_key(cursor_ts)
+            eq_lo, eq_hi = bisect_left(keys, cursor_key), bisect_right(keys, cursor_key)
+            hi = min(hi, bisect_left(offsets, cursor_offset, eq_lo, eq_hi))
+
+        # Copy the selected offsets so later refreshes cannot shift them under a
+        # lazily consumed result.
+        selected = offsets[lo:hi]
+        selected.reverse()
+        return (
+            ((timestamp_key(item.get("timestamp")), offset), item)
+            for offset, item in _read_lines_at(fh, selected)
+        )
+
+
+def _page(
+    rows: Iterator[Tuple[Tuple[int, int], Dict[str, Any]]],
+    limit: Optional[int],
+    log_id: Optional[int] = None,
+) -> Tuple[Iterable[Dict[str, Any]], Optional[str]]:
+    """First ``limit`` events of newest-first ``rows`` and the next page's cursor.
+
+    Rows without an event (``None``) only hold back a lazily read source
+    until the merge reaches it, and are skipped.
+    """
+
+    if limit is None:
+        return (item for _, item in rows if item is not None), None
+
+    entries: List[Dict[str, Any]] = []
+    next_cursor = None
+    last_position = 0
+    try:
+        for (_, position), item in rows:
+            if item is None:
+                continue
+            if len(entries) >= limit:
+                next_cursor = encode_cursor(
+                    str(entries[-1].get("timestamp")), last_position, log_id
+                )
+                break
+            entries.append(item)
+            last_position = position
+    finally:
+        rows.close()
+
+    return entries, next_cursor
+
+
+def _read_lines_at(fh: BinaryIO, offsets: Iterable[int]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    with fh:
+        for offset in offsets:
+            fh.seek(offset)
+            try:
+                item = json.loads(fh.readline())
+            except ValueError:
+                continue
+            if isinstance(item, dict):
+                yield offset, item
+
+
+def _encode_entry(entry: Dict[str, Any]) -> bytes:
+    return (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _is_legacy_array(path: str) -> bool:
+    """Return True when ``path`` holds the pre-JSONL ``[...]`` history format."""
+
+    try:
+        with open(path, "rb") as fh:
+            while True:
+                chunk = fh.read(_PEEK_SIZE)
+                if not chunk:
+                    return False
+                stripped = chunk.lstrip()
+                if stripped:
+                    return stripped.startswith(b"[")
+    except OSError:
+        return False
+
+
+@contextmanager
+def history_lock(path: str = HISTORY_LOG_PATH):
+    """Serialize writers of the history log.
+
+    The lock lives in a sidecar file so that the history itself can be
+    atomically replaced (migration) without stranding writers that are
+    waiting on the old inode.
+    """
+
+    target_path = os.path.abspath(path)
+    directory = os.path.dirname(target_path)
+    os.makedirs(directory, exist_ok=True)
+
+    with open(f"{target_path}.lock", "w") as lock_file:
+        with span("history.lock.wait"):
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _migrate_locked(target_path: str) -> bool:
+    if not _is_legacy_array(target_path):
+        return False
+
+    try:
+        with open(target_path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, json.JSONDecodeError):
+        logger.exception("Failed to read legacy history %s, starting a new log", target_path)
+        data = []
+
+    if not isinstance(data, list):
+        data = []
+
+    directory = os.path.dirname(target_path)
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as tmp_file:
+        for item in data:
+            if isinstance(item, dict):
+                tmp_file.write(_encode_entry(item))
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+
+    os.replace(tmp_file.name, target_path)
+    logger.info("Migrated %d history entries in %s to JSON Lines", len(data), target_path)
+    return True
+
+
+def migrate_legacy_history(path: str = HISTORY_LOG_PATH) -> bool:
+    """Convert a legacy JSON array history file to JSON Lines in place.
+
+    Returns True when a migration took place. Safe to call repeatedly.
+    """
+
+    target_path = os.path.abspath(path)
+    if not os.path.exists(target_path):
+        return False
+
+    with history_lock(target_path):
+        return _migrate_locked(target_path)
+
+
+def _append_locked(target_path: str, payload: bytes) -> os.stat_result:
+    fd = os.open(target_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, payload)
+        with span("history.fsync"):
+            os.fsync(fd)
+        return os.fstat(fd)
+    finally:
+        os.close(fd)
+
+
+def append_history_entry(entry: Dict[str, Any], path: str = HISTORY_LOG_PATH) -> None:
+    """Durably append one history event."""
+
+    target_path = os.path.abspath(path)
+    payload = _encode_entry(entry)
+
+    with history_lock(target_path):
+        _migrate_locked(target_path)
+        _append_locked(target_path, payload)
+
+
+def iter_history_entries(path: str = HISTORY_LOG_PATH) -> Iterator[Dict[str, Any]]:
+    """Stream raw history events in the order they were recorded.
+
+    Lines that cannot be decoded are skipped, as is a trailing line without a
+    newline (a write still in progress). Legacy array files are still readable
+    so that readers keep working until the collector has migrated the log.
+    """
+
+    target_path = os.path.abspath(path)
+    if not os.path.exists(target_path):
+        return
+
+    if _is_legacy_array(target_path):
+        try:
+            with open(target_path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, json.JSONDecodeError):
+            return
+        if isinstance(data, list):
+            for item in data:
+                if isinstance(item, dict):
+                    yield item
+        return
+
+    with open(target_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.endswith("\n"):
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(item, dict):
+                yield item
+
+
+def _aggregates_from_data(data: Any) -> Optional[Dict[str, Any]]:
+    if not isinstance(data, dict) or not isinstance(data.get("clients"), dict):
+        return None
+    history = data.get("history")
+    if not isinstance(history, list) or len(history) != 2:
+        return None
+    if not all(isinstance(value, int) for value in history):
+        return None
+    return data
+
+
+def _tail_closed_sessions(path: str, size: int = _RECENT_CLOSED_BYTES) -> List[str]:
+    """Session ids of the disconnect events in the last ``size`` bytes of the log."""
+
+    try:
+        fh = open(path, "rb")
+    except OSError:
+        return []
+
+    session_ids = []
+    with fh:
+        start = max(os.fstat(fh.fileno()).st_size - size, 0)
+        fh.seek(start)
+        if start:
+            fh.readline()  # Partial line.
+        for line in fh:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(item, dict) and item.get("session_end") and item.get("session_id"):
+                session_ids.append(str(item["session_id"]))
+    return session_ids
+
+
+class JsonLinesHistoryStore:
+    """History backend writing to an append-only JSON Lines file.
+
+    Per-client totals are materialized in a small JSON sidecar that is
+    rewritten when a session closes. The sidecar records the (inode, offset)
+    of the log it describes; readers add the events appended after that
+    offset, so connect events need no sidecar write and a sidecar that lags
+    behind after a crash is caught up rather than trusted blindly (it is not
+    fsynced for that reason). If the log was replaced behind the store's
+    back the totals are recomputed from it.
+
+    A disconnect of a session the store already recorded (the collector
+    restarted between writing the event and saving its sessions) is dropped,
+    as SQLite's ``UNIQUE (session_id, closed)`` does. The store remembers the
+    last ``_RECENT_CLOSED_SESSIONS`` closed ids, starting from the end of
+    the log.
+
+    Events moved to the archive by :meth:`compact` stay visible to
+    :meth:`iter_entries`, :meth:`query` and the totals.
+    """
+
+    backend = "jsonl"
+
+    def __init__(
+        self,
+        path: str = HISTORY_LOG_PATH,
+        aggregates_path: Optional[str] = HISTORY_AGGREGATES_PATH,
+        archive_dir: Optional[str] = HISTORY_ARCHIVE_DIR,
+    ):
+        self.path = os.path.abspath(path)
+        self.aggregates_path = os.path.abspath(aggregates_path) if aggregates_path else None
+        self.archive = HistoryArchive(archive_dir) if archive_dir else None
+        self._index = _TimestampIndex()
+        self._index_lock = threading.Lock()
+        # Recently closed session ids, oldest first; loaded on the first append.
+        self._closed_sessions: Optional[Dict[str, None]] = None
+
+    def _read_aggregates(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Current totals: the sidecar plus the events appended after it.
+
+        Returns None when there is no sidecar or it describes another log.
+        """
+
+        if not self.aggregates_path:
+            return None
+
+        data = load_cached_json(self.aggregates_path, _aggregates_from_data)
+        if data is None:
+            return None
+        inode, offset = data["history"]
+
+        try:
+            fh = open(self.path, "rb")
+        except OSError:
+            return None
+
+        with fh:
+            st = os.fstat(fh.fileno())
+            if st.st_ino != inode or st.st_size < offset:
+                return None
+            totals = {name: dict(info) for name, info in data["clients"].items()}
+            closed_sessions: Set[str] = set()
+            fh.seek(offset)
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                entry = normalize_history_entry(item) if isinstance(item, dict) else None
+                if entry:
+                    _add_entry(totals, closed_sessions, entry)
+        return totals
+
+    def _write_aggregates(self, totals: Dict[str, Dict[str, Any]], history: os.stat_result) -> None:
+        payload = {"history": [history.st_ino, history.st_size], "clients": totals}
+        with span("history.aggregates.dump"):
+            atomic_write_json(self.aggregates_path, payload, build=_aggregates_from_data)
+
+    def _remember_closed(self, session_id: str) -> bool:
+        """Record a closed session; False if it was closed already."""
+
+        closed = self._closed_sessions
+        if closed is None:
+            closed = self._closed_sessions = dict.fromkeys(_tail_closed_sessions(self.path))
+        if session_id in closed:
+            return False
+        closed[session_id] = None
+        while len(closed) > _RECENT_CLOSED_SESSIONS:
+            del closed[next(iter(closed))]
+        return True
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        payload = _encode_entry(entry)
+        normalized = normalize_history_entry(entry)
+        closing = normalized is not None and normalized["session_end"] is not None
+
+        with history_lock(self.path):
+            _migrate_locked(self.path)
+
+            if closing and not self._remember_closed(normalized["session_id"]):
+                logger.info("Skipping repeated disconnect of session %s", normalized["session_id"])
+                return
+
+            totals = None
+            if closing and self.aggregates_path:
+                totals = self._read_aggregates()
+                if totals is None:
+                    totals = compute_client_totals(self.iter_entries())
+
+            history = _append_locked(self.path, payload)
+
+            if totals is not None:
+                _add_entry(totals, set(), normalized)
+                self._write_aggregates(totals, history)
+
+    def iter_entries(
+        self,
+        *,
+        name: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Events in recorded order: the overlapping archive segments, then the log."""
+
+        if self.archive is not None:
+            for segment in self.archive.segments(start, end):
+                for entry in self.archive.entries(segment):
+                    if _matches(entry, name, start, end):
+                        yield entry
+        for entry in iter_history_entries(self.path):
+            if _matches(entry, name, start, end):
+                yield entry
+
+    def _archived_rows(
+        self,
+        name: Optional[str],
+        start: Optional[str],
+        end: Optional[str],
+        cursor: Optional[str],
+    ) -> Iterator[Tuple[Tuple[int, int], Optional[Dict[str, Any]]]]:
+        """Matching archived events newest first, as ``((timestamp key, position), event)``.
+
+        Only the segments overlapping ``start``..``end`` (and older than the
+        cursor) are opened, each one only once the merge with the log reaches
+        the placeholder row carrying its newest possible key.
+        """
+
+        if self.archive is None:
+            return
+
+        cursor_key = None
+        if cursor:
+            cursor_ts, cursor_position, _ = decode_cursor(cursor)
+            cursor_key = (timestamp_key(cursor_ts), cursor_position)
+            if end is None or cursor_ts < end:
+                end = cursor_ts
+
+        for segment in reversed(self.archive.segments(start, end)):
+            year, month = segment["month"].split("-")
+            base = _ARCHIVE_POSITION_BASE + (int(year) * 12 + int(month)) * 2**32
+            yield (timestamp_key(segment["end"]), base + 2**32 - 1), None
+            rows = []
+            for line, entry in enumerate(self.archive.entries(segment)):
+                if not _matches(entry, name, start, end):
+                    continue
+                key = (timestamp_key(entry.get("timestamp")), base + line)
+                if cursor_key is None or key < cursor_key:
+                    rows.append((key, entry))
+            rows.reverse()
+            yield from rows
+
+    def iter_entries_since(self, mark: Any = None) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """Events recorded after ``mark`` as ``(mark, entry)`` pairs.
+
+        A mark is ``[inode, offset]`` of the end of the event's line; passing
+        the last one back resumes after it. A mark of another file (the log
+        was replaced) or past its end restarts from the beginning. Legacy
+        array files have no positions: every event is returned with ``None``.
+        Archived events are not returned; they were in the log for the whole
+        retention period.
+        """
+
+        if _is_legacy_array(self.path):
+            for entry in iter_history_entries(self.path):
+                yield None, entry
+            return
+
+        try:
+            fh = open(self.path, "rb")
+        except OSError:
+            return
+
+        with fh:
+            st = os.fstat(fh.fileno())
+            offset = 0
+            if (
+                isinstance(mark, list)
+                and len(mark) == 2
+                and mark[0] == st.st_ino
+                and isinstance(mark[1], int)
+                and 0 <= mark[1] <= st.st_size
+            ):
+                offset = mark[1]
+            fh.seek(offset)
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(item, dict):
+                    yield [st.st_ino, offset], item
+
+    def query(
+        self,
+        *,
+        name: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> Tuple[Iterable[Dict[str, Any]], Optional[str]]:
+        """Newest-first page of raw events plus the cursor of the next page.
+
+        Served from the timestamp index, so the latest ``limit`` events cost
+        ``limit`` seeks however long the history is; archive segments are
+        only decompressed once the page reaches back to them. Without
+        ``limit`` the events are returned as a lazy iterator.
+
+        Cursors name the log inode they were issued for: :meth:`compact`
+        moves events between the log and the archive, so a cursor from
+        before a compaction raises ``ValueError``.
+        """
+
+        if _is_legacy_array(self.path):
+            return _query_scan(
+                iter_history_entries(self.path),
+                name=name,
+                start=start,
+                end=end,
+                limit=limit,
+                cursor=cursor,
+            )
+
+        try:
+            fh: Optional[BinaryIO] = open(self.path, "rb")
+        except OSError:
+            fh = None
+
+        rows: Iterator = iter(())
+        try:
+            with self._index_lock:
+                self._index.refresh(fh)
+                log_id = self._index.file_id[1] if self._index.file_id else None
+                if cursor and decode_cursor(cursor)[2] != log_id:
+                    raise ValueError("stale cursor: the history was compacted")
+                if fh is not None:
+                    rows = self._index.rows(fh, name=name, start=start, end=end, cursor=cursor)
+        except BaseException:
+            if fh is not None:
+                fh.close()
+            raise
+
+        archived = self._archived_rows(name, start, end, cursor)
+        merged = heapq.merge(rows, archived, key=lambda row: row[0], reverse=True)
+        return _page(merged, limit, log_id)
+
+    def version(self) -> str:
+        """Opaque token that changes whenever the stored history changes."""
+
+        if self.archive is None:
+            return file_version(self.path)
+        return f"{file_version(self.path)}:{file_version(self.archive.manifest_path)}"
+
+    def compact(
+        self, retention_days: float = HISTORY_RETENTION_DAYS, now: Optional[datetime] = None
+    ) -> int:
+        """Move events older than ``retention_days`` into the archive.
+
+        Safe while the collector appends: the log is scanned and the archive
+        segments are written without the history lock, which is only held to
+        copy the events appended in the meantime and swap the files. The
+        manifest is published before the log is replaced, so a crash in
+        between leaves the events in both places and the next compaction
+        archives them again without duplicating them. Returns the number of
+        archived events.
+        """
+
+        if self.archive is None or retention_days <= 0:
+            return 0
+
+        now = now or datetime.now(LOCAL_TZ)
+        cutoff = (now - timedelta(days=retention_days)).strftime(_DATETIME_FORMAT)
+        migrate_legacy_history(self.path)
+        with self.archive.lock():
+            return self._compact_locked(cutoff)
+
+    def _compact_locked(self, cutoff: str) -> int:
+        try:
+            fh = open(self.path, "rb")
+        except OSError:
+            return 0
+
+        events: Dict[str, List[Tuple[str, bytes]]] = {}
+        # Events that stay hot go straight into the replacement log.
+        hot = tempfile.NamedTemporaryFile(
+            "wb", dir=os.path.dirname(self.path), prefix=".history-", delete=False
+        )
+        with fh, hot:
+            inode = os.fstat(fh.fileno()).st_ino
+            offset = 0
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    item = None
+                timestamp = item.get("timestamp") if isinstance(item, dict) else None
+                if is_valid_datetime(timestamp) and timestamp < cutoff:
+                    events.setdefault(timestamp[:7], []).append((timestamp, line))
+                else:
+                    hot.write(line)
+
+        if not events:
+            os.unlink(hot.name)
+            return 0
+
+        segments = self.archive.prepare(events)
+        published = False
+        try:
+            with history_lock(self.path):
+                try:
+                    st = os.stat(self.path)
+                except OSError:
+                    return 0
+                if st.st_ino != inode or st.st_size < offset:
+                    # Replaced or truncated meanwhile; try again next time.
+                    return 0
+
+                totals = self._read_aggregates()
+                with open(self.path, "rb") as src, open(hot.name, "ab") as dst:
+                    src.seek(offset)
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+
+                self.archive.publish(segments)
+                published = True
+                os.replace(hot.name, self.path)
+                # Archiving does not change the totals, only the log they describe.
+                if totals is not None:
+                    self._write_aggregates(totals, os.stat(self.path))
+        finally:
+            if not published:
+                self.archive.discard(segments)
+            if os.path.exists(hot.name):
+                os.unlink(hot.name)
+
+        archived = sum(len(lines) for lines in events.values())
+        logger.info("Archived %d history events older than %s", archived, cutoff)
+        return archived
+
+    def summarize_clients(self) -> Dict[str, Dict[str, Any]]:
+        """Per-client totals, read from the sidecar when it is current."""
+
+        totals = self._read_aggregates()
+        if totals is None:
+            return compute_client_totals(self.iter_entries())
+        return totals
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    closed INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    rx REAL,
+    tx REAL,
+    vpn_ip TEXT,
+    vpn_ipv4 TEXT,
+    vpn_ipv6 TEXT,
+    port TEXT,
+    session_end TEXT,
+    UNIQUE (session_id, closed)
+);
+CREATE INDEX IF NOT EXISTS idx_history_name ON history (name, timestamp);
+CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp);
+CREATE INDEX IF NOT EXISTS idx_history_session_id ON history (session_id);
+CREATE INDEX IF NOT EXISTS idx_history_session_end ON history (session_end);
+CREATE TABLE IF NOT EXISTS client_aggregates (
+    name TEXT PRIMARY KEY,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    total_rx_mb REAL NOT NULL DEFAULT 0,
+    total_tx_mb REAL NOT NULL DEFAULT 0,
+    total_duration_seconds INTEGER NOT NULL DEFAULT 0,
+    last_seen TEXT
+);
+"""
+
+_SQLITE_ADD_AGGREGATE = """
+INSERT INTO client_aggregates (
+    name, sessions, total_rx_mb, total_tx_mb, total_duration_seconds, last_seen
+) VALUES (
+    :name, :sessions, :total_rx_mb, :total_tx_mb, :total_duration_seconds, :last_seen
+)
+ON CONFLICT (name) DO UPDATE SET
+    sessions = sessions + excluded.sessions,
+    total_rx_mb = total_rx_mb + excluded.total_rx_mb,
+    total_tx_mb = total_tx_mb + excluded.total_tx_mb,
+    total_duration_seconds = total_duration_seconds + excluded.total_duration_seconds,
+    last_seen = CASE
+        WHEN last_seen IS NULL OR excluded.last_seen > last_seen THEN excluded.last_seen
+        ELSE last_seen
+    END
+"""
+
+_SQLITE_UPSERT = """
+INSERT INTO history (
+    session_id, closed, timestamp, name, ip, rx, tx,
+    vpn_ip, vpn_ipv4, vpn_ipv6, port, session_end
+) VALUES (
+    :session_id, :closed, :timestamp, :name, :ip, :rx, :tx,
+    :vpn_ip, :vpn_ipv4, :vpn_ipv6, :port, :session_end
+)
+ON CONFLICT (session_id, closed) DO UPDATE SET
+    timestamp = excluded.timestamp,
+    name = excluded.name,
+    ip = excluded.ip,
+    rx = excluded.rx,
+    tx = excluded.tx,
+    vpn_ip = excluded.vpn_ip,
+    vpn_ipv4 = excluded.vpn_ipv4,
+    vpn_ipv6 = excluded.vpn_ipv6,
+    port = excluded.port,
+    session_end = excluded.session_end
+"""
+
+
+def _sqlite_params(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not has_required_fields(entry):
+        return None
+
+    params = {field: entry.get(field) for field in _ENTRY_FIELDS}
+    for field in ("timestamp", "name", "ip", "session_id"):
+        params[field] = str(params[field])
+    if params["port"] is not None:
+        params["port"] = str(params["port"])
+    params["rx"] = _parse_optional_float(params["rx"])
+    params["tx"] = _parse_optional_float(params["tx"])
+    params["closed"] = 1 if params["session_end"] else 0
+    return params
+
+
+class SqliteHistoryStore:
+    """History backend storing events in an indexed SQLite table (WAL mode).
+
+    A connect event and the matching disconnect event of a session are kept
+    as two rows keyed by ``(session_id, closed)``; writing the same event
+    twice updates the existing row instead of duplicating it. Per-client
+    totals live in ``client_aggregates`` and are updated in the same
+    transaction as each newly recorded event. When the database is created
+    next to an existing JSON Lines history, that history is imported once.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = HISTORY_DB_PATH, import_from: Optional[str] = HISTORY_LOG_PATH):
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._import_from = import_from
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        self._local.conn = conn
+
+        with self._init_lock:
+            if not self._initialized:
+                self._initialize(conn)
+                self._initialized = True
+
+        return conn
+
+    def _initialize(self, conn: sqlite3.Connection) -> None:
+        conn.executescript(_SQLITE_SCHEMA)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            history_empty = conn.execute("SELECT 1 FROM history LIMIT 1").fetchone() is None
+            if history_empty and self._import_from and os.path.exists(self._import_from):
+                rows = filter(None, map(_sqlite_params, iter_history_entries(self._import_from)))
+                conn.executemany(_SQLITE_UPSERT, rows)
+                history_empty = False
+                logger.info("Imported %s into %s", self._import_from, self.path)
+
+            aggregates_empty = (
+                conn.execute("SELECT 1 FROM client_aggregates LIMIT 1").fetchone() is None
+            )
+            if aggregates_empty and not history_empty:
+                self._rebuild_aggregates(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _rebuild_aggregates(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM client_aggregates")
+        conn.execute("""
+            INSERT INTO client_aggregates (
+                name, sessions, total_rx_mb, total_tx_mb, total_duration_seconds, last_seen
+            )
+            SELECT
+                name,
+                COUNT(DISTINCT CASE WHEN session_end IS NOT NULL THEN session_id END),
+                COALESCE(SUM(rx), 0.0),
+                COALESCE(SUM(tx), 0.0),
+                COALESCE(SUM(CASE WHEN session_end >= timestamp
+                    THEN CAST(strftime('%s', session_end) AS INTEGER)
+                        - CAST(strftime('%s', timestamp) AS INTEGER) END), 0),
+                MAX(MAX(timestamp), COALESCE(MAX(session_end), ''))
+            FROM history
+            GROUP BY name
+            """)
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        params = _sqlite_params(entry)
+        if params is None:
+            logger.warning("Skipping incomplete history entry: %r", entry)
+            return
+
+        normalized = normalize_history_entry(params)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            exists = conn.execute(
+                "SELECT 1 FROM history WHERE session_id = ? AND closed = ?",
+                (params["session_id"], params["closed"]),
+            ).fetchone()
+            conn.execute(_SQLITE_UPSERT, params)
+            if not exists and normalized:
+                conn.execute(
+                    _SQLITE_ADD_AGGREGATE, {"name": normalized["name"], **_entry_totals(normalized)}
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def iter_entries(
+        self,
+        *,
+        name: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        clauses = []
+        params: Dict[str, Any] = {}
+        if name is not None:
+            clauses.append("name = :name")
+            params["name"] = name
+        if start is not None:
+            clauses.append("timestamp >= :start")
+            params["start"] = start
+        if end is not None:
+            clauses.append("timestamp <= :end")
+            params["end"] = end
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        columns = ", ".join(_ENTRY_FIELDS)
+        cursor = self._connect().execute(
+            f"SELECT {columns} FROM history {where} ORDER BY id", params
+        )
+        for row in cursor:
+            yield dict(row)
+
+    def iter_entries_since(self, mark: Any = None) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """Events stored after ``mark`` (a row id) as ``(mark, entry)`` pairs."""
+
+        last_id = mark if isinstance(mark, int) else 0
+        columns = ", ".join(_ENTRY_FIELDS)
+        cursor = self._connect().execute(
+            f"SELECT id, {columns} FROM history WHERE id > ? ORDER BY id", (last_id,)
+        )
+        for row in cursor:
+            yield row["id"], {field: row[field] for field in _ENTRY_FIELDS}
+
+    def query(
+        self,
+        *,
+        name: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> Tuple[Iterable[Dict[str, Any]], Optional[str]]:
+        """Newest-first page of events using the timestamp/name indexes.
+
+        Without ``limit`` the rows are streamed from the cursor lazily.
+        """
+
+        clauses = []
+        params: Dict[str, Any] = {}
+        if name is not None:
+            clauses.append("name = :name")
+            params["name"] = name
+        if start is not None:
+            clauses.append("timestamp >= :start")
+            params["start"] = start
+        if end is not None:
+            clauses.append("timestamp <= :end")
+            params["end"] = end
+        if cursor:
+            params["cursor_ts"], params["cursor_id"], _ = decode_cursor(cursor)
+            clauses.append(
+                "(timestamp < :cursor_ts OR (timestamp = :cursor_ts AND id < :cursor_id))"
+            )
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        limit_clause = ""
+        if limit is not None:
+            limit_clause = "LIMIT :limit"
+            params["limit"] = limit + 1
+
+        columns = ", ".join(_ENTRY_FIELDS)
+        cursor_rows = self._connect().execute(
+            f"SELECT id, {columns} FROM history {where} "
+            f"ORDER BY timestamp DESC, id DESC {limit_clause}",
+            params,
+        )
+        if limit is None:
+            return ({field: row[field] for field in _ENTRY_FIELDS} for row in cursor_rows), None
+
+        rows = cursor_rows.fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+
+        return [{field: row[field] for field in _ENTRY_FIELDS} for row in rows], next_cursor
+
+    def version(self) -> str:
+        """Opaque token that changes whenever the stored history changes.
+
+        In WAL mode every commit grows or rewrites ``-wal`` and checkpoints
+        rewrite the main file, so their stat data identifies the content
+        without opening a connection.
+        """
+
+        return f"{file_version(self.path)}:{file_version(self.path + '-wal')}"
+
+    def summarize_clients(self) -> Dict[str, Dict[str, Any]]:
+        """Per-client totals read from the materialized ``client_aggregates``."""
+
+        cursor = self._connect().execute("""
+            SELECT name, sessions, total_rx_mb, total_tx_mb, total_duration_seconds, last_seen
+            FROM client_aggregates
+            """)
+
+        totals: Dict[str, Dict[str, Any]] = {}
+        for name, sessions, rx, tx, duration, last_seen in cursor:
+            totals[name] = {
+                "sessions": sessions,
+                "total_rx_mb": rx,
+                "total_tx_mb": tx,
+                "total_duration_seconds": duration,
+                "last_seen": last_seen or None,
+            }
+        return totals
+
+
+_stores: Dict[str, Any] = {}
+_stores_lock = threading.Lock()
+
+
+def get_history_store(backend: str = HISTORY_BACKEND):
+    """Return the process-wide history store for the configured backend."""
+
+    with _stores_lock:
+        store = _stores.get(backend)
+        if store is None:
+            if backend == "sqlite":
+                store = SqliteHistoryStore()
+            else:
+                if backend != "jsonl":
+                    logger.warning("Unknown history backend %r, using jsonl", backend)
+                store = JsonLinesHistoryStore()
+            _stores[backend] = store
+        return store
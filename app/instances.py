@@ -0,0 +1,69 @@
+"""OpenVPN instances monitored by one deployment.
+
+``OPENVPN_INSTANCES`` lists named status files, e.g.
+``udp=/var/log/openvpn/udp-status.log;tcp=/var/log/openvpn/tcp-status.log``.
+Each instance keeps its own active-session state next to
+``ACTIVE_SESSIONS_PATH`` (``active_sessions.udp.json``, ...), and the client
+rows it produces carry an ``instance`` field. Without the variable the single
+``STATUS_LOG_PATH``/``ACTIVE_SESSIONS_PATH`` pair is used as an unnamed
+instance and rows are left untagged.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Tuple
+
+from .config import ACTIVE_SESSIONS_PATH, INSTANCES, STATUS_LOG_PATH
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+@dataclass(frozen=True)
+class StatusInstance:
+    """One OpenVPN instance: its status file and its session state file."""
+
+    name: str
+    status_path: str
+    sessions_path: str
+
+
+def _sessions_path_for(name: str, sessions_path: str) -> str:
+    stem, ext = os.path.splitext(sessions_path)
+    return f"{stem}.{name}{ext or '.json'}"
+
+
+def parse_instances(
+    spec: str = INSTANCES,
+    status_path: str = STATUS_LOG_PATH,
+    sessions_path: str = ACTIVE_SESSIONS_PATH,
+) -> Tuple[StatusInstance, ...]:
+    """Parse an ``OPENVPN_INSTANCES`` value.
+
+    Raises ``ValueError`` for malformed entries or duplicate names.
+    """
+
+    entries = [item.strip() for item in re.split(r"[;\n]", spec or "") if item.strip()]
+    if not entries:
+        return (StatusInstance("", status_path, sessions_path),)
+
+    instances = []
+    seen = set()
+    for item in entries:
+        name, sep, path = item.partition("=")
+        name, path = name.strip(), path.strip()
+        if not sep or not path or not _NAME_RE.match(name):
+            raise ValueError(f"Invalid OPENVPN_INSTANCES entry: {item!r}")
+        if name in seen:
+            raise ValueError(f"Duplicate OpenVPN instance name: {name!r}")
+        seen.add(name)
+        instances.append(
+            StatusInstance(
+                name,
+                os.path.expanduser(path),
+                _sessions_path_for(name, sessions_path),
+            )
+        )
+    return tuple(instances)
@@ -0,0 +1,310 @@
+"""OpenVPN management interface as a real-time source of client sessions.
+
+Instead of waiting for the next ``status.log`` flush the collector can keep a
+connection to the management socket (``--management``), take a ``status 3``
+reply as the baseline and then follow the push notifications:
+
+* ``>CLIENT:ESTABLISHED`` opens a session (``>CLIENT:CONNECT`` is approved
+  when configured, see below),
+* ``>CLIENT:DISCONNECT`` closes it with the final byte counters,
+* ``>BYTECOUNT_CLI`` updates the counters every ``bytecount`` seconds.
+
+Every batch of notifications is fed through the same
+:func:`~app.parser.apply_client_records` bookkeeping the status file parser
+uses, so active sessions and history look exactly the same either way.
+
+OpenVPN only emits ``>CLIENT:`` notifications with ``--management-client-auth``,
+which also makes it wait for a ``client-auth`` verdict on every connection.
+The collector answers ``client-auth-nt`` when ``OPENVPN_MANAGEMENT_CLIENT_AUTH``
+is enabled; without it sessions are still tracked from the periodic
+``status 3`` resync and the byte counters from ``>BYTECOUNT_CLI``.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import select
+import socket
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .parser import (
+    _add_vpn_route,
+    _client_record,
+    active_sessions_lock,
+    apply_client_records,
+    parse_status_rows,
+)
+from .timeutil import local_time
+
+logger = logging.getLogger(__name__)
+
+_READ_SIZE = 64 * 1024
+
+
+class ManagementError(Exception):
+    """The management interface rejected a command or closed the connection."""
+
+
+def parse_management_address(address: str) -> Tuple[int, Any]:
+    """Turn ``host:port``, ``unix:/path`` or ``/path`` into a socket address."""
+
+    value = address.strip()
+    if value.startswith("unix:"):
+        return socket.AF_UNIX, value[len("unix:") :]
+    if value.startswith("/"):
+        return socket.AF_UNIX, value
+
+    host, sep, port = value.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"Invalid management address: {address!r}")
+    host = host.strip("[]") or "127.0.0.1"
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    return family, (host, int(port))
+
+
+class ManagementClient:
+    """Line-oriented connection to the OpenVPN management interface.
+
+    Notifications (lines starting with ``>``) that arrive while a command is
+    waiting for its reply are queued and handed out by :meth:`read_events`.
+    """
+
+    def __init__(self, address: str, password: Optional[str] = None, timeout: float = 10.0):
+        self.address = address
+        self.password = password
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._buffer = b""
+        self._events: Deque[str] = deque()
+
+    def connect(self) -> "ManagementClient":
+        family, target = parse_management_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+
+        if self.password is not None:
+            # The password prompt is not newline-terminated.
+            prompt = self._sock.recv(_READ_SIZE)
+            if b"PASSWORD" not in prompt:
+                self._buffer += prompt
+            self._send(self.password)
+            reply = self._read_reply()
+            if not reply or not reply[-1].startswith("SUCCESS:"):
+                raise ManagementError("Management password rejected")
+        return self
+
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+
+    def __enter__(self) -> "ManagementClient":
+        return self.connect()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _send(self, line: str) -> None:
+        self._sock.sendall(line.encode("utf-8") + b"\n")
+
+    def _fill(self) -> None:
+        chunk = self._sock.recv(_READ_SIZE)
+        if not chunk:
+            raise ManagementError("Management interface closed the connection")
+        self._buffer += chunk
+
+    def _readline(self) -> str:
+        while b"\n" not in self._buffer:
+            self._fill()
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode("utf-8", "replace").rstrip("\r")
+
+    def _read_reply(self, multiline: bool = False) -> List[str]:
+        lines = []
+        while True:
+            line = self._readline()
+            if line.startswith(">"):
+                self._events.append(line)
+                continue
+            if multiline:
+                if line == "END":
+                    return lines
+                if line.startswith("ERROR:"):
+                    raise ManagementError(line)
+                lines.append(line)
+                continue
+            if line.startswith("ERROR:"):
+                raise ManagementError(line)
+            if line.startswith("SUCCESS:"):
+                return [line]
+            # Stray banner or prompt text; keep waiting for the verdict.
+            lines.append(line)
+
+    def command(self, command: str) -> List[str]:
+        """Run a command answered with ``SUCCESS:``/``ERROR:``."""
+
+        self._send(command)
+        return self._read_reply()
+
+    def status(self) -> List[str]:
+        """Return the rows of a ``status 3`` reply."""
+
+        self._send("status 3")
+        return self._read_reply(multiline=True)
+
+    def read_events(self, timeout: float) -> List[str]:
+        """Return queued and newly arrived notifications.
+
+        Waits up to ``timeout`` seconds for the first one, then drains
+        everything that is already buffered without blocking again.
+        """
+
+        if not self._events and b"\n" not in self._buffer:
+            ready, _, _ = select.select([self._sock], [], [], max(timeout, 0))
+            if not ready:
+                return []
+            self._fill()
+
+        while True:
+            while b"\n" in self._buffer:
+                line = self._readline()
+                if line.startswith(">"):
+                    self._events.append(line)
+            ready, _, _ = select.select([self._sock], [], [], 0)
+            if not ready:
+                break
+            self._fill()
+
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+
+class ManagementSessionSource:
+    """Client state maintained from ``status 3`` and push notifications."""
+
+    def __init__(self, history_store=None):
+        self.history_store = history_store
+        # Connected clients by management client id.
+        self.clients: Dict[str, Dict[str, Any]] = {}
+        self.vpn_ip_map: Dict[str, Dict[str, Optional[str]]] = {}
+        self._final_counters: Dict[str, Tuple[int, int]] = {}
+        self._pending: Optional[Tuple[str, str, Dict[str, str]]] = None
+        # (client id, key id) of CONNECT/REAUTH requests awaiting a verdict.
+        self.auth_requests: List[Tuple[str, str]] = []
+
+    def load_status(self, lines: List[str]) -> None:
+        """Replace the client state with a ``status 3`` reply."""
+
+        records, vpn_ip_map = parse_status_rows(lines)
+        self.clients = {
+            record.get("client_id") or record["common_name"]: record for record in records
+        }
+        self.vpn_ip_map = vpn_ip_map
+
+    def handle_event(self, line: str, now: datetime.datetime) -> None:
+        """Apply one ``>...`` notification line."""
+
+        kind, _, payload = line[1:].partition(":")
+
+        if kind == "BYTECOUNT_CLI":
+            parts = payload.split(",")
+            record = self.clients.get(parts[0])
+            if record is not None and len(parts) >= 3:
+                try:
+                    record["bytes_received"] = int(parts[1])
+                    record["bytes_sent"] = int(parts[2])
+                except ValueError:
+                    pass
+            return
+
+        if kind != "CLIENT":
+            return
+
+        action, _, args = payload.partition(",")
+        if action == "ENV":
+            if self._pending is None:
+                return
+            if args == "END":
+                event, client_id, env = self._pending
+                self._pending = None
+                self._finish_event(event, client_id, env, now)
+            else:
+                name, _, value = args.partition("=")
+                self._pending[2][name] = value
+            return
+
+        if action in {"CONNECT", "REAUTH", "ESTABLISHED", "DISCONNECT"}:
+            ids = args.split(",")
+            if action in {"CONNECT", "REAUTH"} and len(ids) >= 2:
+                self.auth_requests.append((ids[0], ids[1]))
+            self._pending = (action, ids[0], {})
+
+    def _finish_event(
+        self, event: str, client_id: str, env: Dict[str, str], now: datetime.datetime
+    ) -> None:
+        common_name = env.get("common_name") or env.get("username") or ""
+
+        if event == "DISCONNECT":
+            record = self.clients.pop(client_id, None)
+            common_name = common_name or (record or {}).get("common_name", "")
+            try:
+                self._final_counters[common_name] = (
+                    int(env["bytes_received"]),
+                    int(env["bytes_sent"]),
+                )
+            except (KeyError, ValueError):
+                pass
+            if not any(c["common_name"] == common_name for c in self.clients.values()):
+                self.vpn_ip_map.pop(common_name, None)
+            return
+
+        # CONNECT/REAUTH only ask for a verdict; the session starts once the
+        # client is ESTABLISHED and has its pool address.
+        if event != "ESTABLISHED" or not common_name or client_id in self.clients:
+            return
+
+        try:
+            connected_epoch = int(env["time_unix"])
+        except (KeyError, ValueError):
+            connected_epoch = int(now.timestamp())
+
+        ip = env.get("trusted_ip") or env.get("trusted_ip6") or env.get("untrusted_ip") or ""
+        port = env.get("trusted_port") or env.get("untrusted_port") or ""
+        real_address = f"[{ip}]:{port}" if ":" in ip and port else (f"{ip}:{port}" if port else ip)
+
+        record = _client_record(common_name, real_address, 0, 0, local_time(connected_epoch))
+        record["client_id"] = client_id
+        self.clients[client_id] = record
+
+        for key in ("ifconfig_pool_remote_ip", "ifconfig_pool_remote_ip6"):
+            if env.get(key):
+                _add_vpn_route(self.vpn_ip_map, common_name, env[key])
+
+    def apply(self, now: datetime.datetime) -> List[Dict[str, Any]]:
+        """Run the session bookkeeping for the current state.
+
+        Returns the client rows to publish.
+        """
+
+        with active_sessions_lock():
+            clients = apply_client_records(
+                list(self.clients.values()),
+                self.vpn_ip_map,
+                now,
+                self.history_store,
+                final_counters=self._final_counters,
+            )
+        self._final_counters = {}
+        return clients
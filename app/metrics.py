@@ -0,0 +1,236 @@
+"""Collector statistics and the Prometheus text exposition of ``/metrics``.
+
+The collector counts opened and closed sessions and observes how long each
+status parse took and how old the status file was when it was read. After
+every cycle it publishes those numbers to ``COLLECTOR_METRICS_PATH`` next to
+the client snapshot; the web workers render ``/metrics`` from the two files
+and never parse anything themselves.
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import timing
+from .config import COLLECTOR_METRICS_PATH
+from .fileutil import atomic_write_json, load_cached_json, stat_key
+
+logger = logging.getLogger(__name__)
+
+PARSE_DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATUS_AGE_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+_HISTOGRAM_BUCKETS = {
+    "parse_duration_seconds": PARSE_DURATION_BUCKETS,
+    "status_file_age_seconds": STATUS_AGE_BUCKETS,
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class CollectorMetrics:
+    """Counters and histograms of one collector process.
+
+    Safe to update from the collector's worker threads. Histograms are
+    labelled by instance name (empty for a single unnamed instance).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.sessions_opened = 0
+        self.sessions_closed = 0
+        # {histogram: {instance: {"buckets": [...], "sum": float, "count": int}}}
+        self._histograms: Dict[str, Dict[str, Dict[str, Any]]] = {
+            name: {} for name in _HISTOGRAM_BUCKETS
+        }
+
+    def record_sessions(self, opened: int = 0, closed: int = 0) -> None:
+        if not opened and not closed:
+            return
+        with self._lock:
+            self.sessions_opened += opened
+            self.sessions_closed += closed
+
+    def observe(self, histogram: str, value: float, instance: str = "") -> None:
+        bounds = _HISTOGRAM_BUCKETS[histogram]
+        with self._lock:
+            series = self._histograms[histogram].get(instance)
+            if series is None:
+                series = {"buckets": [0] * len(bounds), "sum": 0.0, "count": 0}
+                self._histograms[histogram][instance] = series
+            index = bisect.bisect_left(bounds, value)
+            if index < len(bounds):
+                series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "updated_at": time.time(),
+                "sessions_opened": self.sessions_opened,
+                "sessions_closed": self.sessions_closed,
+                "histograms": {
+                    name: {
+                        instance: {
+                            "buckets": list(series["buckets"]),
+                            "sum": series["sum"],
+                            "count": series["count"],
+                        }
+                        for instance, series in by_instance.items()
+                    }
+                    for name, by_instance in self._histograms.items()
+                },
+            }
+
+
+collector_metrics = CollectorMetrics()
+
+
+def publish_collector_metrics(
+    metrics: CollectorMetrics = collector_metrics, path: str = COLLECTOR_METRICS_PATH
+) -> None:
+    """Atomically write ``metrics`` for the web workers.
+
+    With timing instrumentation on, the collector's span statistics are
+    published too, under ``"timings"``.
+    """
+
+    payload = metrics.to_dict()
+    if timing.enabled():
+        payload["timings"] = timing.summary()
+    atomic_write_json(path, payload)
+
+
+def _metrics_from_data(data: Any) -> Dict[str, Any]:
+    return data if isinstance(data, dict) else {}
+
+
+def load_collector_metrics(path: str = COLLECTOR_METRICS_PATH) -> Dict[str, Any]:
+    """Return the last published collector metrics (empty when there are none).
+
+    Cached per process until the file's (inode, mtime_ns, size) changes.
+    """
+
+    return load_cached_json(path, _metrics_from_data)
+
+
+def collector_metrics_key(path: str = COLLECTOR_METRICS_PATH) -> Optional[Tuple[int, int, int]]:
+    """Version of the published collector metrics, for response caching."""
+
+    return stat_key(os.path.abspath(path))
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: Any) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value: Any) -> str:
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(int(value))
+
+
+def _header(lines: List[str], name: str, kind: str, help_text: str) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _histogram(lines: List[str], name: str, bounds, by_instance: Dict[str, Any]) -> None:
+    for instance in sorted(by_instance):
+        series = by_instance[instance]
+        counts = series.get("buckets")
+        if not isinstance(counts, list) or len(counts) != len(bounds):
+            # Written with other bucket bounds; wait for the next publication.
+            continue
+        cumulative = 0
+        for bound, count in zip(bounds, counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(instance=instance, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(instance=instance, le='+Inf')} {series['count']}")
+        lines.append(f"{name}_sum{_labels(instance=instance)} {_number(float(series['sum']))}")
+        lines.append(f"{name}_count{_labels(instance=instance)} {series['count']}")
+
+
+def render_metrics(clients: Iterable[Dict[str, Any]], collector: Dict[str, Any]) -> str:
+    """Prometheus text exposition of the snapshot ``clients`` and ``collector`` metrics."""
+
+    clients = list(clients)
+    lines: List[str] = []
+
+    connected: Dict[str, int] = {}
+    for client in clients:
+        instance = client.get("instance") or ""
+        connected[instance] = connected.get(instance, 0) + 1
+
+    _header(lines, "openvpn_connected_clients", "gauge", "Clients connected right now.")
+    for instance in sorted(connected) or [""]:
+        lines.append(
+            f"openvpn_connected_clients{_labels(instance=instance)} {connected.get(instance, 0)}"
+        )
+
+    for field, name, help_text in (
+        (
+            "bytes_received",
+            "openvpn_client_bytes_received_total",
+            "Bytes received from the client during its current session.",
+        ),
+        (
+            "bytes_sent",
+            "openvpn_client_bytes_sent_total",
+            "Bytes sent to the client during its current session.",
+        ),
+    ):
+        _header(lines, name, "counter", help_text)
+        for client in clients:
+            labels = _labels(
+                instance=client.get("instance") or "",
+                common_name=client.get("common_name") or "",
+            )
+            lines.append(f"{name}{labels} {_number(client.get(field) or 0)}")
+
+    if collector:
+        for key, help_text in (
+            ("sessions_opened", "Sessions opened since the collector started."),
+            ("sessions_closed", "Sessions closed since the collector started."),
+        ):
+            name = f"openvpn_{key}_total"
+            _header(lines, name, "counter", help_text)
+            lines.append(f"{name} {_number(collector.get(key) or 0)}")
+
+        histograms = collector.get("histograms") or {}
+        for key, help_text in (
+            ("parse_duration_seconds", "Time spent parsing a status file."),
+            ("status_file_age_seconds", "Age of the status file when it was parsed."),
+        ):
+            name = f"openvpn_{key}"
+            _header(lines, name, "histogram", help_text)
+            _histogram(lines, name, _HISTOGRAM_BUCKETS[key], histograms.get(key) or {})
+
+        _header(
+            lines,
+            "openvpn_collector_last_run_timestamp_seconds",
+            "gauge",
+            "When the collector last published its metrics.",
+        )
+        lines.append(
+            "openvpn_collector_last_run_timestamp_seconds "
+            f"{_number(float(collector.get('updated_at') or 0))}"
+        )
+
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,13 @@
 # parser.py
 import datetime
+import functools
+import hashlib
+import itertools
 import json
 import logging
 import os
 import tempfile
+import threading
 import uuid
 from contextlib import contextmanager
 from ipaddress import ip_address
@@ -11,17 +15,36 @@ from ipaddress import ip_address
 import fcntl
 from .config import (
     ACTIVE_SESSIONS_PATH,
-    HISTORY_LOG_PATH,
     LOCAL_TZ,
+    STATUS_LOG_HASH,
     STATUS_LOG_PATH,
 )
-
+from .history_store import get_history_store
+from .metrics import collector_metrics
+from .timeutil import local_epoch, local_time
+from .timing import span
 
 logger = logging.getLogger(__name__)
 
+# Last parse result per status file, keyed by absolute path:
+# {path: (fingerprint, clients)}.
+_parse_cache = {}
+_parse_cache_lock = threading.Lock()
+
 
 def format_duration(seconds):
-    return str(datetime.timedelta(seconds=seconds))
+    """Same text as ``str(timedelta(seconds=seconds))``, without the timedelta."""
+
+    if seconds < 0 or not isinstance(seconds, int):
+        return str(datetime.timedelta(seconds=seconds))
+
+    days, rest = divmod(seconds, 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+    clock = f"{hours}:{minutes:02d}:{secs:02d}"
+    if days:
+        return f"{days} day{'s' if days != 1 else ''}, {clock}"
+    return clock
 
 
 def validate_active_sessions(data):
@@ -58,7 +81,7 @@ def load_active_sessions(path: str = ACTIVE_SESSIONS_PATH):
 
     if os.path.exists(target_path):
         try:
-            with open(target_path, "r") as f:
+            with span("parser.sessions.load"), open(target_path, "r") as f:
                 data = json.load(f)
         except (json.JSONDecodeError, OSError):
             return {}
@@ -73,43 +96,15 @@ def save_active_sessions(sessions, path: str = ACTIVE_SESSIONS_PATH):
     os.makedirs(directory, exist_ok=True)
 
     with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as tmp_file:
-        json.dump(sessions, tmp_file)
-        tmp_file.flush()
-        os.fsync(tmp_file.fileno())
+        with span("parser.sessions.dump"):
+            json.dump(sessions, tmp_file)
+        with span("parser.sessions.fsync"):
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
 
     os.replace(tmp_file.name, target_path)
 
 
-@contextmanager
-def history_log(path: str = HISTORY_LOG_PATH):
-    target_path = os.path.abspath(path)
-    directory = os.path.dirname(target_path)
-    os.makedirs(directory, exist_ok=True)
-
-    with open(target_path, "a+") as logf:
-        fcntl.flock(logf, fcntl.LOCK_EX)
-        try:
-            logf.seek(0)
-            try:
-                entries = json.load(logf)
-            except (json.JSONDecodeError, OSError):
-                entries = []
-
-            if not isinstance(entries, list):
-                entries = []
-
-            yield entries
-
-            logf.seek(0)
-            logf.truncate()
-            json.dump(entries, logf, ensure_ascii=False, indent=2)
-            logf.write("\n")
-            logf.flush()
-            os.fsync(logf.fileno())
-        finally:
-            fcntl.flock(logf, fcntl.LOCK_UN)
-
-
 @contextmanager
 def active_sessions_lock(path: str = ACTIVE_SESSIONS_PATH):
     """Prevent concurrent modifications of the active sessions state."""
@@ -120,13 +115,42 @@ def active_sessions_lock(path: str = ACTIVE_SESSIONS_PATH):
 
     lock_path = f"{target_path}.lock"
     with open(lock_path, "w") as lock_file:
-        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        with span("parser.sessions_lock.wait"):
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
         try:
             yield
         finally:
             fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
+def _stat_fingerprint(fh):
+    st = os.fstat(fh.fileno())
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def status_fingerprint(fh, hash_content=None):
+    """Identify one version of an open status file.
+
+    Inode and device change when the file is rotated or replaced, size changes
+    on truncation and mtime_ns on any rewrite. The optional content hash
+    catches rewrites that keep size and mtime identical.
+    """
+
+    fingerprint = _stat_fingerprint(fh)
+    if hash_content is None:
+        hash_content = STATUS_LOG_HASH
+    if not hash_content:
+        return fingerprint
+
+    digest = hashlib.blake2b(digest_size=16)
+    raw = fh.buffer
+    for chunk in iter(lambda: raw.read(65536), b""):
+        digest.update(chunk)
+    fh.seek(0)
+    return fingerprint + (digest.hexdigest(),)
+
+
+@functools.lru_cache(maxsize=65536)
 def _split_real_address(address: str):
     if not address:
         return "", ""
@@ -154,222 +178,459 @@ def _split_real_address(address: str):
         return value, ""
 
 
-def parse_status_log(filepath=STATUS_LOG_PATH):
+def _add_vpn_route(vpn_ip_map, common_name, vpn_ip):
+    entry = vpn_ip_map.setdefault(common_name, {"ipv4": None, "ipv6": None})
+
+    try:
+        ip_obj = ip_address(vpn_ip)
+    except ValueError:
+        # Fallback to the previous behaviour – store the value in the
+        # first available slot so we don't lose potentially useful
+        # information even if it isn't a valid IP.
+        if entry["ipv4"] is None:
+            entry["ipv4"] = vpn_ip
+        elif entry["ipv6"] is None:
+            entry["ipv6"] = vpn_ip
+        return
+
+    if ip_obj.version == 4:
+        entry["ipv4"] = vpn_ip
+    else:
+        entry["ipv6"] = vpn_ip
+
+
+def _client_record(common_name, real_address, bytes_received, bytes_sent, connected_since):
+    """One client row as published in the snapshot.
+
+    Rows hold only what the status file reports, so a row changes only when
+    the client's counters or addresses do; ``time_online`` is derived from
+    ``connected_since`` when a response is built.
+    """
+
+    real_ip, port = _split_real_address(real_address)
+    return {
+        "common_name": common_name,
+        "real_ip": real_ip,
+        "port": port,
+        "bytes_received": bytes_received,
+        "bytes_sent": bytes_sent,
+        "connected_since": connected_since,
+    }
+
+
+def _header_index(header, *names):
+    for name in names:
+        if name in header:
+            return header.index(name)
+    return None
+
+
+def _client_list_columns(header):
+    """Row positions of the CLIENT_LIST fields we use, from its HEADER row.
+
+    Positions count the leading ``CLIENT_LIST`` token, so rows can be indexed
+    without slicing. Returns ``None`` if a mandatory column is missing.
+    """
+
+    columns = tuple(
+        None if index is None else index + 1
+        for index in (
+            _header_index(header, "Common Name"),
+            _header_index(header, "Real Address"),
+            _header_index(header, "Bytes Received"),
+            _header_index(header, "Bytes Sent"),
+            _header_index(header, "Connected Since (time_t)"),
+            _header_index(header, "Connected Since"),
+            _header_index(header, "Virtual Address"),
+            _header_index(header, "Virtual IPv6 Address"),
+            _header_index(header, "Client ID"),
+        )
+    )
+    if None in columns[:4] or (columns[4] is None and columns[5] is None):
+        return None
+    return columns
+
+
+def _connected_since_epoch(value):
+    try:
+        return local_epoch(value)
+    except ValueError:
+        pass
+    # Older releases print "Connected Since" in ctime() format.
+    try:
+        naive_dt = datetime.datetime.strptime(value, "%a %b %d %H:%M:%S %Y")
+    except ValueError:
+        return None
+    return int(LOCAL_TZ.localize(naive_dt).timestamp())
+
+
+def detect_status_format(first_line):
+    """Return the field separator of a status-version 2/3 file, or ``None`` for version 1."""
+
+    if first_line.startswith(("TITLE\t", "HEADER\t", "TIME\t", "CLIENT_LIST\t")):
+        return "\t"
+    if first_line.startswith(("TITLE,", "HEADER,", "TIME,", "CLIENT_LIST,")):
+        return ","
+    return None
+
+
+def parse_status_rows(lines, separator="\t"):
+    """Parse ``status-version`` 2/3 rows (also the ``status 3`` management reply).
+
+    Column positions are taken from the ``HEADER`` rows once, so fields added
+    by newer OpenVPN releases do not shift anything and each row costs one
+    ``split``. The epoch ``Connected Since (time_t)`` column is used directly
+    when present. Returns ``(client_records, vpn_ip_map)`` in the shape
+    :func:`apply_client_records` expects; each record also carries the
+    management ``client_id`` when it is reported.
+    """
+
+    client_records = []
+    vpn_ip_map = {}
+    client_columns = None
+    route_columns = None
+
+    for raw_line in lines:
+        line = raw_line.rstrip("\r\n")
+        if not line:
+            continue
+        parts = line.split(separator)
+        kind = parts[0]
+        width = len(parts)
+
+        if kind == "CLIENT_LIST":
+            if client_columns is None:
+                continue
+            name_i, real_i, rx_i, tx_i, epoch_i, since_i, vpn4_i, vpn6_i, cid_i = client_columns
+            if width <= max(name_i, real_i, rx_i, tx_i):
+                continue
+
+            try:
+                bytes_received = int(parts[rx_i])
+                bytes_sent = int(parts[tx_i])
+            except ValueError:
+                continue
+
+            epoch = parts[epoch_i] if epoch_i is not None and epoch_i < width else ""
+            if epoch.isdigit():
+                connected_epoch = int(epoch)
+            elif since_i is not None and since_i < width:
+                connected_epoch = _connected_since_epoch(parts[since_i])
+                if connected_epoch is None:
+                    continue
+            else:
+                continue
+
+            common_name = parts[name_i]
+            record = _client_record(
+                common_name,
+                parts[real_i],
+                bytes_received,
+                bytes_sent,
+                local_time(connected_epoch),
+            )
+            if cid_i is not None and cid_i < width and parts[cid_i]:
+                record["client_id"] = parts[cid_i]
+            client_records.append(record)
+
+            for index in (vpn4_i, vpn6_i):
+                if index is not None and index < width and parts[index]:
+                    _add_vpn_route(vpn_ip_map, common_name, parts[index])
+            continue
+
+        if kind == "ROUTING_TABLE":
+            if route_columns is None or width <= max(route_columns):
+                continue
+            vpn_i, name_i = route_columns
+            _add_vpn_route(vpn_ip_map, parts[name_i].strip(), parts[vpn_i].strip())
+            continue
+
+        if kind == "HEADER" and width > 2:
+            header = parts[2:]
+            if parts[1] == "CLIENT_LIST":
+                client_columns = _client_list_columns(header)
+            elif parts[1] == "ROUTING_TABLE":
+                vpn_i = _header_index(header, "Virtual Address")
+                name_i = _header_index(header, "Common Name")
+                route_columns = None if vpn_i is None or name_i is None else (vpn_i + 1, name_i + 1)
+
+    return client_records, vpn_ip_map
+
+
+def apply_client_records(
+    client_records,
+    vpn_ip_map,
+    now,
+    history_store=None,
+    final_counters=None,
+    sessions_path=ACTIVE_SESSIONS_PATH,
+):
+    """Reconcile the currently connected clients with the active session state.
+
+    New common names open a session and record a connect event, names that
+    are no longer present close theirs and record a disconnect event with the
+    last known byte counters (or the ones in ``final_counters``, keyed by
+    common name, when the source reported the totals at disconnect). The
+    caller must hold :func:`active_sessions_lock`. Returns the client rows
+    with their VPN addresses filled in.
+    """
+
+    if history_store is None:
+        history_store = get_history_store()
+    final_counters = final_counters or {}
+
     clients = []
     current_common_names = set()
-    vpn_ip_map = {}
     new_sessions = []
+    active_sessions = load_active_sessions(sessions_path)
+
+    for record in client_records:
+        common_name = record["common_name"]
+        real_ip = record["real_ip"]
+        port = record["port"]
+        bytes_received = record["bytes_received"]
+        bytes_sent = record["bytes_sent"]
+
+        current_common_names.add(common_name)
+
+        if common_name not in active_sessions:
+            session_id = str(uuid.uuid4())
+            active_sessions[common_name] = {
+                "ip": real_ip,
+                "vpn_ip": None,
+                "vpn_ipv4": None,
+                "vpn_ipv6": None,
+                "connected_at": record["connected_since"],
+                "bytes_received": bytes_received,
+                "bytes_sent": bytes_sent,
+                "port": port,
+                "session_id": session_id,
+            }
+            new_sessions.append(common_name)
+        else:
+            active_sessions[common_name]["bytes_received"] = bytes_received
+            active_sessions[common_name]["bytes_sent"] = bytes_sent
+            active_sessions[common_name]["ip"] = real_ip
+            active_sessions[common_name]["port"] = port
+
+    for record in client_records:
+        common_name = record["common_name"]
+        vpn_ip_entry = vpn_ip_map.get(common_name, {})
+        vpn_ipv4 = vpn_ip_entry.get("ipv4") if isinstance(vpn_ip_entry, dict) else None
+        vpn_ipv6 = vpn_ip_entry.get("ipv6") if isinstance(vpn_ip_entry, dict) else None
+
+        vpn_ip = vpn_ipv4 or vpn_ipv6
+
+        record = {key: value for key, value in record.items() if key != "client_id"}
+        record["vpn_ip"] = vpn_ip
+        record["vpn_ipv4"] = vpn_ipv4
+        record["vpn_ipv6"] = vpn_ipv6
+        clients.append(record)
+
+        if common_name in active_sessions:
+            active_sessions[common_name]["vpn_ip"] = vpn_ip
+            active_sessions[common_name]["vpn_ipv4"] = vpn_ipv4
+            active_sessions[common_name]["vpn_ipv6"] = vpn_ipv6
+
+    for common_name in new_sessions:
+        session = active_sessions.get(common_name)
+        if not session:
+            continue
+
+        vpn_ip_entry = vpn_ip_map.get(common_name)
+        if isinstance(vpn_ip_entry, dict):
+            vpn_ipv4 = vpn_ip_entry.get("ipv4") or ""
+            vpn_ipv6 = vpn_ip_entry.get("ipv6") or ""
+        else:
+            value = vpn_ip_entry or ""
+            vpn_ipv4 = value
+            vpn_ipv6 = ""
+            try:
+                if value:
+                    ip_obj = ip_address(value)
+                    if ip_obj.version == 6:
+                        vpn_ipv4, vpn_ipv6 = "", value
+            except ValueError:
+                pass
+        vpn_ip = vpn_ipv4 or vpn_ipv6 or ""
+        port = session.get("port") or ""
+
+        session["vpn_ip"] = vpn_ip or None
+        session["vpn_ipv4"] = vpn_ipv4 or None
+        session["vpn_ipv6"] = vpn_ipv6 or None
+
+        history_store.append(
+            {
+                "timestamp": session["connected_at"],
+                "name": common_name,
+                "ip": session.get("ip"),
+                "session_id": session["session_id"],
+                "rx": None,
+                "tx": None,
+                "vpn_ip": vpn_ip or None,
+                "vpn_ipv4": vpn_ipv4 or None,
+                "vpn_ipv6": vpn_ipv6 or None,
+                "port": port or None,
+                "session_end": None,
+            }
+        )
+
+    disconnected = [cn for cn in list(active_sessions) if cn not in current_common_names]
+    for cn in disconnected:
+        session = active_sessions[cn]
+        bytes_received, bytes_sent = final_counters.get(
+            cn, (session["bytes_received"], session["bytes_sent"])
+        )
+        rx = round(bytes_received / (1024 * 1024), 2)
+        tx = round(bytes_sent / (1024 * 1024), 2)
+        disconnect_time = now.strftime("%Y-%m-%d %H:%M:%S")
+        vpn_ip = session.get("vpn_ip") or ""
+        port = session.get("port") or ""
+        vpn_ipv4 = session.get("vpn_ipv4") or ""
+        vpn_ipv6 = session.get("vpn_ipv6") or ""
+
+        if not vpn_ipv4 and not vpn_ipv6 and vpn_ip:
+            try:
+                ip_obj = ip_address(vpn_ip)
+            except ValueError:
+                pass
+            else:
+                if ip_obj.version == 4:
+                    vpn_ipv4 = vpn_ip
+                else:
+                    vpn_ipv6 = vpn_ip
+
+        history_store.append(
+            {
+                "timestamp": session["connected_at"],
+                "name": cn,
+                "ip": session.get("ip"),
+                "session_id": session["session_id"],
+                "rx": rx,
+                "tx": tx,
+                "vpn_ip": vpn_ip or None,
+                "vpn_ipv4": vpn_ipv4 or None,
+                "vpn_ipv6": vpn_ipv6 or None,
+                "port": port or None,
+                "session_end": disconnect_time,
+            }
+        )
+
+        del active_sessions[cn]
+
+    save_active_sessions(active_sessions, sessions_path)
+    collector_metrics.record_sessions(opened=len(new_sessions), closed=len(disconnected))
+    return clients
+
+
+def _parse_status_v1(lines):
+    """Parse the default ``status-version 1`` layout."""
+
     client_records = []
+    vpn_ip_map = {}
+    section = None
 
-    try:
-        with active_sessions_lock():
-            active_sessions = load_active_sessions()
-            now = datetime.datetime.now(LOCAL_TZ)
+    for raw_line in lines:
+        line = raw_line.strip()
 
-            with open(filepath, "r") as f:
+        if raw_line.startswith(
+            "Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since"
+        ):
+            section = "clients"
+            continue
+
+        if raw_line.startswith("ROUTING TABLE"):
+            section = "routing"
+            continue
+
+        if raw_line.startswith("GLOBAL STATS"):
+            section = None
+            continue
+
+        if not line:
+            if section in {"clients", "routing"}:
                 section = None
+            continue
 
-                for raw_line in f:
-                    line = raw_line.strip()
-
-                    if raw_line.startswith(
-                        "Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since"
-                    ):
-                        section = "clients"
-                        continue
-
-                    if raw_line.startswith("ROUTING TABLE"):
-                        section = "routing"
-                        continue
-
-                    if raw_line.startswith("GLOBAL STATS"):
-                        section = None
-                        continue
-
-                    if not line:
-                        if section in {"clients", "routing"}:
-                            section = None
-                        continue
-
-                    if section == "routing":
-                        parts = line.split(",")
-                        if len(parts) >= 2:
-                            vpn_ip = parts[0].strip()
-                            common_name = parts[1].strip()
-
-                            entry = vpn_ip_map.setdefault(common_name, {"ipv4": None, "ipv6": None})
-
-                            try:
-                                ip_obj = ip_address(vpn_ip)
-                            except ValueError:
-                                # Fallback to the previous behaviour – store the value in the
-                                # first available slot so we don't lose potentially useful
-                                # information even if it isn't a valid IP.
-                                if entry["ipv4"] is None:
-                                    entry["ipv4"] = vpn_ip
-                                elif entry["ipv6"] is None:
-                                    entry["ipv6"] = vpn_ip
-                                continue
-
-                            if ip_obj.version == 4:
-                                entry["ipv4"] = vpn_ip
-                            else:
-                                entry["ipv6"] = vpn_ip
-                        continue
-
-                    if section == "clients":
-                        parts = line.split(",")
-                        if len(parts) < 5:
-                            continue
-
-                        common_name = parts[0]
-                        real_ip, port = _split_real_address(parts[1])
-                        bytes_received = int(parts[2])
-                        bytes_sent = int(parts[3])
-                        connected_since = parts[4]
-
-                        naive_dt = datetime.datetime.strptime(connected_since, "%Y-%m-%d %H:%M:%S")
-                        connected_dt = LOCAL_TZ.localize(naive_dt)
-                        time_online = format_duration(int((now - connected_dt).total_seconds()))
-
-                        client_records.append(
-                            {
-                                "common_name": common_name,
-                                "real_ip": real_ip,
-                                "port": port,
-                                "bytes_received": bytes_received,
-                                "bytes_sent": bytes_sent,
-                                "connected_since": connected_since,
-                                "time_online": time_online,
-                            }
-                        )
-
-                        current_common_names.add(common_name)
-
-                        if common_name not in active_sessions:
-                            session_id = str(uuid.uuid4())
-                            active_sessions[common_name] = {
-                                "ip": real_ip,
-                                "vpn_ip": None,
-                                "vpn_ipv4": None,
-                                "vpn_ipv6": None,
-                                "connected_at": connected_dt.strftime("%Y-%m-%d %H:%M:%S"),
-                                "bytes_received": bytes_received,
-                                "bytes_sent": bytes_sent,
-                                "port": port,
-                                "session_id": session_id,
-                            }
-                            new_sessions.append(common_name)
-                        else:
-                            active_sessions[common_name]["bytes_received"] = bytes_received
-                            active_sessions[common_name]["bytes_sent"] = bytes_sent
-                            active_sessions[common_name]["ip"] = real_ip
-                            active_sessions[common_name]["port"] = port
-
-            for record in client_records:
-                common_name = record["common_name"]
-                vpn_ip_entry = vpn_ip_map.get(common_name, {})
-                vpn_ipv4 = vpn_ip_entry.get("ipv4") if isinstance(vpn_ip_entry, dict) else None
-                vpn_ipv6 = vpn_ip_entry.get("ipv6") if isinstance(vpn_ip_entry, dict) else None
-
-                vpn_ip = vpn_ipv4 or vpn_ipv6
-
-                record["vpn_ip"] = vpn_ip
-                record["vpn_ipv4"] = vpn_ipv4
-                record["vpn_ipv6"] = vpn_ipv6
-                clients.append(record)
-
-                if common_name in active_sessions:
-                    active_sessions[common_name]["vpn_ip"] = vpn_ip
-                    active_sessions[common_name]["vpn_ipv4"] = vpn_ipv4
-                    active_sessions[common_name]["vpn_ipv6"] = vpn_ipv6
-
-            for common_name in new_sessions:
-                session = active_sessions.get(common_name)
-                if not session:
-                    continue
+        if section == "routing":
+            parts = line.split(",")
+            if len(parts) >= 2:
+                _add_vpn_route(vpn_ip_map, parts[1].strip(), parts[0].strip())
+            continue
 
-                vpn_ip_entry = vpn_ip_map.get(common_name)
-                if isinstance(vpn_ip_entry, dict):
-                    vpn_ipv4 = vpn_ip_entry.get("ipv4") or ""
-                    vpn_ipv6 = vpn_ip_entry.get("ipv6") or ""
-                else:
-                    value = vpn_ip_entry or ""
-                    vpn_ipv4 = value
-                    vpn_ipv6 = ""
-                    try:
-                        if value:
-                            ip_obj = ip_address(value)
-                            if ip_obj.version == 6:
-                                vpn_ipv4, vpn_ipv6 = "", value
-                    except ValueError:
-                        pass
-                vpn_ip = vpn_ipv4 or vpn_ipv6 or ""
-                port = session.get("port") or ""
-
-                session["vpn_ip"] = vpn_ip or None
-                session["vpn_ipv4"] = vpn_ipv4 or None
-                session["vpn_ipv6"] = vpn_ipv6 or None
-
-                with history_log() as entries:
-                    entries.append(
-                        {
-                            "timestamp": session["connected_at"],
-                            "name": common_name,
-                            "ip": session.get("ip"),
-                            "session_id": session["session_id"],
-                            "rx": None,
-                            "tx": None,
-                            "vpn_ip": vpn_ip or None,
-                            "vpn_ipv4": vpn_ipv4 or None,
-                            "vpn_ipv6": vpn_ipv6 or None,
-                            "port": port or None,
-                            "session_end": None,
-                        }
-                    )
-
-            disconnected = [cn for cn in list(active_sessions) if cn not in current_common_names]
-            for cn in disconnected:
-                session = active_sessions[cn]
-                rx = round(session["bytes_received"] / (1024 * 1024), 2)
-                tx = round(session["bytes_sent"] / (1024 * 1024), 2)
-                disconnect_time = now.strftime("%Y-%m-%d %H:%M:%S")
-                vpn_ip = session.get("vpn_ip") or ""
-                port = session.get("port") or ""
-                vpn_ipv4 = session.get("vpn_ipv4") or ""
-                vpn_ipv6 = session.get("vpn_ipv6") or ""
-
-                if not vpn_ipv4 and not vpn_ipv6 and vpn_ip:
-                    try:
-                        ip_obj = ip_address(vpn_ip)
-                    except ValueError:
-                        pass
+        if section == "clients":
+            parts = line.split(",")
+            if len(parts) < 5:
+                continue
+
+            bytes_received = int(parts[2])
+            bytes_sent = int(parts[3])
+            connected_since = parts[4]
+            # Malformed timestamps fail the parse here rather than in a response.
+            local_epoch(connected_since)
+            client_records.append(
+                _client_record(
+                    parts[0],
+                    parts[1],
+                    bytes_received,
+                    bytes_sent,
+                    connected_since,
+                )
+            )
+
+    return client_records, vpn_ip_map
+
+
+def parse_status_log(filepath=STATUS_LOG_PATH, sessions_path=ACTIVE_SESSIONS_PATH):
+    """Parse a status file of any ``status-version`` and update session state.
+
+    The layout is detected from the first line: ``TITLE``/``HEADER`` rows mean
+    version 2 (comma separated) or 3 (tab separated), anything else is
+    version 1. ``sessions_path`` holds the active sessions of the instance
+    that wrote ``filepath``.
+    """
+
+    clients = []
+
+    cache_key = os.path.abspath(filepath)
+    fingerprint = None
+
+    try:
+        history_store = get_history_store()
+        with active_sessions_lock(sessions_path):
+            with open(filepath, "r") as f:
+                fingerprint = status_fingerprint(f)
+                with _parse_cache_lock:
+                    cached = _parse_cache.get(cache_key)
+                if cached is not None and cached[0] == fingerprint:
+                    # Nothing changed since the last parse: skip state and history writes.
+                    return [dict(client) for client in cached[1]]
+
+                now = datetime.datetime.now(LOCAL_TZ)
+
+                with span("parser.parse"):
+                    first_line = f.readline()
+                    separator = detect_status_format(first_line)
+                    lines = itertools.chain((first_line,), f)
+                    if separator is None:
+                        client_records, vpn_ip_map = _parse_status_v1(lines)
                     else:
-                        if ip_obj.version == 4:
-                            vpn_ipv4 = vpn_ip
-                        else:
-                            vpn_ipv6 = vpn_ip
-
-                with history_log() as entries:
-                    entries.append(
-                        {
-                            "timestamp": session["connected_at"],
-                            "name": cn,
-                            "ip": session.get("ip"),
-                            "session_id": session["session_id"],
-                            "rx": rx,
-                            "tx": tx,
-                            "vpn_ip": vpn_ip or None,
-                            "vpn_ipv4": vpn_ipv4 or None,
-                            "vpn_ipv6": vpn_ipv6 or None,
-                            "port": port or None,
-                            "session_end": disconnect_time,
-                        }
-                    )
-
-                del active_sessions[cn]
-
-            save_active_sessions(active_sessions)
+                        client_records, vpn_ip_map = parse_status_rows(lines, separator)
+
+                if _stat_fingerprint(f) != fingerprint[:4]:
+                    # The file was rewritten while we were reading it; parse it again next time.
+                    fingerprint = None
+
+            with span("parser.apply"):
+                clients = apply_client_records(
+                    client_records, vpn_ip_map, now, history_store, sessions_path=sessions_path
+                )
+
+            with _parse_cache_lock:
+                if fingerprint is None:
+                    _parse_cache.pop(cache_key, None)
+                else:
+                    _parse_cache[cache_key] = (fingerprint, [dict(c) for c in clients])
     except Exception:  # pragma: no cover - safeguard logging
         logger.exception("Error parsing status log")
 
@@ -0,0 +1,213 @@
+"""Per-client throughput rates derived from successive snapshots.
+
+Every time the collector publishes a new snapshot version it feeds the
+clients' cumulative byte counters to :class:`RateTracker`. The tracker keeps
+one shared ring of sample timestamps and, per session, two ``array("f")``
+rings of rx/tx rates aligned with it: ``RATES_WINDOW`` samples cost 8 bytes
+each per session (about 2.9 KB for 360 samples), instead of a dict per sample.
+
+From those it derives the instantaneous rate (last interval), a smoothed rate
+(exponential moving average with a ``RATES_SMOOTHING`` second time constant)
+and the peak over the window. The collector publishes them to
+``CLIENT_RATES_PATH``; ``/api/clients/rates`` serves that file.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import time
+from array import array
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from .config import CLIENT_RATES_PATH, RATES_SMOOTHING, RATES_WINDOW
+from .fileutil import atomic_write_json, load_cached_json, stat_key
+from .snapshot import ClientSnapshot, client_key
+
+
+class _Session:
+    __slots__ = (
+        "connected_since",
+        "rx",
+        "tx",
+        "rx_rates",
+        "tx_rates",
+        "count",
+        "rx_avg",
+        "tx_avg",
+    )
+
+    def __init__(self, connected_since: Any, rx: int, tx: int, capacity: int):
+        self.connected_since = connected_since
+        self.rx = rx
+        self.tx = tx
+        self.rx_rates = array("f", bytes(4 * capacity))
+        self.tx_rates = array("f", bytes(4 * capacity))
+        # Valid rate samples, ending at the tracker's head.
+        self.count = 0
+        self.rx_avg: Optional[float] = None
+        self.tx_avg: Optional[float] = None
+
+
+def _window(values: array, head: int, count: int) -> array:
+    """The last ``count`` values of a ring whose newest value is at ``head``."""
+
+    start = head - count + 1
+    if start >= 0:
+        return values[start : head + 1]
+    return values[start:] + values[: head + 1]
+
+
+class RateTracker:
+    """Ring buffers of rx/tx rates for every connected session.
+
+    A session is identified by the client key and ``connected_since``; a
+    reconnect, or counters going backwards, starts a new one.
+    """
+
+    def __init__(self, capacity: int = RATES_WINDOW, smoothing: float = RATES_SMOOTHING):
+        self.capacity = max(2, capacity)
+        self.smoothing = smoothing
+        self._times = array("d", bytes(8 * self.capacity))
+        self._head = -1
+        self._sessions: Dict[str, _Session] = {}
+        # Snapshot version of the last sample.
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def sample(self, clients: Iterable[Dict[str, Any]], now: Optional[float] = None) -> None:
+        """Record the counters of ``clients`` as observed at ``now``."""
+
+        now = time.time() if now is None else now
+        previous = self._times[self._head] if self._head >= 0 else None
+        dt = now - previous if previous is not None else 0.0
+        if previous is not None and dt <= 0:
+            return
+
+        self._head = (self._head + 1) % self.capacity
+        self._times[self._head] = now
+        head = self._head
+        # Weight of the newest rate in the moving average.
+        alpha = 1.0 - math.exp(-dt / self.smoothing) if self.smoothing > 0 else 1.0
+
+        sessions: Dict[str, _Session] = {}
+        for client in clients:
+            key = client_key(client)
+            rx = int(client.get("bytes_received") or 0)
+            tx = int(client.get("bytes_sent") or 0)
+            connected_since = client.get("connected_since")
+
+            session = self._sessions.get(key)
+            if (
+                session is None
+                or session.connected_since != connected_since
+                or rx < session.rx
+                or tx < session.tx
+            ):
+                sessions[key] = _Session(connected_since, rx, tx, self.capacity)
+                continue
+
+            rx_rate = (rx - session.rx) / dt
+            tx_rate = (tx - session.tx) / dt
+            session.rx_rates[head] = rx_rate
+            session.tx_rates[head] = tx_rate
+            # One slot short of the ring, so the oldest interval keeps its start time.
+            session.count = min(session.count + 1, self.capacity - 1)
+            if session.rx_avg is None:
+                session.rx_avg, session.tx_avg = rx_rate, tx_rate
+            else:
+                session.rx_avg += alpha * (rx_rate - session.rx_avg)
+                session.tx_avg += alpha * (tx_rate - session.tx_avg)
+            session.rx = rx
+            session.tx = tx
+            sessions[key] = session
+
+        # Sessions missing from this sample are gone.
+        self._sessions = sessions
+
+    def rates(self) -> Dict[str, Dict[str, Any]]:
+        """Current rates (bytes per second) of every session, by client key."""
+
+        head = self._head
+        result = {}
+        for key, session in self._sessions.items():
+            count = session.count
+            if not count:
+                result[key] = {
+                    "rx_rate": None,
+                    "tx_rate": None,
+                    "rx_rate_avg": None,
+                    "tx_rate_avg": None,
+                    "rx_rate_peak": None,
+                    "tx_rate_peak": None,
+                    "samples": 0,
+                    "window_seconds": 0.0,
+                }
+                continue
+
+            oldest = (head - count) % self.capacity
+            result[key] = {
+                "rx_rate": round(session.rx_rates[head], 1),
+                "tx_rate": round(session.tx_rates[head], 1),
+                "rx_rate_avg": round(session.rx_avg, 1),
+                "tx_rate_avg": round(session.tx_avg, 1),
+                "rx_rate_peak": round(max(_window(session.rx_rates, head, count)), 1),
+                "tx_rate_peak": round(max(_window(session.tx_rates, head, count)), 1),
+                "samples": count,
+                "window_seconds": round(self._times[head] - self._times[oldest], 3),
+            }
+        return result
+
+
+rate_tracker = RateTracker()
+
+
+def publish_rates(
+    version: int,
+    tracker: RateTracker = rate_tracker,
+    path: str = CLIENT_RATES_PATH,
+) -> None:
+    """Atomically write the tracker's rates for snapshot ``version``."""
+
+    payload = {"version": version, "generated_at": time.time(), "clients": tracker.rates()}
+
+    atomic_write_json(path, payload)
+
+
+def record_snapshot(
+    snapshot: ClientSnapshot, tracker: RateTracker = rate_tracker, path: str = CLIENT_RATES_PATH
+) -> None:
+    """Sample a newly published snapshot and publish the resulting rates.
+
+    Snapshots the tracker has already seen are ignored, so an unchanged
+    status file does not count as an interval without traffic.
+    """
+
+    if snapshot.version == tracker.version:
+        return
+    tracker.sample(snapshot.clients)
+    tracker.version = snapshot.version
+    publish_rates(snapshot.version, tracker, path)
+
+
+def _rates_from_data(data: Any) -> Dict[str, Any]:
+    if not isinstance(data, dict) or not isinstance(data.get("clients"), dict):
+        return {"version": 0, "generated_at": None, "clients": {}}
+    return data
+
+
+def client_rates_key(path: str = CLIENT_RATES_PATH) -> Optional[Tuple[int, int, int]]:
+    """Version of the published rates, for response caching."""
+
+    return stat_key(os.path.abspath(path))
+
+
+def load_client_rates(path: str = CLIENT_RATES_PATH) -> Dict[str, Any]:
+    """Return the last published rates.
+
+    Cached per process until the file's (inode, mtime_ns, size) changes.
+    """
+
+    return load_cached_json(path, _rates_from_data)
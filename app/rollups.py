@@ -0,0 +1,352 @@
+"""Traffic rollups: per-client and server byte counts at 1 min / 1 h / 1 day.
+
+The collector turns the byte counters of consecutive snapshots into deltas
+(:class:`CounterDeltas`) and adds them to one-minute buckets. Completed hours
+of minute buckets are compacted into hourly buckets and completed days of
+hourly buckets into daily ones; a watermark per resolution records how far
+compaction got, so every bucket is folded exactly once. Each resolution has
+its own retention.
+
+Queries read the requested resolution up to its watermark and fold the finer
+buckets after it on the fly, so a 30-day chart reads ~720 hourly rows and a
+365-day chart ~365 daily rows, never the raw history.
+
+Minute and hour buckets are aligned to epoch time, day buckets to midnight in
+``LOCAL_TZ``. The server-wide series is stored under the empty client key.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .config import (
+    ROLLUP_DAY_RETENTION_DAYS,
+    ROLLUP_HOUR_RETENTION_DAYS,
+    ROLLUP_MINUTE_RETENTION_DAYS,
+    ROLLUPS_DB_PATH,
+)
+from .fileutil import file_version
+from .snapshot import ClientSnapshot, client_key
+from .timeutil import local_epoch, local_time
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+RESOLUTIONS = {"1m": MINUTE, "1h": HOUR, "1d": DAY}
+# Each resolution is compacted into the next one.
+_NEXT_RESOLUTION = {MINUTE: HOUR, HOUR: DAY}
+# Key of the server-wide series.
+SERVER = ""
+
+_COMPACT_INTERVAL = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution INTEGER NOT NULL,
+    client TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    rx INTEGER NOT NULL DEFAULT 0,
+    tx INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (resolution, client, bucket)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rollups_bucket ON rollups (resolution, bucket);
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    resolution INTEGER PRIMARY KEY,
+    compacted_until INTEGER NOT NULL
+);
+"""
+
+_ADD = """
+INSERT INTO rollups (resolution, client, bucket, rx, tx) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (resolution, client, bucket) DO UPDATE SET
+    rx = rx + excluded.rx,
+    tx = tx + excluded.tx
+"""
+
+_SET_WATERMARK = """
+INSERT INTO rollup_watermarks (resolution, compacted_until) VALUES (?, ?)
+ON CONFLICT (resolution) DO UPDATE SET compacted_until = excluded.compacted_until
+"""
+
+
+def day_start(epoch: int) -> int:
+    """Epoch of local midnight on the day containing ``epoch``."""
+
+    return local_epoch(local_time(epoch)[:10] + " 00:00:00")
+
+
+def bucket_start(resolution: int, epoch: int) -> int:
+    if resolution == DAY:
+        return day_start(epoch)
+    return epoch - epoch % resolution
+
+
+def auto_resolution(start: int, end: int) -> int:
+    """Finest resolution that keeps ``[start, end)`` to at most ~750 points."""
+
+    span = end - start
+    if span <= 12 * HOUR:
+        return MINUTE
+    if span <= 31 * DAY:
+        return HOUR
+    return DAY
+
+
+class CounterDeltas:
+    """Byte counter deltas between consecutive snapshots.
+
+    The first snapshot only sets the baseline. Afterwards a session's delta is
+    its counter growth; a session seen for the first time (or reconnected,
+    or with counters going backwards) contributes its whole counters.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._counters: Optional[Dict[str, Tuple[Any, int, int]]] = None
+
+    def update(self, clients: Iterable[Dict[str, Any]]) -> Dict[str, Tuple[int, int]]:
+        counters = {}
+        deltas = {}
+        for client in clients:
+            key = client_key(client)
+            since = client.get("connected_since")
+            rx = int(client.get("bytes_received") or 0)
+            tx = int(client.get("bytes_sent") or 0)
+            counters[key] = (since, rx, tx)
+            if self._counters is None:
+                continue
+
+            previous = self._counters.get(key)
+            if previous is None or previous[0] != since or rx < previous[1] or tx < previous[2]:
+                delta = (rx, tx)
+            else:
+                delta = (rx - previous[1], tx - previous[2])
+            if delta != (0, 0):
+                deltas[key] = delta
+
+        self._counters = counters
+        return deltas
+
+
+class RollupStore:
+    """Traffic buckets in an SQLite database (WAL mode)."""
+
+    def __init__(
+        self,
+        path: str = ROLLUPS_DB_PATH,
+        retention_days: Optional[Dict[int, float]] = None,
+    ):
+        self.path = os.path.abspath(path)
+        if retention_days is None:
+            retention_days = {
+                MINUTE: ROLLUP_MINUTE_RETENTION_DAYS,
+                HOUR: ROLLUP_HOUR_RETENTION_DAYS,
+                DAY: ROLLUP_DAY_RETENTION_DAYS,
+            }
+        self.retention = {res: int(days * DAY) for res, days in retention_days.items()}
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._last_compaction = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+
+        with self._init_lock:
+            if not self._initialized:
+                conn.executescript(_SCHEMA)
+                self._initialized = True
+
+        return conn
+
+    def version(self) -> str:
+        """Opaque token that changes whenever the stored buckets change."""
+
+        return f"{file_version(self.path)}:{file_version(self.path + '-wal')}"
+
+    def record(self, deltas: Dict[str, Tuple[int, int]], now: Optional[float] = None) -> None:
+        """Add per-client byte ``deltas`` (and their sum) to the current minute."""
+
+        now = time.time() if now is None else now
+        if deltas:
+            minute = bucket_start(MINUTE, int(now))
+            rows = [(MINUTE, key, minute, rx, tx) for key, (rx, tx) in deltas.items()]
+            rows.append(
+                (
+                    MINUTE,
+                    SERVER,
+                    minute,
+                    sum(rx for rx, _ in deltas.values()),
+                    sum(tx for _, tx in deltas.values()),
+                )
+            )
+
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(_ADD, rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if now - self._last_compaction >= _COMPACT_INTERVAL:
+            self.compact(now)
+
+    def _watermark(self, conn: sqlite3.Connection, resolution: int) -> int:
+        row = conn.execute(
+            "SELECT compacted_until FROM rollup_watermarks WHERE resolution = ?", (resolution,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def compact(self, now: Optional[float] = None) -> None:
+        """Fold completed hours and days into coarser buckets and apply retention."""
+
+        now = time.time() if now is None else now
+        self._last_compaction = now
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for fine, coarse in _NEXT_RESOLUTION.items():
+                start = self._watermark(conn, coarse)
+                limit = bucket_start(coarse, int(now))
+                if limit <= start:
+                    continue
+
+                totals: Dict[Tuple[str, int], List[int]] = {}
+                rows = conn.execute(
+                    "SELECT client, bucket, rx, tx FROM rollups "
+                    "WHERE resolution = ? AND bucket >= ? AND bucket < ?",
+                    (fine, start, limit),
+                )
+                for client, bucket, rx, tx in rows:
+                    total = totals.setdefault((client, bucket_start(coarse, bucket)), [0, 0])
+                    total[0] += rx
+                    total[1] += tx
+
+                conn.executemany(
+                    _ADD,
+                    [
+                        (coarse, client, bucket, rx, tx)
+                        for (client, bucket), (rx, tx) in totals.items()
+                    ],
+                )
+                conn.execute(_SET_WATERMARK, (coarse, limit))
+
+            for resolution, keep in self.retention.items():
+                cutoff = int(now) - keep
+                if resolution in _NEXT_RESOLUTION:
+                    # Never drop buckets that have not been folded into the next resolution.
+                    cutoff = min(cutoff, self._watermark(conn, _NEXT_RESOLUTION[resolution]))
+                conn.execute(
+                    "DELETE FROM rollups WHERE resolution = ? AND bucket < ?", (resolution, cutoff)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def series(
+        self,
+        client: str = SERVER,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        resolution: Optional[int] = None,
+    ) -> Tuple[int, List[Tuple[int, int, int]]]:
+        """``(resolution, [(bucket, rx, tx), ...])`` for ``client`` in ``[start, end)``.
+
+        Defaults to the last 24 hours at the automatic resolution. Buckets
+        without traffic are omitted.
+        """
+
+        end = int(time.time()) + 1 if end is None else end
+        start = end - DAY if start is None else start
+        if resolution is None:
+            resolution = auto_resolution(start, end)
+
+        conn = self._connect()
+        totals: Dict[int, List[int]] = {}
+
+        def _fold(res: int, lower: int, upper: int) -> None:
+            if upper <= lower:
+                return
+            rows = conn.execute(
+                "SELECT bucket, rx, tx FROM rollups "
+                "WHERE resolution = ? AND client = ? AND bucket >= ? AND bucket < ?",
+                (res, client, lower, upper),
+            )
+            for bucket, rx, tx in rows:
+                total = totals.setdefault(bucket_start(resolution, bucket), [0, 0])
+                total[0] += rx
+                total[1] += tx
+
+        lower = bucket_start(resolution, start)
+        if resolution == MINUTE:
+            _fold(MINUTE, lower, end)
+        elif resolution == HOUR:
+            hours_until = self._watermark(conn, HOUR)
+            _fold(HOUR, lower, min(end, hours_until))
+            _fold(MINUTE, max(lower, hours_until), end)
+        else:
+            days_until = self._watermark(conn, DAY)
+            hours_until = self._watermark(conn, HOUR)
+            _fold(DAY, lower, min(end, days_until))
+            _fold(HOUR, max(lower, days_until), min(end, hours_until))
+            _fold(MINUTE, max(lower, days_until, hours_until), end)
+
+        return resolution, [(bucket, rx, tx) for bucket, (rx, tx) in sorted(totals.items())]
+
+
+_stores: Dict[str, RollupStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_rollup_store(path: str = ROLLUPS_DB_PATH) -> RollupStore:
+    """Return the process-wide rollup store for ``path``."""
+
+    target_path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(target_path)
+        if store is None:
+            store = RollupStore(target_path)
+            _stores[target_path] = store
+        return store
+
+
+counter_deltas = CounterDeltas()
+
+
+def record_traffic(
+    snapshot: ClientSnapshot,
+    store: Optional[RollupStore] = None,
+    deltas: CounterDeltas = counter_deltas,
+    now: Optional[float] = None,
+) -> None:
+    """Add the traffic since the previous snapshot to the rollups.
+
+    An unchanged snapshot adds nothing but is still passed on as empty
+    deltas, so compaction and retention keep running while traffic is idle.
+    """
+
+    changes: Dict[str, Tuple[int, int]] = {}
+    if snapshot.version != deltas.version:
+        deltas.version = snapshot.version
+        changes = deltas.update(snapshot.clients)
+    (store or get_rollup_store()).record(changes, now)
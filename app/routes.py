@@ -1,20 +1,59 @@
 # routes.py
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import Flask, Response, g, jsonify, render_template, request, stream_with_context
+
+from . import timing
+from .config import SERVER_STATUS_PATH, STREAM_KEEPALIVE_INTERVAL, STREAM_POLL_INTERVAL
+from .geo_clusters import MAX_ZOOM, get_cluster_index, parse_bbox
+from .geo_store import known_locations, locations_key
+from .geoip import lookup as geoip_lookup
+from .history_store import (
+    get_history_store,
+    is_valid_datetime,
+    normalize_history_entry,
+    parse_datetime,
+)
+from .metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    collector_metrics_key,
+    load_collector_metrics,
+    render_metrics,
+)
+from .rates import client_rates_key, load_client_rates
+from .rollups import RESOLUTIONS, SERVER, auto_resolution, get_rollup_store
+from .snapshot import (
+    ClientSnapshot,
+    clients_since,
+    diff_clients,
+    key_instance,
+    load_client_snapshot,
+)
+from .timeutil import local_epoch, local_time
 
-from flask import Flask, g, jsonify, render_template
+logger = logging.getLogger(__name__)
 
-from .config import HISTORY_LOG_PATH, SERVER_STATUS_PATH
-from .geo_store import ensure_geo_db_entries
-from .parser import parse_status_log
+# Addresses accepted by one /api/geo/locations request.
+_GEO_LOOKUP_LIMIT = 1000
 
+_HISTORY_QUERY_PARAMS = ("from", "to", "name", "limit", "cursor")
+_HISTORY_MAX_LIMIT = 10000
+_STREAM_CHUNK_SIZE = 64 * 1024
+_RESPONSE_CACHE_SIZE = 32
 
-logger = logging.getLogger(__name__)
+# Serialized bodies of recent responses: {cache key: (etag, body)}.
+_response_cache: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+_response_cache_lock = threading.Lock()
 
 app = Flask(
     __name__,
@@ -23,115 +62,223 @@ app = Flask(
 )
 
 
-def is_valid_datetime(value: str) -> bool:
-    try:
-        datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
-        return True
-    except ValueError:
-        return False
+@app.before_request
+def _start_request_timer():
+    if timing.enabled():
+        g.request_started = time.perf_counter()
 
 
-def _parse_optional_float(value: Any) -> Optional[float]:
-    if value in (None, ""):
-        return None
+@app.after_request
+def _record_request_time(response):
+    # Streamed bodies are timed up to the first byte.
+    started = g.pop("request_started", None)
+    if started is not None:
+        timing.record(f"routes.request.{request.endpoint}", time.perf_counter() - started)
+    return response
 
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return None
 
+def _json_error(message: str, status_code: int = 500, *, code: str = "internal_error"):
+    payload = {"error": {"code": code, "message": message}}
+    return jsonify(payload), status_code
 
-def _calculate_duration(start: str, end: Optional[str]) -> Optional[str]:
-    if not (is_valid_datetime(start) and end and is_valid_datetime(end)):
-        return None
 
-    start_dt = datetime.strptime(start, "%Y-%m-%d %H:%M:%S")
-    end_dt = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
-    return str(end_dt - start_dt)
+def _compute_etag(*parts: Any) -> str:
+    payload = "\x00".join(str(part) for part in parts).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
 
 
-def _json_error(message: str, status_code: int = 500, *, code: str = "internal_error"):
-    payload = {"error": {"code": code, "message": message}}
-    return jsonify(payload), status_code
+def _request_cache_key() -> str:
+    return request.full_path.rstrip("?")
 
 
-def _get_cached_clients() -> List[Dict[str, Any]]:
-    if "parsed_clients" not in g:
-        g.parsed_clients = parse_status_log()
-    return g.parsed_clients
+def _not_modified(etag: str) -> Optional[Response]:
+    if request.if_none_match.contains(etag) or request.if_none_match.star_tag:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
 
 
-def _normalize_history_entry(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    required_fields = ("timestamp", "name", "ip", "session_id")
+def _etag_response(
+    version_parts: Tuple[Any, ...], render: Callable[[], bytes], mimetype: str
+) -> Response:
+    """Response with a strong ETag derived from the data versions.
 
-    if not all(raw.get(field) for field in required_fields):
-        return None
+    ``version_parts`` must identify everything the body depends on. A
+    matching ``If-None-Match`` gets ``304 Not Modified``; otherwise the body
+    of the last response for the same URL is reused while the ETag is
+    unchanged, and ``render`` is only called when it is not.
+    """
 
-    timestamp = str(raw["timestamp"])
-    session_end_raw = raw.get("session_end")
-    session_end = session_end_raw if isinstance(session_end_raw, str) and is_valid_datetime(session_end_raw) else None
-
-    vpn_ipv4 = (raw.get("vpn_ipv4") or "").strip()
-    vpn_ipv6 = (raw.get("vpn_ipv6") or "").strip()
-    vpn_ip = (raw.get("vpn_ip") or "").strip() or vpn_ipv4 or vpn_ipv6
-    port = raw.get("port")
-    if port is not None:
-        port = str(port)
-
-    entry: Dict[str, Any] = {
-        "timestamp": timestamp,
-        "name": str(raw.get("name", "")),
-        "ip": str(raw.get("ip", "")),
-        "session_id": str(raw.get("session_id", "")),
-        "rx": _parse_optional_float(raw.get("rx")),
-        "tx": _parse_optional_float(raw.get("tx")),
-        "vpn_ip": vpn_ip,
-        "vpn_ipv4": vpn_ipv4 or (vpn_ip if "." in vpn_ip else ""),
-        "vpn_ipv6": vpn_ipv6 or (vpn_ip if ":" in vpn_ip else ""),
-        "port": port or "",
-        "session_end": session_end,
-        "duration": _calculate_duration(timestamp, session_end),
-    }
+    cache_key = _request_cache_key()
+    etag = _compute_etag(cache_key, *version_parts)
 
-    return entry
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
 
+    with _response_cache_lock:
+        cached = _response_cache.get(cache_key)
+    if cached is not None and cached[0] == etag:
+        body = cached[1]
+    else:
+        with timing.span("routes.render"):
+            body = render()
+        with _response_cache_lock:
+            _response_cache[cache_key] = (etag, body)
+            _response_cache.move_to_end(cache_key)
+            while len(_response_cache) > _RESPONSE_CACHE_SIZE:
+                _response_cache.popitem(last=False)
 
-def _load_history_entries() -> List[Dict[str, Any]]:
-    entries: List[Dict[str, Any]] = []
+    response = app.response_class(body, mimetype=mimetype)
+    response.set_etag(etag)
+    return response
 
-    if not os.path.exists(HISTORY_LOG_PATH):
-        return entries
 
-    with open(HISTORY_LOG_PATH, "r") as f:
-        try:
-            data = json.load(f)
-        except json.JSONDecodeError:
-            data = []
+def _etag_json_response(version_parts: Tuple[Any, ...], build: Callable[[], Any]) -> Response:
+    """JSON response of ``build()``, cached and ETagged like :func:`_etag_response`."""
 
-    if isinstance(data, list):
-        for item in data:
-            if isinstance(item, dict):
-                entry = _normalize_history_entry(item)
-                if entry:
-                    entries.append(entry)
+    return _etag_response(
+        version_parts,
+        lambda: (app.json.dumps(build(), separators=(",", ":")) + "\n").encode("utf-8"),
+        "application/json",
+    )
 
-    ensure_geo_db_entries(entries)
 
-    return entries
+def _get_snapshot() -> ClientSnapshot:
+    """Latest collector snapshot, pinned for the duration of the request."""
 
+    if "client_snapshot" not in g:
+        with timing.span("routes.snapshot.load"):
+            g.client_snapshot = load_client_snapshot()
+    return g.client_snapshot
+
+
+def _get_cached_clients() -> List[Dict[str, Any]]:
+    return list(_get_snapshot().clients)
 
-def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
-    if not value:
-        return None
+
+def _iter_normalized_history(raw_entries: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    for item in raw_entries:
+        entry = normalize_history_entry(item)
+        if entry:
+            yield entry
+
+
+def _stream_json_array(items: Iterable[Any]) -> Iterator[str]:
+    """Serialize ``items`` as a JSON array, one element at a time.
+
+    Elements are buffered into chunks of roughly ``_STREAM_CHUNK_SIZE``
+    characters, so memory stays flat however many elements there are.
+    """
+
+    dumps = app.json.dumps
+    buffer: List[str] = ["["]
+    buffered = 1
+    separator = ""
 
     try:
-        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+        for item in items:
+            chunk = separator + dumps(item, separators=(",", ":"))
+            separator = ","
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= _STREAM_CHUNK_SIZE:
+                yield "".join(buffer)
+                buffer = []
+                buffered = 0
+    except Exception:  # pragma: no cover - the status line has already been sent
+        logger.exception("Error while streaming history")
+        raise
+
+    buffer.append("]")
+    yield "".join(buffer)
+
+
+def _history_response(
+    raw_entries: Iterable[Dict[str, Any]],
+    next_cursor: Optional[str] = None,
+    *,
+    etag: Optional[str] = None,
+) -> Response:
+    entries = _iter_normalized_history(raw_entries)
+    response = Response(
+        stream_with_context(_stream_json_array(entries)), mimetype="application/json"
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if etag:
+        response.set_etag(etag)
+    return response
+
+
+def _parse_history_bound(value: str, *, end: bool = False) -> str:
+    """Accept ``YYYY-MM-DD[ HH:MM[:SS]]`` (or ``T`` separated) as a range bound."""
+
+    value = value.strip().replace("T", " ")
+    if len(value) == 10:
+        value += " 23:59:59" if end else " 00:00:00"
+    elif len(value) == 16:
+        value += ":59" if end else ":00"
+
+    if not is_valid_datetime(value):
+        raise ValueError(f"invalid datetime: {value!r}")
+    return value
+
+
+def _parse_history_query(args) -> Dict[str, Any]:
+    query: Dict[str, Any] = {
+        "name": args.get("name") or None,
+        "start": None,
+        "end": None,
+        "limit": None,
+        "cursor": args.get("cursor") or None,
+    }
+
+    if args.get("from"):
+        query["start"] = _parse_history_bound(args["from"])
+    if args.get("to"):
+        query["end"] = _parse_history_bound(args["to"], end=True)
+    if args.get("limit"):
+        limit = int(args["limit"])
+        if not 0 < limit <= _HISTORY_MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {_HISTORY_MAX_LIMIT}")
+        query["limit"] = limit
+
+    return query
+
+
+def _connected_epoch(connected_since: Any) -> Optional[int]:
+    try:
+        return local_epoch(connected_since)
     except (TypeError, ValueError):
         return None
 
 
+def _with_connected_epoch(clients: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copies of snapshot rows with ``connected_since_ts``, the session start in epoch seconds.
+
+    The page measures the time online from it on its own timer, so that a
+    response depends only on the snapshot and stays cacheable.
+    """
+
+    return [
+        dict(client, connected_since_ts=_connected_epoch(client.get("connected_since")))
+        for client in clients
+    ]
+
+
+def _with_server_time(response: Response) -> Response:
+    """Add the server clock, which the page needs to measure durations without skew.
+
+    Set on every response, 304s included, and kept out of the cached body.
+    """
+
+    response.headers["X-Server-Time"] = f"{time.time():.3f}"
+    return response
+
+
 def _aggregate_client_stats() -> List[Dict[str, Any]]:
-    history_entries = _load_history_entries()
     clients_map: Dict[str, Dict[str, Any]] = {}
 
     def _ensure_client(name: str) -> Dict[str, Any]:
@@ -144,55 +291,27 @@ def _aggregate_client_stats() -> List[Dict[str, Any]]:
                 "total_tx_mb": 0.0,
                 "total_duration_seconds": 0,
                 "last_seen": None,
-                "_closed_sessions": set(),
-                "_has_active_session": False,
             }
         return clients_map[name]
 
-    for entry in history_entries:
-        info = _ensure_client(entry["name"])
-
-        session_end = entry.get("session_end")
-        if session_end:
-            session_id = entry.get("session_id")
-            if session_id:
-                info["_closed_sessions"].add(session_id)
-            else:
-                info["_closed_sessions"].add((entry.get("timestamp"), session_end))
-
-        if entry["rx"] is not None:
-            info["total_rx_mb"] += entry["rx"]
-        if entry["tx"] is not None:
-            info["total_tx_mb"] += entry["tx"]
-
-        start_dt = _parse_datetime(entry["timestamp"])
-        end_dt = _parse_datetime(entry["session_end"])
-        if start_dt and end_dt and end_dt >= start_dt:
-            info["total_duration_seconds"] += int((end_dt - start_dt).total_seconds())
-
-        for candidate in (entry.get("session_end"), entry.get("timestamp")):
-            candidate_dt = _parse_datetime(candidate)
-            if not candidate_dt:
-                continue
-            current_last_seen = info.get("last_seen")
-            if current_last_seen is None or candidate_dt > current_last_seen:
-                info["last_seen"] = candidate_dt
-
-    active_clients = _get_cached_clients()
-    now = datetime.now()
-
-    for client in active_clients:
+    for name, totals in get_history_store().summarize_clients().items():
+        info = _ensure_client(name)
+        info.update(totals)
+        info["last_seen"] = parse_datetime(totals.get("last_seen"))
+
+    snapshot = _get_snapshot()
+    # Online clients were last seen when the snapshot was taken, so that the
+    # summary depends only on the snapshot and history versions.
+    seen = parse_datetime(snapshot.generated_at)
+
+    for client in snapshot.clients:
         name = client.get("common_name")
         if not name:
             continue
 
         info = _ensure_client(name)
         info["is_online"] = True
-        info["_has_active_session"] = True
-
-        connected_since = _parse_datetime(client.get("connected_since"))
-        if connected_since and now >= connected_since:
-            info["total_duration_seconds"] += int((now - connected_since).total_seconds())
+        info["sessions"] += 1
 
         bytes_received = client.get("bytes_received", 0)
         bytes_sent = client.get("bytes_sent", 0)
@@ -200,27 +319,26 @@ def _aggregate_client_stats() -> List[Dict[str, Any]]:
         info["total_rx_mb"] += bytes_received / (1024 * 1024)
         info["total_tx_mb"] += bytes_sent / (1024 * 1024)
 
-        info["last_seen"] = now
+        if seen is not None:
+            info["last_seen"] = seen
 
+        # The open session is not in total_duration_seconds; the page adds
+        # its running time from connected_since_ts.
         info["current_session"] = {
             "connected_since": client.get("connected_since"),
-            "time_online": client.get("time_online"),
+            "connected_since_ts": _connected_epoch(client.get("connected_since")),
             "ip": client.get("real_ip"),
             "port": client.get("port"),
             "vpn_ip": client.get("vpn_ip"),
             "vpn_ipv4": client.get("vpn_ipv4"),
             "vpn_ipv6": client.get("vpn_ipv6"),
-            "bytes_received_gb": round(bytes_received / (1024 ** 3), 3),
-            "bytes_sent_gb": round(bytes_sent / (1024 ** 3), 3),
+            "bytes_received_gb": round(bytes_received / (1024**3), 3),
+            "bytes_sent_gb": round(bytes_sent / (1024**3), 3),
         }
 
     clients_list: List[Dict[str, Any]] = []
 
     for client in clients_map.values():
-        closed_sessions = client.pop("_closed_sessions", set())
-        has_active_session = client.pop("_has_active_session", False)
-        client["sessions"] = len(closed_sessions) + (1 if has_active_session else 0)
-
         total_duration = client.get("total_duration_seconds", 0)
         client["total_duration_human"] = str(timedelta(seconds=total_duration))
         client["total_rx_gb"] = round(client.get("total_rx_mb", 0.0) / 1024, 3)
@@ -228,7 +346,9 @@ def _aggregate_client_stats() -> List[Dict[str, Any]]:
 
         last_seen_dt = client.get("last_seen")
         client["last_seen"] = (
-            last_seen_dt.strftime("%Y-%m-%d %H:%M:%S") if isinstance(last_seen_dt, datetime) else None
+            last_seen_dt.strftime("%Y-%m-%d %H:%M:%S")
+            if isinstance(last_seen_dt, datetime)
+            else None
         )
 
         client.pop("total_rx_mb", None)
@@ -266,42 +386,255 @@ def index():
     return render_template("index.html")
 
 
-# @app.route('/api/clients')
-# def api_clients():
-#    clients = parse_status_log()
-#    return jsonify({"clients": clients})
+def _instance_clients(
+    clients: Iterable[Dict[str, Any]], instance: Optional[str]
+) -> List[Dict[str, Any]]:
+    """Clients of one OpenVPN instance, or all of them when ``instance`` is not given."""
+
+    if not instance:
+        return list(clients)
+    return [client for client in clients if client.get("instance") == instance]
+
+
+def _clients_payload(
+    snapshot: ClientSnapshot, since: Optional[int], instance: Optional[str] = None
+) -> Dict[str, Any]:
+    if since is None:
+        return {"clients": _with_connected_epoch(_instance_clients(snapshot.clients, instance))}
+
+    delta = clients_since(snapshot, since)
+    if delta is None:
+        # Too old (or from the future): hand back everything to resync from.
+        return {
+            "version": snapshot.version,
+            "full": True,
+            "clients": _with_connected_epoch(_instance_clients(snapshot.clients, instance)),
+            "removed": [],
+        }
+    removed = delta["removed"]
+    if instance:
+        removed = [key for key in removed if key_instance(key) == instance]
+    return {
+        "version": snapshot.version,
+        "full": False,
+        "clients": _with_connected_epoch(_instance_clients(delta["clients"], instance)),
+        "removed": removed,
+    }
 
 
 @app.route("/api/clients")
 def api_clients():
+    since = request.args.get("since")
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return _json_error("since must be an integer snapshot version", 400, code="bad_request")
+
     try:
-        clients = _get_cached_clients()
-        return jsonify({"clients": clients})
+        snapshot = _get_snapshot()
+        response = _etag_json_response(
+            (snapshot.version,),
+            lambda: _clients_payload(snapshot, since, request.args.get("instance")),
+        )
+        return _with_server_time(response)
     except Exception:  # pragma: no cover - defensive logging
         logger.exception("[api_clients] Error while fetching clients")
         return _json_error("Failed to fetch clients")
 
 
+@app.route("/api/clients/rates")
+def get_client_rates():
+    """Throughput of each connected client in bytes per second.
+
+    ``rx_rate``/``tx_rate`` cover the last collector interval,
+    ``*_rate_avg`` is the smoothed rate and ``*_rate_peak`` the highest rate
+    within the sample window. Rates are keyed like ``removed`` in
+    ``/api/clients``; ``?instance=`` keeps one instance.
+    """
+
+    instance = request.args.get("instance")
+
+    def build():
+        data = load_client_rates()
+        clients = data["clients"]
+        if instance:
+            clients = {
+                key: rates for key, rates in clients.items() if key_instance(key) == instance
+            }
+        return {"version": data.get("version", 0), "clients": clients}
+
+    try:
+        return _etag_json_response((client_rates_key(),), build)
+    except Exception:  # pragma: no cover - defensive logging
+        logger.exception("[clients-rates] Failed to load client rates")
+        return _json_error("Failed to load client rates")
+
+
+@app.route("/api/traffic")
+def get_traffic():
+    """Traffic series of one client (``?client=<key>``) or of the whole server.
+
+    ``from``/``to`` take the same formats as ``/api/history`` and default to
+    the last 24 hours; ``resolution`` is ``1m``, ``1h``, ``1d`` or ``auto``
+    (the default), which picks the finest one that keeps the series short.
+    """
+
+    client = request.args.get("client") or SERVER
+    try:
+        # Exclusive bound that includes the current second.
+        end = int(time.time()) + 1
+        if request.args.get("to"):
+            end = local_epoch(_parse_history_bound(request.args["to"], end=True)) + 1
+        start = end - 86400
+        if request.args.get("from"):
+            start = local_epoch(_parse_history_bound(request.args["from"]))
+        if start >= end:
+            raise ValueError("from must be before to")
+
+        resolution_name = request.args.get("resolution") or "auto"
+        if resolution_name == "auto":
+            resolution = auto_resolution(start, end)
+        elif resolution_name in RESOLUTIONS:
+            resolution = RESOLUTIONS[resolution_name]
+        else:
+            raise ValueError(f"resolution must be one of auto, {', '.join(RESOLUTIONS)}")
+    except ValueError as exc:
+        return _json_error(str(exc), 400, code="bad_request")
+
+    store = get_rollup_store()
+    names = {seconds: name for name, seconds in RESOLUTIONS.items()}
+
+    def build():
+        _, points = store.series(client, start, end, resolution)
+        return {
+            "client": client,
+            "resolution": names[resolution],
+            "from": local_time(start),
+            "to": local_time(end),
+            "points": [
+                {"timestamp": local_time(bucket), "rx": rx, "tx": tx} for bucket, rx, tx in points
+            ],
+        }
+
+    try:
+        # Without "to" the window moves with the clock.
+        return _etag_json_response((store.version(), start, end), build)
+    except Exception:  # pragma: no cover - defensive logging
+        logger.exception("[traffic] Failed to read traffic rollups")
+        return _json_error("Failed to read traffic rollups")
+
+
+@app.route("/api/geo/locations")
+def get_geo_locations():
+    """Locations resolved from the local GeoIP database.
+
+    With ``?ip=`` (repeatable) the given addresses are resolved; without it
+    every IP in the geolocation DB that has a location is returned. Unknown
+    and private addresses are left out.
+    """
+
+    ips = sorted(set(ip.strip() for ip in request.args.getlist("ip") if ip.strip()))
+    if len(ips) > _GEO_LOOKUP_LIMIT:
+        return _json_error(
+            f"At most {_GEO_LOOKUP_LIMIT} addresses per request", 400, code="bad_request"
+        )
+
+    def build():
+        if not ips:
+            return {"locations": known_locations()}
+        locations = {}
+        for ip in ips:
+            location = geoip_lookup(ip)
+            if location is not None:
+                locations[ip] = location
+        return {"locations": locations}
+
+    try:
+        return _etag_json_response(locations_key(), build)
+    except Exception:  # pragma: no cover - defensive logging
+        logger.exception("[geo-locations] Failed to resolve locations")
+        return _json_error("Failed to resolve locations")
+
+
+@app.route("/api/geo/clusters")
+def get_geo_clusters():
+    """Located client IPs grouped into grid cells for a map view.
+
+    ``zoom`` is the map zoom level (0-20), ``bbox`` the visible
+    ``west,south,east,north`` (the whole world by default) and ``client``
+    (repeatable) limits the points to those clients. Each cluster has a
+    ``count``, a centroid and the ``bounds`` of its points; single points
+    also carry ``ip``, ``city``, ``country`` and ``clients``.
+    """
+
+    try:
+        zoom = int(request.args.get("zoom", "2"))
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+        bbox = parse_bbox(request.args["bbox"]) if request.args.get("bbox") else None
+    except ValueError as exc:
+        return _json_error(str(exc), 400, code="bad_request")
+    clients = request.args.getlist("client") or None
+
+    def build():
+        clusters = get_cluster_index().query(zoom, bbox, clients)
+        return {
+            "zoom": zoom,
+            "total": sum(cluster["count"] for cluster in clusters),
+            "clusters": clusters,
+        }
+
+    try:
+        return _etag_json_response(locations_key(), build)
+    except Exception:  # pragma: no cover - defensive logging
+        logger.exception("[geo-clusters] Failed to cluster locations")
+        return _json_error("Failed to cluster locations")
+
+
 @app.route("/api/history")
 def get_history():
+    """Session history.
+
+    The JSON array is streamed entry by entry (read, normalize, serialize),
+    so memory use does not grow with the size of the result.
+
+    Without parameters the whole history is returned in recorded order. With
+    any of ``from``, ``to``, ``name``, ``limit`` or ``cursor`` the result is
+    newest first; when more entries remain, the ``X-Next-Cursor`` response
+    header carries the opaque cursor for the next page.
+    """
+
+    store = get_history_store()
+    store_etag = _compute_etag(_request_cache_key(), store.version())
+    not_modified = _not_modified(store_etag)
+    if not_modified is not None:
+        return not_modified
+
+    if not any(request.args.get(param) for param in _HISTORY_QUERY_PARAMS):
+        try:
+            raw_entries = store.iter_entries()
+        except Exception:  # pragma: no cover - defensive logging
+            logger.exception("Error reading history log")
+            return _json_error("Failed to read history log")
+
+        return _history_response(raw_entries, etag=store_etag)
+
     try:
-        entries = _load_history_entries()
+        query = _parse_history_query(request.args)
+        raw_entries, next_cursor = store.query(**query)
+    except ValueError as exc:
+        return _json_error(str(exc), 400, code="bad_request")
     except Exception:  # pragma: no cover - defensive logging
         logger.exception("Error reading history log")
         return _json_error("Failed to read history log")
 
-    return jsonify(entries)
+    return _history_response(raw_entries, next_cursor, etag=store_etag)
 
 
-@app.route("/api/server-status")
-def get_server_status():
+def _server_status_payload(clients: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
     data = _load_server_status()
-
-    try:
-        clients = _get_cached_clients()
-    except Exception:  # pragma: no cover - defensive logging
-        logger.exception("[server-status] Failed to parse status log")
-        clients = []
+    clients = list(clients)
 
     total_rx = sum(c.get("bytes_received", 0) for c in clients)
     total_tx = sum(c.get("bytes_sent", 0) for c in clients)
@@ -315,18 +648,167 @@ def get_server_status():
         }
     )
 
-    return jsonify(data)
+    return data
+
+
+@app.route("/api/server-status")
+def get_server_status():
+    try:
+        snapshot = _get_snapshot()
+    except Exception:  # pragma: no cover - defensive logging
+        logger.exception("[server-status] Failed to load client snapshot")
+        snapshot = ClientSnapshot()
+
+    return _etag_json_response(
+        (snapshot.version, _server_status_file_key()),
+        lambda: _server_status_payload(
+            _instance_clients(snapshot.clients, request.args.get("instance"))
+        ),
+    )
+
+
+def _server_status_file_key():
+    try:
+        st = os.stat(SERVER_STATUS_PATH)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _sse_message(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {app.json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _client_event_stream(
+    poll_interval: float = STREAM_POLL_INTERVAL,
+    keepalive_interval: float = STREAM_KEEPALIVE_INTERVAL,
+    instance: Optional[str] = None,
+) -> Iterator[str]:
+    snapshot = load_client_snapshot()
+    clients = _instance_clients(snapshot.clients, instance)
+    status_key = _server_status_file_key()
+
+    yield "retry: 3000\n\n"
+    yield _sse_message(
+        "snapshot",
+        {
+            "version": snapshot.version,
+            "now": round(time.time(), 3),
+            "clients": _with_connected_epoch(clients),
+            "server_status": _server_status_payload(clients),
+        },
+        snapshot.version,
+    )
+    sent_version = snapshot.version
+    last_sent = time.monotonic()
+
+    while True:
+        time.sleep(poll_interval)
+
+        current = load_client_snapshot()
+        current_status_key = _server_status_file_key()
+        delta = None
+
+        if current.version != snapshot.version:
+            current_clients = _instance_clients(current.clients, instance)
+            delta = diff_clients(clients, current_clients)
+            snapshot = current
+            clients = current_clients
+            if not any(delta.values()):
+                # Only other instances changed.
+                delta = None
+
+        if delta is not None:
+            yield _sse_message(
+                "delta",
+                {
+                    "version": current.version,
+                    "since": sent_version,
+                    "now": round(time.time(), 3),
+                    "added": _with_connected_epoch(delta["added"]),
+                    "changed": _with_connected_epoch(delta["changed"]),
+                    "removed": delta["removed"],
+                    "server_status": _server_status_payload(clients),
+                },
+                current.version,
+            )
+            sent_version = current.version
+            status_key = current_status_key
+            last_sent = time.monotonic()
+        elif current_status_key != status_key:
+            status_key = current_status_key
+            yield _sse_message("status", _server_status_payload(clients), current.version)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= keepalive_interval:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+
+
+@app.route("/api/stream")
+def stream_clients():
+    """Server-Sent Events feed of client and server-status changes.
+
+    The first ``snapshot`` event carries the full client list; after that a
+    ``delta`` event (added/changed/removed clients plus server status) is
+    sent only when the collector publishes a new snapshot version, and a
+    ``status`` event when ``server_status.json`` changes. ``?instance=``
+    limits the feed to the clients of one OpenVPN instance.
+    """
+
+    events = _client_event_stream(instance=request.args.get("instance") or None)
+    response = Response(stream_with_context(events), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 @app.route("/api/clients/summary")
 def get_clients_summary():
     try:
-        clients = _aggregate_client_stats()
+        response = _etag_json_response(
+            (_get_snapshot().version, get_history_store().version()),
+            lambda: {"clients": _aggregate_client_stats()},
+        )
+        return _with_server_time(response)
     except Exception:  # pragma: no cover - defensive logging
         logger.exception("[clients-summary] Failed to build clients summary")
         return _json_error("Failed to build clients summary")
 
-    return jsonify({"clients": clients})
+
+@app.route("/metrics")
+def metrics():
+    try:
+        snapshot = _get_snapshot()
+        response = _etag_response(
+            (snapshot.version, collector_metrics_key()),
+            lambda: render_metrics(snapshot.clients, load_collector_metrics()).encode("utf-8"),
+            "text/plain",
+        )
+    except Exception:  # pragma: no cover - defensive logging
+        logger.exception("[metrics] Failed to render metrics")
+        return _json_error("Failed to render metrics")
+
+    response.headers["Content-Type"] = METRICS_CONTENT_TYPE
+    return response
+
+
+@app.route("/api/debug/timings")
+def get_timings():
+    if not timing.enabled():
+        return _json_error("Timing instrumentation is disabled", 404, code="not_found")
+
+    return jsonify(
+        {
+            "slow_ms": timing.slow_ms(),
+            "web": timing.summary(),
+            "collector": load_collector_metrics().get("timings") or {},
+        }
+    )
 
 
 if __name__ == "__main__":
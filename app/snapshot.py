@@ -0,0 +1,232 @@
+"""Versioned client snapshots shared between the collector and the web API.
+
+The background collector is the only process that parses ``status.log`` and
+touches session state. After every cycle it publishes the parsed client list
+to ``CLIENT_SNAPSHOT_PATH`` with a monotonically increasing version; the web
+workers only ever read that file. The version changes only when the client
+list does, so readers can cheaply tell whether anything happened.
+
+Alongside the rows the snapshot records the version at which each client last
+changed and tombstones for recently removed clients, which lets readers answer
+"what changed since version N" without keeping old snapshots around.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .config import CLIENT_SNAPSHOT_PATH, LOCAL_TZ
+from .fileutil import atomic_write_json, load_cached_json
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on remembered removals; older ones raise the delta floor.
+_MAX_TOMBSTONES = 10000
+
+
+@dataclass(frozen=True)
+class ClientSnapshot:
+    """An immutable view of the clients published by one collector cycle."""
+
+    version: int = 0
+    generated_at: Optional[str] = None
+    clients: Tuple[Dict[str, Any], ...] = field(default_factory=tuple)
+    # Version at which each present client was added or last changed.
+    client_versions: Dict[str, int] = field(default_factory=dict)
+    # Version at which each recently removed client disappeared.
+    tombstones: Dict[str, int] = field(default_factory=dict)
+    # Oldest version a delta can be computed from.
+    delta_floor: int = 0
+
+
+_EMPTY_SNAPSHOT = ClientSnapshot()
+
+
+def _snapshot_from_data(data: Any) -> ClientSnapshot:
+    if not isinstance(data, dict):
+        return _EMPTY_SNAPSHOT
+
+    clients = data.get("clients")
+    if not isinstance(clients, list):
+        clients = []
+
+    try:
+        version = int(data.get("version", 0))
+    except (TypeError, ValueError):
+        version = 0
+
+    clients = tuple(c for c in clients if isinstance(c, dict))
+    client_versions = _read_version_map(data.get("client_versions"))
+    tombstones = _read_version_map(data.get("tombstones"))
+    try:
+        delta_floor = int(data["delta_floor"])
+    except (KeyError, TypeError, ValueError):
+        delta_floor = None
+
+    if delta_floor is None or any(client_key(c) not in client_versions for c in clients):
+        # Written without change tracking: only the current version is known.
+        client_versions = {client_key(c): version for c in clients}
+        tombstones = {}
+        delta_floor = version
+
+    return ClientSnapshot(
+        version=version,
+        generated_at=data.get("generated_at"),
+        clients=clients,
+        client_versions=client_versions,
+        tombstones=tombstones,
+        delta_floor=delta_floor,
+    )
+
+
+def _read_version_map(value: Any) -> Dict[str, int]:
+    if not isinstance(value, dict):
+        return {}
+    result = {}
+    for key, version in value.items():
+        try:
+            result[str(key)] = int(version)
+        except (TypeError, ValueError):
+            continue
+    return result
+
+
+def load_client_snapshot(path: str = CLIENT_SNAPSHOT_PATH) -> ClientSnapshot:
+    """Return the latest published snapshot.
+
+    The decoded snapshot is cached per process and only re-read when the
+    file's (inode, mtime_ns, size) changes, so polling readers cost one
+    ``stat()`` per call.
+    """
+
+    return load_cached_json(path, _snapshot_from_data)
+
+
+def client_key(client: Dict[str, Any]) -> str:
+    """Identity of a client row across snapshots.
+
+    Rows of named instances are keyed ``"<instance>/<common name>"`` so the
+    same certificate connected to two instances stays two clients.
+    """
+
+    name = str(client.get("common_name") or "")
+    instance = client.get("instance")
+    return f"{instance}/{name}" if instance else name
+
+
+def key_instance(key: str) -> str:
+    """The instance part of a :func:`client_key` (empty when untagged)."""
+
+    instance, sep, _ = key.partition("/")
+    return instance if sep else ""
+
+
+def diff_clients(
+    old_clients: Iterable[Dict[str, Any]], new_clients: Iterable[Dict[str, Any]]
+) -> Dict[str, List[Any]]:
+    """Per-client changes between two client lists.
+
+    Returns full rows for ``added`` and ``changed`` clients and the keys of
+    ``removed`` ones. Rows carry only what the status source reports
+    (counters, addresses, ``connected_since``); clock-derived values such as
+    ``time_online`` are added per response, so a row compares unequal only
+    when the client really changed.
+    """
+
+    old_map = {client_key(client): client for client in old_clients}
+    new_map = {client_key(client): client for client in new_clients}
+
+    added = []
+    changed = []
+    for key, client in new_map.items():
+        previous = old_map.get(key)
+        if previous is None:
+            added.append(client)
+        elif previous != client:
+            changed.append(client)
+
+    removed = [key for key in old_map if key not in new_map]
+    return {"added": added, "changed": changed, "removed": removed}
+
+
+def clients_since(snapshot: ClientSnapshot, since: int) -> Optional[Dict[str, Any]]:
+    """Changes between version ``since`` and ``snapshot``.
+
+    Returns the rows of clients added or changed after ``since`` and the keys
+    of clients removed after it, or ``None`` when ``since`` is older than the
+    snapshot's delta floor (or newer than the snapshot itself) and the caller
+    has to resynchronise from the full client list.
+    """
+
+    if since < snapshot.delta_floor or since > snapshot.version:
+        return None
+
+    changed = [
+        client
+        for client in snapshot.clients
+        if snapshot.client_versions.get(client_key(client), snapshot.version) > since
+    ]
+    removed = sorted(key for key, version in snapshot.tombstones.items() if version > since)
+    return {"clients": changed, "removed": removed}
+
+
+def _track_changes(
+    current: ClientSnapshot, clients: Tuple[Dict[str, Any], ...], version: int
+) -> Tuple[Dict[str, int], Dict[str, int], int]:
+    delta = diff_clients(current.clients, clients)
+
+    client_versions = {
+        key: current.client_versions.get(key, version)
+        for key in (client_key(client) for client in clients)
+    }
+    for client in delta["added"] + delta["changed"]:
+        client_versions[client_key(client)] = version
+
+    tombstones = {
+        key: removed_at
+        for key, removed_at in current.tombstones.items()
+        if key not in client_versions
+    }
+    for key in delta["removed"]:
+        tombstones[key] = version
+
+    delta_floor = current.delta_floor
+    if len(tombstones) > _MAX_TOMBSTONES:
+        ordered = sorted(tombstones.items(), key=lambda item: item[1])
+        excess = ordered[: len(tombstones) - _MAX_TOMBSTONES]
+        delta_floor = max(delta_floor, excess[-1][1])
+        for key, _ in excess:
+            del tombstones[key]
+
+    return client_versions, tombstones, delta_floor
+
+
+def publish_snapshot(
+    clients: Iterable[Dict[str, Any]], path: str = CLIENT_SNAPSHOT_PATH
+) -> ClientSnapshot:
+    """Atomically publish ``clients`` as the next snapshot version.
+
+    When the client list is identical to the current snapshot nothing is
+    written and the current snapshot is returned unchanged.
+    """
+
+    clients = tuple(clients)
+    current = load_client_snapshot(path)
+    if current.version and current.clients == clients:
+        return current
+
+    version = current.version + 1
+    client_versions, tombstones, delta_floor = _track_changes(current, clients, version)
+    payload = {
+        "version": version,
+        "generated_at": datetime.now(LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S"),
+        "clients": list(clients),
+        "client_versions": client_versions,
+        "tombstones": tombstones,
+        "delta_floor": delta_floor,
+    }
+    atomic_write_json(path, payload, build=_snapshot_from_data)
+    return load_client_snapshot(path)
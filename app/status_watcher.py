@@ -0,0 +1,210 @@
+"""Wake the collector when OpenVPN rewrites a status file.
+
+On Linux the watcher subscribes to inotify events for the directory holding
+the status file, so both in-place rewrites and the temp-file-plus-rename
+pattern are seen. A burst of events from one flush is debounced into a single
+wake-up. Where inotify is unavailable (other platforms, exhausted watch
+limits, missing directory) :meth:`StatusFileWatcher.wait` degrades to a plain
+sleep and the collector keeps polling.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+from typing import Dict, Iterable, Optional, Set, Union
+
+from .config import STATUS_LOG_PATH
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+
+_WATCH_MASK = (
+    IN_MODIFY
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+# Events that invalidate the directory watch itself.
+_WATCH_LOST = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+# Upper bound on debouncing, so a file rewritten non-stop still gets parsed.
+_MAX_SETTLE = 1.0
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(name, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc = libc
+    return _libc
+
+
+class StatusFileWatcher:
+    """Block until one of the watched status files is rewritten, or a timeout elapses."""
+
+    def __init__(self, path: Union[str, Iterable[str]] = STATUS_LOG_PATH, debounce: float = 0.05):
+        paths = [path] if isinstance(path, str) else list(path)
+        # Watched file names per directory.
+        self.targets: Dict[str, Set[bytes]] = {}
+        for item in paths:
+            absolute = os.path.abspath(item)
+            self.targets.setdefault(os.path.dirname(absolute), set()).add(
+                os.fsencode(os.path.basename(absolute))
+            )
+        self.debounce = debounce
+        self._fd: Optional[int] = None
+        # Directory watched by each watch descriptor.
+        self._watches: Dict[int, str] = {}
+        self._disabled = False
+
+    @property
+    def active(self) -> bool:
+        """Whether every directory is being observed through inotify."""
+
+        return self._fd is not None and len(self._watches) == len(self.targets)
+
+    def _open(self) -> bool:
+        if self.active:
+            return True
+        if self._disabled:
+            return False
+
+        try:
+            libc = _load_libc()
+            if self._fd is None:
+                fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+                if fd < 0:
+                    raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+                self._fd = fd
+            watched = set(self._watches.values())
+            for directory in self.targets:
+                if directory in watched:
+                    continue
+                wd = libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+                if wd < 0:
+                    err = ctypes.get_errno()
+                    logger.warning(
+                        "Cannot watch %s (%s), polling until it can be watched",
+                        directory,
+                        os.strerror(err) if err else "unknown error",
+                    )
+                    if err not in (errno.ENOENT, errno.ENOTDIR):
+                        self._disabled = True
+                        self.close()
+                    return False
+                self._watches[wd] = directory
+        except (AttributeError, OSError) as exc:
+            # No inotify on this platform: poll for the rest of the process.
+            logger.warning("inotify unavailable, falling back to polling: %s", exc)
+            self._disabled = True
+            self.close()
+            return False
+
+        return True
+
+    def _read_events(self) -> bool:
+        """Drain pending events; True if any concerned the status file."""
+
+        relevant = False
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                return relevant
+            except InterruptedError:
+                continue
+
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+
+                directory = self._watches.get(wd)
+                if mask & IN_Q_OVERFLOW:
+                    relevant = True
+                elif directory is not None and mask & _WATCH_LOST:
+                    # The directory went away; re-add the watch next time.
+                    del self._watches[wd]
+                    relevant = True
+                elif directory is not None and name in self.targets[directory]:
+                    relevant = True
+
+    def _poll(self, timeout: float) -> bool:
+        try:
+            ready, _, _ = select.select([self._fd], [], [], max(timeout, 0))
+        except InterruptedError:
+            return False
+        return bool(ready)
+
+    def wait(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for the status file to change.
+
+        Returns ``True`` when a change was observed (after the debounce window
+        went quiet) and ``False`` on timeout. Without inotify this just sleeps
+        for ``timeout`` and returns ``False``.
+        """
+
+        if not self._open():
+            time.sleep(timeout)
+            return False
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self._poll(remaining) and self._read_events():
+                break
+
+        # Coalesce the rest of this flush (truncate, writes, rename, ...).
+        settle_deadline = time.monotonic() + _MAX_SETTLE
+        while self.active and time.monotonic() < settle_deadline and self._poll(self.debounce):
+            self._read_events()
+        return True
+
+    def close(self) -> None:
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+        self._fd = None
+        self._watches = {}
+
+    def __enter__(self) -> "StatusFileWatcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,80 @@
+"""Conversions between epoch seconds and wall-clock text in ``LOCAL_TZ``.
+
+Status files, history events and the traffic API all use
+``YYYY-MM-DD HH:MM:SS`` in the monitor's time zone. The same values repeat
+on every poll (a session's start time never changes), so both directions
+are memoized in bounded dicts and a repeated value costs one lookup.
+"""
+
+from __future__ import annotations
+
+import datetime
+
+from .config import LOCAL_TZ
+
+_TIMESTAMP_CACHE_SIZE = 65536
+_epoch_by_local_time = {}
+_local_time_by_epoch = {}
+
+
+def _remember(cache, key, value):
+    if len(cache) >= _TIMESTAMP_CACHE_SIZE:
+        cache.clear()
+    cache[key] = value
+    return value
+
+
+def local_epoch(value: str) -> int:
+    """Epoch seconds of a ``YYYY-MM-DD HH:MM:SS`` wall-clock time in ``LOCAL_TZ``.
+
+    Well-formed values are sliced at fixed offsets instead of going through
+    ``strptime``; anything else is handed to ``strptime`` so malformed input
+    raises the usual ``ValueError``.
+    """
+
+    epoch = _epoch_by_local_time.get(value)
+    if epoch is not None:
+        return epoch
+
+    digits = value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19]
+    naive_dt = None
+    if (
+        len(value) == 19
+        and value[4] == "-"
+        and value[7] == "-"
+        and value[10] == " "
+        and value[13] == ":"
+        and value[16] == ":"
+        and digits.isascii()
+        and digits.isdigit()
+    ):
+        try:
+            naive_dt = datetime.datetime(
+                int(value[0:4]),
+                int(value[5:7]),
+                int(value[8:10]),
+                int(value[11:13]),
+                int(value[14:16]),
+                int(value[17:19]),
+            )
+        except ValueError:
+            naive_dt = None
+    if naive_dt is None:
+        naive_dt = datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+    return _remember(_epoch_by_local_time, value, int(LOCAL_TZ.localize(naive_dt).timestamp()))
+
+
+def local_time(epoch: int) -> str:
+    """``YYYY-MM-DD HH:MM:SS`` text of an epoch in ``LOCAL_TZ``."""
+
+    value = _local_time_by_epoch.get(epoch)
+    if value is not None:
+        return value
+    value = datetime.datetime.fromtimestamp(epoch, LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S")
+    return _remember(_local_time_by_epoch, epoch, value)
+
+
+def clear_caches() -> None:
+    _epoch_by_local_time.clear()
+    _local_time_by_epoch.clear()
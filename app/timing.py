@@ -0,0 +1,121 @@
+"""Lightweight timing spans for the hot paths.
+
+Wrap a stage in ``with span("parser.sessions_lock.wait"):`` and its duration
+is added to a rolling window of the last ``TIMING_WINDOW`` samples for that
+name; :func:`summary` reports p50/p95/p99 and the maximum of each window.
+Spans slower than ``TIMING_SLOW_MS`` are also logged.
+
+Instrumentation is off unless ``OPENVPN_TIMING`` is set. Disabled,
+:func:`span` returns a shared no-op context manager, so an instrumented
+stage costs one function call and a flag check.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, Deque, Dict, Optional
+
+from .config import TIMING_ENABLED, TIMING_SLOW_MS, TIMING_WINDOW
+
+logger = logging.getLogger(__name__)
+
+_NOOP = nullcontext()
+
+_lock = threading.Lock()
+_windows: Dict[str, Deque[float]] = {}
+_counts: Dict[str, int] = {}
+
+_enabled = TIMING_ENABLED
+_slow_ms = TIMING_SLOW_MS
+
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        record(self.name, time.perf_counter() - self.started)
+
+
+def span(name: str):
+    """Context manager timing the enclosed block as ``name``."""
+
+    if not _enabled:
+        return _NOOP
+    return _Span(name)
+
+
+def record(name: str, seconds: float) -> None:
+    """Add one duration sample for ``name``."""
+
+    with _lock:
+        window = _windows.get(name)
+        if window is None:
+            window = deque(maxlen=TIMING_WINDOW)
+            _windows[name] = window
+        window.append(seconds)
+        _counts[name] = _counts.get(name, 0) + 1
+
+    if _slow_ms and seconds * 1000 >= _slow_ms:
+        logger.warning("Slow %s: %.1f ms", name, seconds * 1000)
+
+
+def configure(enabled: Optional[bool] = None, slow_ms: Optional[float] = None) -> None:
+    """Switch instrumentation on or off and change the slow-span threshold at runtime."""
+
+    global _enabled, _slow_ms
+    if enabled is not None:
+        _enabled = enabled
+    if slow_ms is not None:
+        _slow_ms = slow_ms
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def slow_ms() -> float:
+    return _slow_ms
+
+
+def reset() -> None:
+    with _lock:
+        _windows.clear()
+        _counts.clear()
+
+
+def _percentile(ordered, fraction: float) -> float:
+    # Nearest-rank percentile of an already sorted, non-empty sequence.
+    index = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summary() -> Dict[str, Dict[str, Any]]:
+    """Rolling statistics per span name, durations in milliseconds."""
+
+    with _lock:
+        samples = {name: sorted(window) for name, window in _windows.items() if window}
+        counts = dict(_counts)
+
+    return {
+        name: {
+            "count": counts.get(name, 0),
+            "window": len(ordered),
+            "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+            "p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+            "max_ms": round(ordered[-1] * 1000, 3),
+        }
+        for name, ordered in sorted(samples.items())
+    }
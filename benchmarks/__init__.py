@@ -0,0 +1,7 @@
+"""Performance benchmarks for the monitor.
+
+``python -m benchmarks.run`` times the parser, history store, summaries, geo
+ingestion and Flask endpoints on synthetic data from
+:mod:`benchmarks.generate` and writes machine-readable JSON;
+``python -m benchmarks.compare`` diffs two such result files.
+"""
@@ -0,0 +1,126 @@
+"""Per-row cost of the status parser: fast path vs. the strptime reference.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_parse_status --clients 5000
+
+Prints one JSON object with the median seconds per parse for the reference
+implementation (``strptime`` + ``localize`` on every row),
+the fast path on a cold cache (first parse of new sessions) and on a warm
+cache (unchanged sessions), plus the resulting speedups.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def _status_lines(clients):
+    lines = ["Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since\n"]
+    for index in range(clients):
+        if index % 3 == 0:
+            address = f"[2001:db8::{index:x}]:{1024 + index % 50000}"
+        else:
+            octets = f"{51 + index // 65536 % 200}.{index // 256 % 256}.{index % 256}"
+            address = f"198.{octets}:{1024 + index % 50000}"
+        since = f"2024-01-0{1 + index % 7} {index % 24:02d}:{index % 60:02d}:{(index * 7) % 60:02d}"
+        lines.append(f"client{index},{address},{index * 1024},{index * 2048},{since}\n")
+    return lines
+
+
+def _reference_rows(parser, lines):
+    """The pre-fast-path per-row work, kept here as the baseline."""
+
+    from datetime import datetime
+
+    records = []
+    for raw_line in lines[1:]:
+        parts = raw_line.strip().split(",")
+        real_ip, port = parser._split_real_address.__wrapped__(parts[1])
+        connected_dt = parser.LOCAL_TZ.localize(datetime.strptime(parts[4], "%Y-%m-%d %H:%M:%S"))
+        records.append(
+            {
+                "common_name": parts[0],
+                "real_ip": real_ip,
+                "port": port,
+                "bytes_received": int(parts[2]),
+                "bytes_sent": int(parts[3]),
+                "connected_since": connected_dt.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+        )
+    return records
+
+
+def _clear_caches(parser):
+    from app import timeutil
+
+    timeutil.clear_caches()
+    parser._split_real_address.cache_clear()
+
+
+def _median(fn, repeat, before=None):
+    samples = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def run(clients, repeat):
+    from app import parser
+
+    lines = _status_lines(clients)
+
+    fast = parser._parse_status_v1(lines)[0]
+    if fast != _reference_rows(parser, lines):
+        raise SystemExit("fast path output differs from the reference")
+
+    reference = _median(lambda: _reference_rows(parser, lines), repeat)
+    cold = _median(
+        lambda: parser._parse_status_v1(lines), repeat, before=lambda: _clear_caches(parser)
+    )
+    parser._parse_status_v1(lines)
+    warm = _median(lambda: parser._parse_status_v1(lines), repeat)
+
+    return {
+        "benchmark": "parse_status_rows",
+        "clients": clients,
+        "repeat": repeat,
+        "reference_s": reference,
+        "fast_cold_s": cold,
+        "fast_warm_s": warm,
+        "speedup_cold": reference / cold if cold else None,
+        "speedup_warm": reference / warm if warm else None,
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--clients", type=int, default=5000)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keep app.config from touching the real data directory.
+        for env, name in (
+            ("OPENVPN_HISTORY_LOG", "history.json"),
+            ("OPENVPN_ACTIVE_SESSIONS", "active_sessions.json"),
+            ("OPENVPN_SERVER_STATUS", "server_status.json"),
+            ("OPENVPN_CLIENT_GEO_DB", "client_geolocation.json"),
+        ):
+            os.environ.setdefault(env, os.path.join(workdir, name))
+        json.dump(run(args.clients, args.repeat), sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Compare two benchmark result files.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 0.1]
+
+Prints the median of every benchmark present in both files and the ratio
+candidate/baseline. Exits with status 1 when any ratio exceeds
+``1 + threshold``, so it can gate a release.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+from .harness import result_key
+
+
+def _load(path):
+    with open(path, "r", encoding="utf-8") as fh:
+        data = json.load(fh)
+    return {result_key(result): result for result in data.get("results", [])}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    baseline = _load(args.baseline)
+    candidate = _load(args.candidate)
+
+    regressions = 0
+    for key in sorted(baseline.keys() & candidate.keys()):
+        before = baseline[key]["median_s"]
+        after = candidate[key]["median_s"]
+        ratio = after / before if before else float("inf")
+        flag = ""
+        if ratio > 1 + args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{key:<70} {before * 1000:10.2f} ms {after * 1000:10.2f} ms {ratio:6.2f}x{flag}")
+
+    for key in sorted(baseline.keys() - candidate.keys()):
+        print(f"{key:<70} missing from candidate")
+    for key in sorted(candidate.keys() - baseline.keys()):
+        print(f"{key:<70} new")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""Synthetic OpenVPN status logs and session histories.
+
+Everything is deterministic for a given seed, so two benchmark runs on
+different releases see identical inputs.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+_BASE_EPOCH = 1704067200  # 2024-01-01 00:00:00 UTC
+_V3_CLIENT_HEADER = (
+    "Common Name",
+    "Real Address",
+    "Virtual Address",
+    "Virtual IPv6 Address",
+    "Bytes Received",
+    "Bytes Sent",
+    "Connected Since",
+    "Connected Since (time_t)",
+    "Username",
+    "Client ID",
+    "Peer ID",
+    "Data Channel Cipher",
+)
+_V3_ROUTING_HEADER = (
+    "Virtual Address",
+    "Common Name",
+    "Real Address",
+    "Last Ref",
+    "Last Ref (time_t)",
+)
+
+
+def _wall_clock(epoch: int) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch))
+
+
+def _real_address(index: int, rng: random.Random) -> str:
+    port = rng.randint(1024, 65535)
+    if index % 4 == 0:
+        return f"[2001:db8:{index // 65536:x}::{index % 65536:x}]:{port}"
+    return f"198.{51 + index // 65536 % 200}.{index // 256 % 256}.{index % 256}:{port}"
+
+
+def make_client(index: int, rng: random.Random, now: int = _BASE_EPOCH + 86400) -> Dict[str, Any]:
+    """One connected client; every third one also has a VPN IPv6 address."""
+
+    return {
+        "common_name": f"client{index:06d}",
+        "real_address": _real_address(index, rng),
+        "vpn_ipv4": f"10.{8 + index // 65536}.{index // 256 % 256}.{index % 256}",
+        "vpn_ipv6": f"fd00::{index:x}" if index % 3 == 0 else None,
+        "bytes_received": rng.randint(0, 10**9),
+        "bytes_sent": rng.randint(0, 10**9),
+        "connected_epoch": now - rng.randint(0, 7 * 86400),
+        "client_id": index,
+    }
+
+
+def make_clients(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [make_client(index, rng) for index in range(count)]
+
+
+def churn(
+    clients: List[Dict[str, Any]], fraction: float = 0.05, seed: int = 1
+) -> List[Dict[str, Any]]:
+    """Next snapshot: ``fraction`` of clients leave, as many new ones join, counters grow."""
+
+    rng = random.Random(seed)
+    leaving = set(rng.sample(range(len(clients)), int(len(clients) * fraction)))
+    next_index = max((c["client_id"] for c in clients), default=-1) + 1
+
+    result = []
+    for position, client in enumerate(clients):
+        if position in leaving:
+            continue
+        updated = dict(client)
+        updated["bytes_received"] += rng.randint(0, 10**6)
+        updated["bytes_sent"] += rng.randint(0, 10**6)
+        result.append(updated)
+    for offset in range(len(leaving)):
+        result.append(make_client(next_index + offset, rng))
+    return result
+
+
+def status_lines(clients: List[Dict[str, Any]], version: int = 1) -> List[str]:
+    """Render ``clients`` as a status file of ``status-version`` 1, 2 or 3."""
+
+    if version == 1:
+        lines = [
+            "OpenVPN CLIENT LIST",
+            f"Updated,{_wall_clock(_BASE_EPOCH + 86400)}",
+            "Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since",
+        ]
+        lines += [
+            f"{c['common_name']},{c['real_address']},{c['bytes_received']},{c['bytes_sent']},"
+            f"{_wall_clock(c['connected_epoch'])}"
+            for c in clients
+        ]
+        lines.append("ROUTING TABLE")
+        lines.append("Virtual Address,Common Name,Real Address,Last Ref")
+        for c in clients:
+            for vpn_ip in (c["vpn_ipv4"], c["vpn_ipv6"]):
+                if vpn_ip:
+                    lines.append(f"{vpn_ip},{c['common_name']},{c['real_address']},-")
+        lines += ["GLOBAL STATS", "Max bcast/mcast queue length,0", "END"]
+        return [line + "\n" for line in lines]
+
+    sep = "\t" if version == 3 else ","
+    lines = [
+        sep.join(("TITLE", "OpenVPN 2.6.8 x86_64-pc-linux-gnu")),
+        sep.join(("HEADER", "CLIENT_LIST") + _V3_CLIENT_HEADER),
+    ]
+    for c in clients:
+        since = _wall_clock(c["connected_epoch"])
+        lines.append(
+            sep.join(
+                (
+                    "CLIENT_LIST",
+                    c["common_name"],
+                    c["real_address"],
+                    c["vpn_ipv4"],
+                    c["vpn_ipv6"] or "",
+                    str(c["bytes_received"]),
+                    str(c["bytes_sent"]),
+                    since,
+                    str(c["connected_epoch"]),
+                    "UNDEF",
+                    str(c["client_id"]),
+                    "0",
+                    "AES-256-GCM",
+                )
+            )
+        )
+    lines.append(sep.join(("HEADER", "ROUTING_TABLE") + _V3_ROUTING_HEADER))
+    for c in clients:
+        for vpn_ip in (c["vpn_ipv4"], c["vpn_ipv6"]):
+            if vpn_ip:
+                row = ("ROUTING_TABLE", vpn_ip, c["common_name"], c["real_address"], "-", "0")
+                lines.append(sep.join(row))
+    lines += [sep.join(("GLOBAL_STATS", "Max bcast/mcast queue length", "0")), "END"]
+    return [line + "\n" for line in lines]
+
+
+def write_status_log(path: str, clients: List[Dict[str, Any]], version: int = 1) -> None:
+    """Atomically replace ``path`` with a status file for ``clients``."""
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as tmp_file:
+        tmp_file.writelines(status_lines(clients, version))
+    os.replace(tmp_file.name, path)
+
+
+def history_entries(rows: int, names: int = 1000, seed: int = 2) -> Iterator[Dict[str, Any]]:
+    """``rows`` history events: connect/disconnect pairs in time order."""
+
+    rng = random.Random(seed)
+    clock = _BASE_EPOCH - rows * 60
+    produced = 0
+    while produced < rows:
+        index = rng.randrange(names)
+        clock += rng.randint(1, 120)
+        start = _wall_clock(clock)
+        end = _wall_clock(clock + rng.randint(60, 8 * 3600))
+        base = {
+            "timestamp": start,
+            "name": f"client{index:06d}",
+            "ip": _real_address(index, rng).rsplit(":", 1)[0].strip("[]"),
+            "session_id": f"{seed:x}-{produced:x}",
+            "vpn_ip": f"10.8.{index // 256 % 256}.{index % 256}",
+            "vpn_ipv4": f"10.8.{index // 256 % 256}.{index % 256}",
+            "vpn_ipv6": f"fd00::{index:x}" if index % 3 == 0 else None,
+            "port": str(rng.randint(1024, 65535)),
+        }
+        yield {**base, "rx": None, "tx": None, "session_end": None}
+        produced += 1
+        if produced < rows:
+            yield {
+                **base,
+                "rx": round(rng.uniform(0, 2048), 2),
+                "tx": round(rng.uniform(0, 2048), 2),
+                "session_end": end,
+            }
+            produced += 1
+
+
+def write_history(path: str, rows: int, names: Optional[int] = None, seed: int = 2) -> None:
+    """Write a JSON Lines ``session_history.json`` with ``rows`` events."""
+
+    if names is None:
+        names = max(1, min(rows // 10, 10000))
+    with open(path, "w", encoding="utf-8") as fh:
+        for entry in history_entries(rows, names, seed):
+            fh.write(json.dumps(entry, separators=(",", ":")) + "\n")
@@ -0,0 +1,93 @@
+"""Timing helpers and the result file format shared by the benchmarks."""
+
+from __future__ import annotations
+
+import datetime
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+RESULT_FORMAT = 1
+
+
+def measure(
+    fn: Callable[[], Any],
+    repeat: int = 5,
+    setup: Optional[Callable[[], Any]] = None,
+    warmup: int = 0,
+) -> Dict[str, float]:
+    """Time ``fn`` ``repeat`` times; ``setup`` runs untimed before each call."""
+
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        fn()
+
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+
+    return {
+        "repeat": repeat,
+        "min_s": min(samples),
+        "median_s": statistics.median(samples),
+        "mean_s": statistics.fmean(samples),
+        "stdev_s": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return (
+            subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                check=True,
+                capture_output=True,
+                text=True,
+                timeout=10,
+            ).stdout.strip()
+            or None
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Results:
+    """Accumulates benchmark results into one JSON-serializable document."""
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.meta = {
+            "format": RESULT_FORMAT,
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "settings": settings,
+        }
+        self.results: List[Dict[str, Any]] = []
+
+    def add(self, name: str, params: Dict[str, Any], timing: Dict[str, float]) -> None:
+        self.results.append({"name": name, "params": params, **timing})
+        param_text = " ".join(f"{key}={value}" for key, value in params.items())
+        print(
+            f"{name:<32} {param_text:<28} median {timing['median_s'] * 1000:10.2f} ms",
+            file=sys.stderr,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"meta": self.meta, "results": self.results}
+
+
+def result_key(result: Dict[str, Any]) -> str:
+    """Stable identity of a result across runs: name plus sorted params."""
+
+    params = ",".join(f"{key}={result['params'][key]}" for key in sorted(result["params"]))
+    return f"{result['name']}[{params}]"
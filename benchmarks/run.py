@@ -0,0 +1,294 @@
+"""Benchmark suite.
+
+    python -m benchmarks.run [--clients 100,1000,10000] [--history 10000,100000,1000000]
+                             [--formats 1,3] [--backend jsonl] [--repeat 5]
+                             [--output results.json] [--quick]
+
+Times, on synthetic data from :mod:`benchmarks.generate`:
+
+* ``parse_status_log`` on a first parse (every session new), an unchanged
+  file and a file with 5% client churn, per status format;
+* history reads (full scan, first page, per-name page), client totals with
+  and without the materialized aggregates, ``_aggregate_client_stats`` and
+  ``sync_geo_db``;
+* the Flask endpoints, with the serialized-response cache cleared ("cold")
+  and warm.
+
+Progress goes to stderr; the JSON document (see :mod:`benchmarks.harness`)
+goes to ``--output`` or stdout. All files live in a temporary directory
+unless ``--workdir`` is given.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+from . import generate
+from .harness import Results, measure
+
+_ENV_FILES = {
+    "OPENVPN_STATUS_LOG": "status.log",
+    "OPENVPN_HISTORY_LOG": "session_history.json",
+    "OPENVPN_HISTORY_DB": "session_history.sqlite3",
+    "OPENVPN_HISTORY_AGGREGATES": "client_aggregates.json",
+    "OPENVPN_ACTIVE_SESSIONS": "active_sessions.json",
+    "OPENVPN_SERVER_STATUS": "server_status.json",
+    "OPENVPN_CLIENT_GEO_DB": "client_geolocation.json",
+    "OPENVPN_CLIENT_SNAPSHOT": "client_snapshot.json",
+}
+
+
+def _sizes(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def _scaled(repeat: int, size: int, big: int) -> int:
+    """Fewer repetitions for inputs of ``big`` rows and more."""
+
+    return max(1, repeat // 5) if size >= big else repeat
+
+
+def _configure(workdir: str, backend: str) -> None:
+    # app.config binds its paths at import time, so this must run first.
+    for env, name in _ENV_FILES.items():
+        os.environ[env] = os.path.join(workdir, name)
+    os.environ["OPENVPN_HISTORY_BACKEND"] = backend
+    os.environ["OPENVPN_INSTANCES"] = ""
+
+
+def bench_clients(results: Results, workdir: str, count: int, version: int, repeat: int) -> None:
+    from app import parser, routes, snapshot
+
+    status_path = os.path.join(workdir, f"status-{count}-v{version}.log")
+    sessions_path = os.path.join(workdir, f"active_sessions-{count}-v{version}.json")
+    params = {"clients": count, "format": f"v{version}"}
+
+    clients = generate.make_clients(count)
+    generate.write_status_log(status_path, clients, version)
+
+    def parse():
+        return parser.parse_status_log(status_path, sessions_path)
+
+    results.add("parse_status_log.first", params, measure(parse, repeat=1))
+    results.add("parse_status_log.unchanged", params, measure(parse, repeat=repeat))
+
+    state = {"clients": clients, "step": 0}
+
+    def next_version():
+        state["step"] += 1
+        state["clients"] = generate.churn(state["clients"], 0.05, seed=state["step"])
+        generate.write_status_log(status_path, state["clients"], version)
+
+    results.add(
+        "parse_status_log.churn",
+        params,
+        measure(parse, repeat=_scaled(repeat, count, 10000), setup=next_version),
+    )
+
+    if version != 1:
+        return
+
+    # Endpoints over the snapshot the collector would publish.
+    previous = snapshot.publish_snapshot(parse())
+    next_version()
+    snapshot.publish_snapshot(parse())
+
+    client = routes.app.test_client()
+    paths = [
+        "/api/clients",
+        f"/api/clients?since={previous.version}",
+        "/api/server-status",
+        "/api/clients/summary",
+    ]
+    for path in paths:
+        for cache in ("cold", "warm"):
+            setup = routes._response_cache.clear if cache == "cold" else None
+            results.add(
+                "endpoint",
+                {
+                    **params,
+                    "path": path.split("?")[0] + ("?since" if "?" in path else ""),
+                    "cache": cache,
+                },
+                measure(lambda: client.get(path).data, repeat=repeat, setup=setup, warmup=1),
+            )
+
+
+def _history_store(workdir: str, rows: int, backend: str):
+    from app import history_store
+
+    path = os.path.join(workdir, f"session_history-{rows}.json")
+    aggregates_path = os.path.join(workdir, f"client_aggregates-{rows}.json")
+    generate.write_history(path, rows)
+
+    if backend == "sqlite":
+        store = history_store.SqliteHistoryStore(
+            os.path.join(workdir, f"session_history-{rows}.sqlite3"), import_from=path
+        )
+    else:
+        store = history_store.JsonLinesHistoryStore(path, aggregates_path)
+
+    # Route handlers and the parser use the process-wide store.
+    history_store._stores[backend] = store
+    return store
+
+
+def bench_history(
+    results: Results, workdir: str, rows: int, backend: str, repeat: int, max_full: int
+) -> None:
+    from app import geo_store, history_store, routes
+
+    store = _history_store(workdir, rows, backend)
+    params = {"rows": rows, "backend": backend}
+    heavy = _scaled(repeat, rows, 1000000)
+
+    def consume(iterable):
+        for _ in iterable:
+            pass
+
+    results.add(
+        "history.iter_entries", params, measure(lambda: consume(store.iter_entries()), heavy)
+    )
+    results.add(
+        "history.query_page",
+        params,
+        measure(lambda: store.query(limit=100), repeat=repeat, warmup=1),
+    )
+    results.add(
+        "history.query_name",
+        params,
+        measure(lambda: store.query(name="client000007", limit=100), repeat=repeat, warmup=1),
+    )
+    results.add(
+        "history.totals_scan",
+        params,
+        measure(lambda: history_store.compute_client_totals(store.iter_entries()), heavy),
+    )
+
+    # One more event makes the store write its materialized aggregates.
+    store.append(next(generate.history_entries(1, seed=rows + 1)))
+    results.add(
+        "history.summarize_clients",
+        params,
+        measure(store.summarize_clients, repeat=repeat, warmup=1),
+    )
+
+    with routes.app.test_request_context("/api/clients/summary"):
+        results.add(
+            "aggregate_client_stats",
+            params,
+            measure(routes._aggregate_client_stats, repeat=repeat, warmup=1),
+        )
+
+    geo_path = geo_store.CLIENT_GEO_DB_PATH
+
+    def reset_geo():
+        geo_store.flush_geo_db(force=True)
+        if os.path.exists(geo_path):
+            os.remove(geo_path)
+        geo_store._synced_key = None
+
+    results.add(
+        "sync_geo_db.cold",
+        params,
+        measure(lambda: geo_store.sync_geo_db(store), 1, setup=reset_geo),
+    )
+    results.add(
+        "sync_geo_db.unchanged",
+        params,
+        measure(lambda: geo_store.sync_geo_db(store), heavy),
+    )
+
+    client = routes.app.test_client()
+    results.add(
+        "endpoint",
+        {**params, "path": "/api/history?limit=1000"},
+        measure(lambda: client.get("/api/history?limit=1000").data, repeat=repeat, warmup=1),
+    )
+    if rows <= max_full:
+        results.add(
+            "endpoint",
+            {**params, "path": "/api/history"},
+            measure(lambda: client.get("/api/history").data, heavy),
+        )
+    for cache in ("cold", "warm"):
+        setup = routes._response_cache.clear if cache == "cold" else None
+        results.add(
+            "endpoint",
+            {**params, "path": "/api/clients/summary", "cache": cache},
+            measure(
+                lambda: client.get("/api/clients/summary").data,
+                repeat=repeat,
+                setup=setup,
+                warmup=1,
+            ),
+        )
+
+
+def run(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    _configure(workdir, args.backend)
+
+    results = Results(
+        {
+            "clients": args.clients,
+            "history": args.history,
+            "formats": args.formats,
+            "backend": args.backend,
+            "repeat": args.repeat,
+        }
+    )
+    for count in args.clients:
+        for version in args.formats:
+            bench_clients(results, workdir, count, version, args.repeat)
+    for rows in args.history:
+        bench_history(results, workdir, rows, args.backend, args.repeat, args.max_full_history)
+    return results.to_dict()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the performance benchmarks.")
+    parser.add_argument("--clients", type=_sizes, default=[100, 1000, 10000])
+    parser.add_argument("--history", type=_sizes, default=[10000, 100000, 1000000])
+    parser.add_argument("--formats", type=_sizes, default=[1, 3])
+    parser.add_argument("--backend", choices=("jsonl", "sqlite"), default="jsonl")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--max-full-history",
+        type=int,
+        default=100000,
+        help="largest history streamed in full through /api/history",
+    )
+    parser.add_argument("--quick", action="store_true", help="small sizes for a smoke run")
+    parser.add_argument("--output", help="write results here instead of stdout")
+    parser.add_argument("--workdir", help="keep generated files in this directory")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.clients = [100, 1000]
+        args.history = [10000]
+        args.repeat = min(args.repeat, 3)
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        document = run(args, os.path.abspath(args.workdir))
+    else:
+        with tempfile.TemporaryDirectory(prefix="openvpn-monitor-bench-") as workdir:
+            document = run(args, workdir)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(document, fh, indent=2)
+            fh.write("\n")
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+# compact_history.py
+"""Move session history older than the retention period into the archive.
+
+Safe to run while the logger is writing, e.g. once a day from cron.
+"""
+
+import argparse
+import logging
+
+from app.config import HISTORY_RETENTION_DAYS
+from app.history_store import get_history_store
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--days",
+        type=float,
+        default=HISTORY_RETENTION_DAYS,
+        help="keep this many days in the history log (default: OPENVPN_HISTORY_RETENTION_DAYS)",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+
+    store = get_history_store()
+    if store.backend != "jsonl":
+        print(f"The {store.backend} history backend is indexed; nothing to compact.")
+        return 0
+
+    archived = store.compact(args.days)
+    print(f"Archived {archived} history events older than {args.days:g} days.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
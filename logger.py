@@ -1,9 +1,6 @@
 # logger.py
-import time
-from app.parser import parse_status_log
+from app.collector import run_collector
 
 if __name__ == "__main__":
     print("OpenVPN background logger started...")
-    while True:
-        parse_status_log()
-        time.sleep(10)
+    run_collector()
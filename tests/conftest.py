@@ -0,0 +1,89 @@
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+# Every file the app reads or writes, as environment variable -> name in tmp_path.
+DATA_FILES = {
+    "OPENVPN_STATUS_LOG": "status.log",
+    "OPENVPN_HISTORY_LOG": "history.json",
+    "OPENVPN_HISTORY_DB": "history.sqlite3",
+    "OPENVPN_HISTORY_AGGREGATES": "client_aggregates.json",
+    "OPENVPN_ACTIVE_SESSIONS": "active_sessions.json",
+    "OPENVPN_SERVER_STATUS": "server_status.json",
+    "OPENVPN_CLIENT_GEO_DB": "client_geo.json",
+    "OPENVPN_CLIENT_SNAPSHOT": "client_snapshot.json",
+    "OPENVPN_CLIENT_RATES": "client_rates.json",
+    "OPENVPN_ROLLUPS_DB": "traffic_rollups.sqlite3",
+    "OPENVPN_COLLECTOR_METRICS": "collector_metrics.json",
+}
+
+# Settings that would otherwise leak in from the environment running the tests.
+DEFAULT_ENV = {
+    "OPENVPN_INSTANCES": "",
+    "OPENVPN_GEOIP_DB": "",
+    "OPENVPN_MANAGEMENT": "",
+    "OPENVPN_TIMING": None,
+}
+
+# Configuration is bound at import time, so every module is reloaded after
+# the modules it imports names from.
+APP_MODULES = (
+    "fileutil",
+    "timeutil",
+    "timing",
+    "history_archive",
+    "history_store",
+    "geoip",
+    "geo_store",
+    "geo_clusters",
+    "metrics",
+    "parser",
+    "snapshot",
+    "rates",
+    "rollups",
+    "status_watcher",
+    "instances",
+    "management",
+    "collector",
+    "routes",
+)
+
+
+@pytest.fixture
+def app_env(tmp_path, monkeypatch):
+    """Configure the app for ``tmp_path`` and reload it.
+
+    Call the fixture with environment overrides (``None`` unsets a
+    variable); the ``app`` modules imported afterwards see the new settings.
+    Returns ``tmp_path``.
+    """
+
+    def configure(**env):
+        settings = {var: str(tmp_path / name) for var, name in DATA_FILES.items()}
+        settings.update(DEFAULT_ENV)
+        settings.update(env)
+        for var, value in settings.items():
+            if value is None:
+                monkeypatch.delenv(var, raising=False)
+            else:
+                monkeypatch.setenv(var, str(value))
+
+        from app import config
+
+        importlib.reload(config)
+        for name in APP_MODULES:
+            importlib.reload(importlib.import_module(f"app.{name}"))
+
+        from app import routes
+
+        routes.app.config.update(TESTING=True)
+        return tmp_path
+
+    return configure
@@ -0,0 +1,65 @@
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture
+def fileutil(app_env):
+    app_env()
+
+    from app import fileutil
+
+    return fileutil
+
+
+def _version(data):
+    return data["version"] if isinstance(data, dict) else 0
+
+
+def test_load_cached_json_rereads_only_changed_files(fileutil, tmp_path, monkeypatch):
+    path = tmp_path / "state.json"
+    assert fileutil.load_cached_json(str(path), _version) == 0
+
+    path.write_text(json.dumps({"version": 1}))
+    assert fileutil.load_cached_json(str(path), _version) == 1
+
+    reads = []
+    real_open = open
+
+    def counting_open(file, *args, **kwargs):
+        reads.append(file)
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", counting_open)
+    assert fileutil.load_cached_json(str(path), _version) == 1
+    assert reads == []
+
+    path.write_text(json.dumps({"version": 22}))
+    assert fileutil.load_cached_json(str(path), _version) == 22
+    assert len(reads) == 1
+
+    path.write_text("{not json")
+    assert fileutil.load_cached_json(str(path), _version) == 0
+
+
+def test_atomic_write_json_replaces_the_file_and_primes_the_cache(fileutil, tmp_path, monkeypatch):
+    path = tmp_path / "nested" / "state.json"
+
+    key = fileutil.atomic_write_json(str(path), {"version": 3}, build=_version, fsync=True)
+    assert key == fileutil.stat_key(str(path))
+    assert json.loads(path.read_text()) == {"version": 3}
+    assert os.listdir(path.parent) == ["state.json"]
+
+    monkeypatch.setattr("builtins.open", None)
+    assert fileutil.load_cached_json(str(path), _version) == 3
+
+
+def test_file_version_changes_on_rewrite(fileutil, tmp_path):
+    path = tmp_path / "state.json"
+    assert fileutil.file_version(str(path)) == "0"
+
+    fileutil.atomic_write_json(str(path), {"version": 1})
+    first = fileutil.file_version(str(path))
+    fileutil.atomic_write_json(str(path), {"version": 1})
+    assert fileutil.file_version(str(path)) not in ("0", first)
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+
+def _ip_record(ip, lat, lon, city):
+    return {
+        "ip": ip,
+        "vpn_ipv4": [],
+        "vpn_ipv6": [],
+        "location": {"latitude": lat, "longitude": lon, "city": city, "country": ""},
+        "first_seen": None,
+        "last_seen": None,
+    }
+
+
+GEO_DB = {
+    "clients": {
+        "alice": {
+            "name": "alice",
+            "ips": {
+                "81.2.69.1": _ip_record("81.2.69.1", 51.50, -0.12, "London"),
+                "81.2.69.2": _ip_record("81.2.69.2", 51.52, -0.10, "London"),
+            },
+        },
+        "bob": {
+            "name": "bob",
+            "ips": {
+                "81.2.69.2": _ip_record("81.2.69.2", 51.52, -0.10, "London"),
+                "2.2.2.2": _ip_record("2.2.2.2", 48.85, 2.35, "Paris"),
+                "10.0.0.1": _ip_record("10.0.0.1", None, None, ""),
+            },
+        },
+        "carol": {
+            "name": "carol",
+            "ips": {"3.3.3.3": _ip_record("3.3.3.3", -33.87, 151.21, "Sydney")},
+        },
+    },
+    "updated_at": None,
+}
+
+
+@pytest.fixture
+def clusters_env(app_env, tmp_path):
+    geo_path = tmp_path / "client_geo.json"
+    geo_path.write_text(json.dumps(GEO_DB))
+    app_env()
+
+    from app import geo_clusters, routes
+
+    return geo_clusters, routes.app.test_client(), geo_path
+
+
+def test_clusters_merge_nearby_points_by_zoom(clusters_env):
+    geo_clusters, _, _ = clusters_env
+    index = geo_clusters.get_cluster_index()
+
+    assert sorted(cluster["count"] for cluster in index.level(0)) == [1, 1, 2]
+    london = [c for c in index.level(8) if c["count"] == 2]
+    assert len(london) == 1
+    assert london[0]["bounds"] == [51.50, -0.12, 51.52, -0.10]
+    assert london[0]["latitude"] == pytest.approx(51.51)
+
+    singles = [c for c in index.level(14) if c["count"] == 1]
+    assert {c["ip"] for c in singles} == {"81.2.69.1", "81.2.69.2", "2.2.2.2", "3.3.3.3"}
+    shared = next(c for c in singles if c["ip"] == "81.2.69.2")
+    assert shared["clients"] == ["alice", "bob"]
+
+    # Built once per zoom level and database version.
+    assert index.level(8) is index.level(8)
+    assert geo_clusters.get_cluster_index() is index
+
+
+def test_clusters_endpoint_filters_by_bbox_and_client(clusters_env):
+    _, client, geo_path = clusters_env
+
+    payload = client.get("/api/geo/clusters?zoom=5&bbox=-10,40,10,60").get_json()
+    assert payload["zoom"] == 5
+    assert payload["total"] == 3
+    assert all(c["latitude"] > 40 for c in payload["clusters"])
+
+    # Panned across the antimeridian: west > east after normalization.
+    payload = client.get("/api/geo/clusters?zoom=3&bbox=140,-50,200,0").get_json()
+    assert [c["city"] for c in payload["clusters"]] == ["Sydney"]
+
+    payload = client.get("/api/geo/clusters?zoom=14&client=bob").get_json()
+    assert sorted(c["ip"] for c in payload["clusters"]) == ["2.2.2.2", "81.2.69.2"]
+
+    for query in ("zoom=25", "zoom=x", "bbox=1,2,3", "bbox=0,10,5,0"):
+        response = client.get(f"/api/geo/clusters?{query}")
+        assert response.status_code == 400, query
+        assert response.get_json()["error"]["code"] == "bad_request"
+
+    # A new geo DB version rebuilds the index.
+    data = json.loads(geo_path.read_text())
+    del data["clients"]["carol"]
+    geo_path.write_text(json.dumps(data))
+    assert client.get("/api/geo/clusters?zoom=0").get_json()["total"] == 3
@@ -0,0 +1,107 @@
+import json
+import os
+
+import pytest
+
+GEOIP_CSV = """start,end,latitude,longitude,city,country
+81.2.69.0,81.2.69.255,51.51,-0.13,London,United Kingdom
+1.0.0.0,1.0.0.255,-33.49,143.21,,Australia
+2a02:ec0::/29,,48.85,2.35,Paris,France
+1364349696,1364349951,52.37,4.89,Amsterdam,Netherlands
+not-an-ip,,0,0,Nowhere,
+"""
+
+
+@pytest.fixture
+def geo_env(app_env, tmp_path):
+    geoip_path = tmp_path / "geoip.csv"
+    geoip_path.write_text(GEOIP_CSV)
+    app_env(OPENVPN_GEOIP_DB=geoip_path)
+
+    from app import geo_store, geoip, routes
+
+    return geoip, geo_store, routes.app.test_client(), geoip_path
+
+
+def test_csv_ranges_are_looked_up_with_bisect(geo_env):
+    geoip, _, _, _ = geo_env
+
+    assert geoip.lookup("81.2.69.142") == {
+        "latitude": 51.51,
+        "longitude": -0.13,
+        "city": "London",
+        "country": "United Kingdom",
+    }
+    assert geoip.lookup("1.0.0.1")["country"] == "Australia"
+    assert geoip.lookup("2a02:ec0::1")["city"] == "Paris"
+    assert geoip.lookup("81.82.83.84")["city"] == "Amsterdam"
+    assert len(geoip.get_resolver()) == 4
+
+    assert geoip.lookup("81.2.70.1") is None
+    assert geoip.lookup("10.8.0.2") is None
+    assert geoip.lookup("garbage") is None
+
+
+def test_resolver_reloads_when_the_database_changes(geo_env):
+    geoip, _, _, geoip_path = geo_env
+
+    assert geoip.lookup("8.8.8.8") is None
+    geoip_path.write_text(GEOIP_CSV + "8.8.8.0/24,,37.75,-97.82,,United States\n")
+    os.utime(geoip_path, ns=(1, 1))
+
+    assert geoip.lookup("8.8.8.8")["country"] == "United States"
+
+
+def test_history_ingestion_fills_geo_db_locations(geo_env, tmp_path):
+    _, geo_store, client, _ = geo_env
+
+    history = [
+        {"name": "alice", "ip": "81.2.69.142", "timestamp": "2024-01-01 12:00:00"},
+        {"name": "bob", "ip": "10.0.0.5", "timestamp": "2024-01-01 12:00:00"},
+    ]
+    (tmp_path / "history.json").write_text(
+        "".join(json.dumps({**entry, "session_id": entry["name"]}) + "\n" for entry in history)
+    )
+    assert geo_store.sync_geo_db() == 2
+
+    assert geo_store.known_locations() == {
+        "81.2.69.142": {
+            "latitude": 51.51,
+            "longitude": -0.13,
+            "city": "London",
+            "country": "United Kingdom",
+        }
+    }
+    assert client.get("/api/geo/locations").get_json() == {"locations": geo_store.known_locations()}
+
+    payload = client.get("/api/geo/locations?ip=2a02:ec0::1&ip=192.168.1.1").get_json()
+    assert list(payload["locations"]) == ["2a02:ec0::1"]
+    assert payload["locations"]["2a02:ec0::1"]["city"] == "Paris"
+
+    too_many = "&".join(f"ip=1.0.{n // 256}.{n % 256}" for n in range(1001))
+    response = client.get(f"/api/geo/locations?{too_many}")
+    assert response.status_code == 400
+    assert response.get_json()["error"]["code"] == "bad_request"
+
+
+def test_sigterm_flushes_pending_geo_changes(geo_env, tmp_path, monkeypatch):
+    _, geo_store, _, _ = geo_env
+    from app import collector
+
+    (tmp_path / "history.json").write_text(
+        '{"name": "alice", "ip": "81.2.69.142", "timestamp": "2024-01-01 12:00:00", '
+        '"session_id": "s1"}\n'
+    )
+    geo_path = tmp_path / "client_geo.json"
+    geo_store.sync_geo_db()
+    assert "alice" not in json.loads(geo_path.read_text())["clients"]
+
+    handlers = {}
+    monkeypatch.setattr(
+        collector.signal, "signal", lambda sig, handler: handlers.update({sig: handler})
+    )
+    collector._install_shutdown_handler()
+
+    with pytest.raises(SystemExit):
+        handlers[collector.signal.SIGTERM](collector.signal.SIGTERM, None)
+    assert "alice" in json.loads(geo_path.read_text())["clients"]
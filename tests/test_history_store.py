@@ -0,0 +1,374 @@
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def history_store(app_env, tmp_path):
+    app_env()
+
+    from app import history_store
+
+    return history_store, tmp_path / "history.json"
+
+
+def _entry(session_id, **overrides):
+    entry = {
+        "timestamp": "2024-01-01 09:00:00",
+        "name": "alice",
+        "ip": "198.51.100.10",
+        "session_id": session_id,
+        "rx": None,
+        "tx": None,
+        "vpn_ip": "10.8.0.5",
+        "vpn_ipv4": "10.8.0.5",
+        "vpn_ipv6": None,
+        "port": "443",
+        "session_end": None,
+    }
+    entry.update(overrides)
+    return entry
+
+
+def test_append_writes_one_line_per_event(history_store):
+    store, history_path = history_store
+
+    store.append_history_entry(_entry("s1"), str(history_path))
+    store.append_history_entry(_entry("s2", name="bob"), str(history_path))
+
+    lines = history_path.read_text().splitlines()
+    assert [json.loads(line)["session_id"] for line in lines] == ["s1", "s2"]
+    assert [e["name"] for e in store.iter_history_entries(str(history_path))] == ["alice", "bob"]
+
+
+def test_legacy_array_is_migrated_on_first_append(history_store):
+    store, history_path = history_store
+
+    history_path.write_text(json.dumps([_entry("old-1"), _entry("old-2")], indent=2) + "\n")
+
+    assert [e["session_id"] for e in store.iter_history_entries(str(history_path))] == [
+        "old-1",
+        "old-2",
+    ]
+
+    store.append_history_entry(_entry("new-1"), str(history_path))
+
+    lines = history_path.read_text().splitlines()
+    assert [json.loads(line)["session_id"] for line in lines] == ["old-1", "old-2", "new-1"]
+    assert store.migrate_legacy_history(str(history_path)) is False
+
+
+def test_reader_skips_corrupt_and_incomplete_lines(history_store):
+    store, history_path = history_store
+
+    history_path.write_text(
+        json.dumps(_entry("s1")) + "\n" + "{not json\n" + '{"session_id": "partial"'
+    )
+
+    entries = list(store.iter_history_entries(str(history_path)))
+    assert [e["session_id"] for e in entries] == ["s1"]
+
+
+def _sample_history():
+    return [
+        _entry("s1"),
+        _entry("s1", rx=1.5, tx=2.0, session_end="2024-01-01 10:00:00"),
+        _entry("s2", timestamp="2024-01-02 11:00:00"),
+        _entry(
+            "s2",
+            timestamp="2024-01-02 11:00:00",
+            rx=3.0,
+            tx=4.0,
+            session_end="2024-01-02 11:30:00",
+        ),
+        _entry("s3", name="bob", timestamp="2024-01-03 08:00:00"),
+    ]
+
+
+def test_sqlite_store_upserts_and_uses_indexes(history_store, tmp_path):
+    store_module, _ = history_store
+    store = store_module.SqliteHistoryStore(str(tmp_path / "history.sqlite3"), import_from=None)
+
+    for entry in _sample_history():
+        store.append(entry)
+    store.append(_entry("s1", rx=1.5, tx=2.0, session_end="2024-01-01 10:00:00"))
+
+    conn = store._connect()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(history)")}
+    assert {
+        "idx_history_name",
+        "idx_history_timestamp",
+        "idx_history_session_id",
+        "idx_history_session_end",
+    } <= indexes
+
+    assert len(list(store.iter_entries())) == 5
+    assert [e["session_id"] for e in store.iter_entries(name="bob")] == ["s3"]
+    assert [e["session_id"] for e in store.iter_entries(start="2024-01-02 00:00:00")] == [
+        "s2",
+        "s2",
+        "s3",
+    ]
+
+
+def test_sqlite_store_imports_jsonl_and_matches_summary(history_store, tmp_path):
+    store_module, history_path = history_store
+
+    for entry in _sample_history():
+        store_module.append_history_entry(entry, str(history_path))
+
+    jsonl = store_module.JsonLinesHistoryStore(str(history_path))
+    sqlite = store_module.SqliteHistoryStore(
+        str(tmp_path / "history.sqlite3"), import_from=str(history_path)
+    )
+
+    assert list(sqlite.iter_entries()) == list(jsonl.iter_entries())
+    assert sqlite.summarize_clients() == jsonl.summarize_clients()
+    assert jsonl.summarize_clients()["alice"] == {
+        "sessions": 2,
+        "total_rx_mb": 4.5,
+        "total_tx_mb": 6.0,
+        "total_duration_seconds": 5400,
+        "last_seen": "2024-01-02 11:30:00",
+    }
+
+
+def test_jsonl_store_maintains_client_aggregates(history_store, tmp_path, monkeypatch):
+    store_module, history_path = history_store
+    aggregates_path = tmp_path / "client_aggregates.json"
+
+    writes = []
+    write = store_module.atomic_write_json
+    monkeypatch.setattr(
+        store_module,
+        "atomic_write_json",
+        lambda path, *a, **kw: writes.append(path) or write(path, *a, **kw),
+    )
+
+    store = store_module.JsonLinesHistoryStore(str(history_path), str(aggregates_path))
+    for entry in _sample_history():
+        store.append(entry)
+    # Only the two disconnects rewrite the sidecar.
+    assert writes == [str(aggregates_path)] * 2
+
+    # A repeated disconnect is dropped, also by a restarted store.
+    repeated = _entry("s1", rx=1.5, tx=2.0, session_end="2024-01-01 10:00:00")
+    store.append(repeated)
+    store_module.JsonLinesHistoryStore(str(history_path), str(aggregates_path)).append(repeated)
+    assert len(history_path.read_text().splitlines()) == 5
+    assert len(writes) == 2
+
+    expected = store_module.compute_client_totals(store.iter_entries())
+    assert expected["alice"]["sessions"] == 2
+    assert set(json.loads(aggregates_path.read_text())["clients"]) == {"alice"}
+
+    def _no_scan(*args, **kwargs):
+        raise AssertionError("summary must not scan the history")
+
+    monkeypatch.setattr(store_module, "iter_history_entries", _no_scan)
+    # bob's connect, appended after the last sidecar write, is caught up.
+    assert store.summarize_clients() == expected
+    monkeypatch.undo()
+
+    # A history rewritten behind the store's back invalidates the sidecar.
+    history_path.write_text(json.dumps(_entry("s9", name="carol")) + "\n")
+    assert set(store.summarize_clients()) == {"carol"}
+
+
+def test_sqlite_store_maintains_client_aggregates(history_store, tmp_path):
+    store_module, _ = history_store
+    store = store_module.SqliteHistoryStore(str(tmp_path / "history.sqlite3"), import_from=None)
+
+    for entry in _sample_history():
+        store.append(entry)
+    # Re-recording a known event must not be counted twice.
+    store.append(_entry("s1", rx=1.5, tx=2.0, session_end="2024-01-01 10:00:00"))
+
+    assert store.summarize_clients() == store_module.compute_client_totals(store.iter_entries())
+
+
+def _paginate(store, **query):
+    pages = []
+    cursor = None
+    while True:
+        entries, cursor = store.query(cursor=cursor, **query)
+        pages.append([(e["session_id"], e["session_end"] is not None) for e in entries])
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite", "legacy", "archived"])
+def test_query_pages_newest_first(history_store, tmp_path, backend):
+    store_module, history_path = history_store
+
+    if backend == "archived":
+        store = store_module.JsonLinesHistoryStore(str(history_path), None)
+        for entry in _sample_history():
+            store.append(entry)
+        # s1 moves to the archive, s2 and s3 stay in the log.
+        assert store.compact(1, now=datetime(2024, 1, 3)) == 2
+    elif backend == "legacy":
+        history_path.write_text(json.dumps(_sample_history()))
+        store = store_module.JsonLinesHistoryStore(str(history_path), None)
+    elif backend == "jsonl":
+        store = store_module.JsonLinesHistoryStore(str(history_path), None)
+        for entry in _sample_history():
+            store.append(entry)
+    else:
+        store = store_module.SqliteHistoryStore(str(tmp_path / "h.sqlite3"), import_from=None)
+        for entry in _sample_history():
+            store.append(entry)
+
+    assert _paginate(store, limit=2) == [
+        [("s3", False), ("s2", True)],
+        [("s2", False), ("s1", True)],
+        [("s1", False)],
+    ]
+    assert _paginate(store, name="alice", start="2024-01-02 00:00:00", limit=5) == [
+        [("s2", True), ("s2", False)]
+    ]
+    assert _paginate(store, end="2024-01-01 23:59:59") == [[("s1", True), ("s1", False)]]
+
+    if backend != "legacy":
+        # Events appended after the index was built show up in the next query.
+        store.append(_entry("s4", name="dave", timestamp="2024-01-04 08:00:00"))
+        assert store.query(limit=1)[0][0]["session_id"] == "s4"
+
+    with pytest.raises(ValueError):
+        store.query(cursor="not-a-cursor")
+
+
+def test_query_reads_one_log_version(history_store):
+    store_module, history_path = history_store
+
+    store = store_module.JsonLinesHistoryStore(str(history_path), None)
+    for entry in _sample_history():
+        store.append(entry)
+
+    # A lazily read result keeps reading the log it was indexed from.
+    entries, _ = store.query()
+    history_path.unlink()
+    history_path.write_text(json.dumps(_entry("new")) + "\n")
+    assert [e["session_id"] for e in entries] == ["s3", "s2", "s2", "s1", "s1"]
+
+    for entry in _sample_history():
+        store.append({**entry, "session_id": entry["session_id"] + "-again"})
+    _, cursor = store.query(limit=2)
+    assert store.query(limit=2, cursor=cursor)[0]
+
+    # Compaction rewrites the log, so byte offsets of older cursors are stale.
+    assert store.compact(1, now=datetime(2024, 1, 3)) == 3
+    with pytest.raises(ValueError, match="stale cursor"):
+        store.query(limit=2, cursor=cursor)
+
+
+def test_compact_moves_old_events_into_monthly_segments(history_store, tmp_path, monkeypatch):
+    store_module, history_path = history_store
+    archive_dir = tmp_path / "history_archive"
+
+    store = store_module.JsonLinesHistoryStore(
+        str(history_path), str(tmp_path / "client_aggregates.json")
+    )
+    assert store.archive.directory == str(archive_dir)
+    for entry in (
+        _entry("a1", timestamp="2024-01-10 09:00:00"),
+        _entry("a1", timestamp="2024-01-10 09:00:00", session_end="2024-01-10 10:00:00", rx=2),
+        _entry("b1", name="bob", timestamp="2024-02-05 09:00:00"),
+        _entry("c1", name="carol", timestamp="2024-06-20 09:00:00"),
+    ):
+        store.append(entry)
+    version = store.version()
+
+    # The collector keeps appending while the archive is written.
+    prepare = store.archive.prepare
+
+    def prepare_while_writing(events):
+        segments = prepare(events)
+        store.append(_entry("d1", name="dave", timestamp="2024-06-29 09:00:00"))
+        return segments
+
+    monkeypatch.setattr(store.archive, "prepare", prepare_while_writing)
+    assert store.compact(90, now=datetime(2024, 6, 30, 12, 0, 0)) == 3
+    monkeypatch.undo()
+
+    hot = [json.loads(line)["session_id"] for line in history_path.read_text().splitlines()]
+    assert hot == ["c1", "d1"]
+    manifest = store.archive.manifest()
+    assert [(s["month"], s["count"], s["start"]) for s in manifest["segments"]] == [
+        ("2024-01", 2, "2024-01-10 09:00:00"),
+        ("2024-02", 1, "2024-02-05 09:00:00"),
+    ]
+    with gzip.open(archive_dir / manifest["segments"][1]["file"], "rt") as fh:
+        assert [json.loads(line)["session_id"] for line in fh] == ["b1"]
+
+    assert store.version() != version
+    assert [e["session_id"] for e in store.iter_entries()] == ["a1", "a1", "b1", "c1", "d1"]
+    # Totals still cover the archived events and the sidecar is still current.
+    assert store._read_aggregates() == store_module.compute_client_totals(store.iter_entries())
+    assert store.summarize_clients()["alice"]["total_rx_mb"] == 2
+
+    # A range query only decompresses the segments it overlaps.
+    opened = []
+    entries = store.archive.entries
+
+    def recording_entries(segment):
+        opened.append(segment["month"])
+        return entries(segment)
+
+    monkeypatch.setattr(store.archive, "entries", recording_entries)
+    page, _ = store.query(start="2024-02-01 00:00:00", end="2024-03-31 23:59:59", limit=10)
+    assert [e["session_id"] for e in page] == ["b1"]
+    assert opened == ["2024-02"]
+    # The newest page does not touch the archive at all.
+    opened.clear()
+    page, cursor = store.query(limit=1)
+    assert [e["session_id"] for e in page] == ["d1"]
+    assert opened == []
+    page, _ = store.query(limit=3, cursor=cursor)
+    assert [e["session_id"] for e in page] == ["c1", "b1", "a1"]
+    assert opened == ["2024-02", "2024-01"]
+    monkeypatch.undo()
+
+    # Later old events replace the month's segment; events already archived
+    # (an interrupted compaction) are not archived twice.
+    january = manifest["segments"][0]["file"]
+    store.append(_entry("a2", timestamp="2024-01-20 09:00:00"))
+    store.append(_entry("a1", timestamp="2024-01-10 09:00:00"))
+    assert store.compact(90, now=datetime(2024, 6, 30, 12, 0, 0)) == 2
+    manifest = store.archive.manifest()
+    assert [(s["month"], s["count"]) for s in manifest["segments"]] == [
+        ("2024-01", 3),
+        ("2024-02", 1),
+    ]
+    assert manifest["segments"][0]["file"] != january
+    assert [item["file"] for item in manifest["retired"]] == [january]
+    # Retired segments outlive readers of the previous manifest, then go.
+    assert (archive_dir / january).exists()
+    store.archive.publish([], now=time.time() + 7200)
+    assert not (archive_dir / january).exists()
+    assert store.archive.manifest()["retired"] == []
+
+    assert store.compact(90, now=datetime(2024, 6, 30, 12, 0, 0)) == 0
+    assert store.compact(0) == 0
+    assert sorted(os.listdir(archive_dir)) == sorted(
+        [".lock", "manifest.json"] + [s["file"] for s in manifest["segments"]]
+    )
+
+
+def test_sidecar_and_archive_default_next_to_the_log(app_env, tmp_path):
+    log_dir = tmp_path / "history"
+    app_env(
+        OPENVPN_HISTORY_LOG=log_dir / "session_history.json",
+        OPENVPN_HISTORY_AGGREGATES=None,
+        OPENVPN_HISTORY_ARCHIVE=None,
+    )
+
+    from app import config
+
+    assert config.HISTORY_AGGREGATES_PATH == str(log_dir / "client_aggregates.json")
+    assert config.HISTORY_ARCHIVE_DIR == str(log_dir / "history_archive")
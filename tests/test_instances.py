@@ -0,0 +1,81 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture
+def collector_env(app_env, tmp_path):
+    app_env(
+        OPENVPN_INSTANCES=f"udp={tmp_path / 'udp-status.log'}; tcp={tmp_path / 'tcp-status.log'}"
+    )
+
+    from app import collector, instances, snapshot
+
+    return collector, instances, snapshot, tmp_path
+
+
+def _status(*names):
+    lines = ["Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since"]
+    lines += [f"{name},198.51.100.10:1194,1024,2048,2024-01-01 12:00:00" for name in names]
+    lines += ["ROUTING TABLE", "GLOBAL STATS"]
+    return "\n".join(lines) + "\n"
+
+
+def test_parse_instances(collector_env):
+    _, instances, _, tmp_path = collector_env
+
+    parsed = instances.parse_instances()
+    assert [(i.name, Path(i.status_path).name, Path(i.sessions_path).name) for i in parsed] == [
+        ("udp", "udp-status.log", "active_sessions.udp.json"),
+        ("tcp", "tcp-status.log", "active_sessions.tcp.json"),
+    ]
+
+    (default,) = instances.parse_instances("")
+    assert default.name == ""
+    assert default.sessions_path == str(tmp_path / "active_sessions.json")
+
+    for bad in ("udp", "udp=", "bad name=/tmp/x", "a=/x;a=/y"):
+        with pytest.raises(ValueError):
+            instances.parse_instances(bad)
+
+
+def test_collect_once_merges_instances_in_parallel(collector_env):
+    collector, instances, snapshot, tmp_path = collector_env
+
+    (tmp_path / "udp-status.log").write_text(_status("alice", "bob"))
+    (tmp_path / "tcp-status.log").write_text(_status("alice"))
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        published = collector.collect_once(instances.parse_instances(), executor)
+
+    assert [snapshot.client_key(c) for c in published.clients] == [
+        "udp/alice",
+        "udp/bob",
+        "tcp/alice",
+    ]
+
+    # Each instance keeps its own session state.
+    assert set(json.loads((tmp_path / "active_sessions.udp.json").read_text())) == {"alice", "bob"}
+    assert set(json.loads((tmp_path / "active_sessions.tcp.json").read_text())) == {"alice"}
+
+    # alice leaving the TCP instance closes only that session.
+    (tmp_path / "tcp-status.log").write_text(_status())
+    published = collector.collect_once(instances.parse_instances())
+    assert [snapshot.client_key(c) for c in published.clients] == ["udp/alice", "udp/bob"]
+
+    history = [
+        json.loads(line) for line in (tmp_path / "history.json").read_text().splitlines() if line
+    ]
+    closed = [e["name"] for e in history if e["session_end"]]
+    assert closed == ["alice"]
+    assert len(history) == 4
+
+    # The collector feeds the geolocation DB as sessions open and close.
+    from app import geo_store
+
+    geo_store.flush_geo_db(force=True)
+    geo = json.loads((tmp_path / "client_geo.json").read_text())
+    assert set(geo["clients"]) == {"alice", "bob"}
+    assert geo["clients"]["alice"]["last_seen"] == history[-1]["timestamp"]
@@ -0,0 +1,234 @@
+import datetime
+import json
+import socket
+import threading
+
+import pytest
+
+
+class FakeManagementServer:
+    """Minimal scripted OpenVPN management interface on a local TCP port."""
+
+    def __init__(self, password=None):
+        self.password = password
+        self.status = []
+        self.after_bytecount = []
+        self.commands = []
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen(1)
+        self.address = "127.0.0.1:%d" % self._listener.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        conn, _ = self._listener.accept()
+        reader = conn.makefile("r", encoding="utf-8", newline="\n")
+        if self.password is not None:
+            conn.sendall(b"ENTER PASSWORD:")
+            if reader.readline().strip() != self.password:
+                conn.sendall(b"ERROR: bad password\n")
+                conn.close()
+                return
+            conn.sendall(b"SUCCESS: password is correct\n")
+        conn.sendall(b">INFO:OpenVPN Management Interface Version 5\n")
+
+        for line in reader:
+            command = line.strip()
+            self.commands.append(command)
+            if command == "status 3":
+                conn.sendall(("\n".join(self.status) + "\nEND\n").encode())
+            elif command.startswith("bytecount"):
+                reply = ["SUCCESS: bytecount interval changed"] + self.after_bytecount
+                conn.sendall(("\n".join(reply) + "\n").encode())
+            else:
+                conn.sendall(b"SUCCESS: ok\n")
+        conn.close()
+
+    def close(self):
+        self._listener.close()
+
+
+def _status_rows(*clients):
+    rows = [
+        "TITLE\tOpenVPN 2.6.8",
+        "HEADER\tCLIENT_LIST\tCommon Name\tReal Address\tVirtual Address\tVirtual IPv6 Address"
+        "\tBytes Received\tBytes Sent\tConnected Since\tConnected Since (time_t)\tUsername"
+        "\tClient ID\tPeer ID\tData Channel Cipher",
+    ]
+    for name, real, vpn, rx, tx, epoch, cid in clients:
+        rows.append(
+            f"CLIENT_LIST\t{name}\t{real}\t{vpn}\t\t{rx}\t{tx}\t-\t{epoch}"
+            f"\tUNDEF\t{cid}\t0\tAES-256-GCM"
+        )
+    rows.append("HEADER\tROUTING_TABLE\tVirtual Address\tCommon Name\tReal Address\tLast Ref")
+    for name, real, vpn, *_ in clients:
+        rows.append(f"ROUTING_TABLE\t{vpn}\t{name}\t{real}\t-")
+    rows.append("GLOBAL_STATS\tMax bcast/mcast queue length\t0")
+    return rows
+
+
+def _env_event(header, **env):
+    lines = [header]
+    lines.extend(f">CLIENT:ENV,{key}={value}" for key, value in env.items())
+    lines.append(">CLIENT:ENV,END")
+    return lines
+
+
+@pytest.fixture
+def collector_env(app_env, tmp_path):
+    app_env(OPENVPN_MONITOR_TZ="UTC")
+
+    from app import collector, management, snapshot
+
+    return collector, management, snapshot, tmp_path
+
+
+def test_parse_management_address():
+    from app import management
+
+    assert management.parse_management_address("127.0.0.1:7505") == (
+        socket.AF_INET,
+        ("127.0.0.1", 7505),
+    )
+    assert management.parse_management_address("[::1]:7505") == (socket.AF_INET6, ("::1", 7505))
+    assert management.parse_management_address("unix:/run/openvpn.sock") == (
+        socket.AF_UNIX,
+        "/run/openvpn.sock",
+    )
+    with pytest.raises(ValueError):
+        management.parse_management_address("localhost")
+
+
+def test_push_events_feed_session_bookkeeping(collector_env):
+    collector, management, snapshot, tmp_path = collector_env
+
+    server = FakeManagementServer(password="secret")
+    alice = ("alice", "198.51.100.10:443", "10.8.0.6", 1024, 2048, 1704099600, 0)
+    server.status = _status_rows(alice)
+    server.after_bytecount = (
+        [">BYTECOUNT_CLI:0,5242880,10485760"]
+        + _env_event(
+            ">CLIENT:CONNECT,1,2",
+            common_name="bob",
+            trusted_ip="203.0.113.5",
+            trusted_port="1194",
+            time_unix="1704103200",
+        )
+        + _env_event(
+            ">CLIENT:ESTABLISHED,1",
+            common_name="bob",
+            trusted_ip="203.0.113.5",
+            trusted_port="1194",
+            ifconfig_pool_remote_ip="10.8.0.10",
+            time_unix="1704103200",
+        )
+        + _env_event(
+            ">CLIENT:DISCONNECT,0",
+            common_name="alice",
+            bytes_received="6291456",
+            bytes_sent="12582912",
+        )
+    )
+
+    try:
+        with management.ManagementClient(server.address, password="secret") as client:
+            source = collector.follow_management(
+                client, resync_interval=60, approve_clients=True, max_batches=1
+            )
+    finally:
+        server.close()
+
+    assert server.commands[:2] == ["status 3", "bytecount 5"]
+    assert "client-auth-nt 1 2" in server.commands
+    assert list(source.clients) == ["1"]
+
+    published = snapshot.load_client_snapshot()
+    assert [
+        (c["common_name"], c["real_ip"], c["port"], c["vpn_ip"]) for c in published.clients
+    ] == [("bob", "203.0.113.5", "1194", "10.8.0.10")]
+    assert published.clients[0]["connected_since"] == "2024-01-01 10:00:00"
+
+    history = [
+        json.loads(line) for line in (tmp_path / "history.json").read_text().splitlines() if line
+    ]
+    assert [(e["name"], e["session_end"] is not None) for e in history] == [
+        ("alice", False),
+        ("bob", False),
+        ("alice", True),
+    ]
+    assert history[0]["timestamp"] == "2024-01-01 09:00:00"
+    assert history[0]["vpn_ipv4"] == "10.8.0.6"
+    # Final counters come from the DISCONNECT notification, not the last bytecount.
+    assert (history[2]["rx"], history[2]["tx"]) == (6.0, 12.0)
+
+    active = json.loads((tmp_path / "active_sessions.json").read_text())
+    assert list(active) == ["bob"]
+
+
+def test_resync_repairs_missed_notifications(collector_env):
+    collector, management, snapshot, tmp_path = collector_env
+
+    server = FakeManagementServer()
+    alice = ("alice", "198.51.100.10:443", "10.8.0.6", 1024, 2048, 1704099600, 0)
+    server.status = _status_rows(alice)
+
+    try:
+        with management.ManagementClient(server.address) as client:
+            source = collector.follow_management(client, resync_interval=60, max_batches=0)
+            assert [c["common_name"] for c in snapshot.load_client_snapshot().clients] == ["alice"]
+
+            # alice left without a notification; the periodic status 3 notices.
+            server.status = _status_rows()
+            collector.follow_management(client, source, resync_interval=0, max_batches=1)
+    finally:
+        server.close()
+
+    assert snapshot.load_client_snapshot().clients == ()
+    history = (tmp_path / "history.json").read_text().splitlines()
+    assert json.loads(history[-1])["session_end"] is not None
+
+
+def test_rejected_password_raises(collector_env):
+    _, management, _, _ = collector_env
+
+    server = FakeManagementServer(password="secret")
+    try:
+        with pytest.raises(management.ManagementError):
+            management.ManagementClient(server.address, password="wrong").connect()
+    finally:
+        server.close()
+
+
+def test_stream_delta_carries_only_the_changed_client(collector_env):
+    _, management, snapshot, _ = collector_env
+
+    from app import routes
+
+    alice = ("alice", "198.51.100.10:443", "10.8.0.6", 1024, 2048, 1704099600, 0)
+    bob = ("bob", "203.0.113.5:1194", "10.8.0.10", 1024, 2048, 1704103200, 1)
+    source = management.ManagementSessionSource()
+    source.load_status(_status_rows(alice, bob))
+    start = datetime.datetime(2024, 1, 1, 12, 0, tzinfo=datetime.timezone.utc)
+    snapshot.publish_snapshot(source.apply(start))
+
+    def next_event(stream):
+        fields = dict(line.split(": ", 1) for line in next(stream).strip().splitlines())
+        return fields["event"], json.loads(fields["data"])
+
+    stream = routes._client_event_stream(poll_interval=0, keepalive_interval=3600)
+    assert next(stream).startswith("retry:")
+    event, data = next_event(stream)
+    assert event == "snapshot"
+    assert [c["common_name"] for c in data["clients"]] == ["alice", "bob"]
+
+    # A batch a minute later in which only bob's counters moved.
+    later = start + datetime.timedelta(minutes=1)
+    source.handle_event(">BYTECOUNT_CLI:1,4096,8192", later)
+    snapshot.publish_snapshot(source.apply(later))
+
+    event, data = next_event(stream)
+    assert event == "delta"
+    assert data["added"] == [] and data["removed"] == []
+    assert [(c["common_name"], c["bytes_received"]) for c in data["changed"]] == [("bob", 4096)]
+    assert data["changed"][0]["connected_since_ts"] is not None
@@ -0,0 +1,78 @@
+import pytest
+
+
+@pytest.fixture
+def metrics_env(app_env, tmp_path):
+    app_env(
+        OPENVPN_INSTANCES=f"udp={tmp_path / 'udp-status.log'}; tcp={tmp_path / 'tcp-status.log'}"
+    )
+
+    from app import collector, parser, routes
+
+    return collector, parser, routes.app.test_client(), tmp_path
+
+
+def _status(*names):
+    lines = ["Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since"]
+    lines += [f"{name},198.51.100.10:1194,1024,2048,2024-01-01 12:00:00" for name in names]
+    lines += ["ROUTING TABLE", "GLOBAL STATS"]
+    return "\n".join(lines) + "\n"
+
+
+def _samples(body):
+    samples = {}
+    for line in body.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            samples[name] = float(value)
+    return samples
+
+
+def test_metrics_expose_snapshot_and_collector_stats(metrics_env, monkeypatch):
+    collector, parser, client, tmp_path = metrics_env
+
+    (tmp_path / "udp-status.log").write_text(_status("alice", "bob"))
+    (tmp_path / "tcp-status.log").write_text(_status("carol"))
+    collector.collect_once()
+
+    def _no_parse(*args, **kwargs):
+        raise AssertionError("/metrics must not parse the status file")
+
+    monkeypatch.setattr(parser, "parse_status_log", _no_parse)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    body = response.get_data(as_text=True)
+    assert "# TYPE openvpn_parse_duration_seconds histogram" in body
+
+    samples = _samples(body)
+    assert samples['openvpn_connected_clients{instance="udp"}'] == 2
+    assert samples['openvpn_connected_clients{instance="tcp"}'] == 1
+    alice_rx = 'openvpn_client_bytes_received_total{instance="udp",common_name="alice"}'
+    assert samples[alice_rx] == 1024
+    assert samples['openvpn_client_bytes_sent_total{instance="tcp",common_name="carol"}'] == 2048
+    assert samples["openvpn_sessions_opened_total"] == 3
+    assert samples["openvpn_sessions_closed_total"] == 0
+    assert samples['openvpn_parse_duration_seconds_count{instance="udp"}'] == 1
+    assert samples['openvpn_parse_duration_seconds_bucket{instance="udp",le="+Inf"}'] == 1
+    assert samples['openvpn_status_file_age_seconds_count{instance="tcp"}'] == 1
+
+    monkeypatch.undo()
+    (tmp_path / "udp-status.log").write_text(_status("alice"))
+    collector.collect_once()
+
+    samples = _samples(client.get("/metrics").get_data(as_text=True))
+    assert samples['openvpn_connected_clients{instance="udp"}'] == 1
+    assert samples["openvpn_sessions_closed_total"] == 1
+    assert samples['openvpn_parse_duration_seconds_count{instance="udp"}'] == 2
+
+
+def test_render_metrics_escapes_label_values(metrics_env):
+    from app import metrics
+
+    body = metrics.render_metrics(
+        [{"common_name": 'a"b\\c', "bytes_received": 5, "bytes_sent": 7}], {}
+    )
+    assert 'openvpn_client_bytes_received_total{instance="",common_name="a\\"b\\\\c"} 5' in body
+    assert "openvpn_sessions_opened_total" not in body
@@ -1,38 +1,24 @@
-import importlib
 import json
-import sys
+import os
 from datetime import datetime as RealDateTime
-from pathlib import Path
 import threading
 import uuid
 
 import pytest
 
 
-PROJECT_ROOT = Path(__file__).resolve().parents[1]
-if str(PROJECT_ROOT) not in sys.path:
-    sys.path.insert(0, str(PROJECT_ROOT))
-
-
 @pytest.fixture
-def parser_module(tmp_path, monkeypatch):
-    status_path = tmp_path / "status.log"
-    history_path = tmp_path / "history.json"
-    active_path = tmp_path / "active_sessions.json"
-
-    monkeypatch.setenv("OPENVPN_STATUS_LOG", str(status_path))
-    monkeypatch.setenv("OPENVPN_HISTORY_LOG", str(history_path))
-    monkeypatch.setenv("OPENVPN_ACTIVE_SESSIONS", str(active_path))
-
-    from app import config
-
-    importlib.reload(config)
+def parser_module(app_env, tmp_path):
+    app_env()
 
     from app import parser
 
-    importlib.reload(parser)
-
-    return parser, status_path, history_path, active_path
+    return (
+        parser,
+        tmp_path / "status.log",
+        tmp_path / "history.json",
+        tmp_path / "active_sessions.json",
+    )
 
 
 def _freeze_time(
@@ -54,19 +40,21 @@ def _freeze_time(
     return FixedDateTime
 
 
+def _read_history(path):
+    return [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+
+
 def test_parse_status_log_handles_ipv6(parser_module, monkeypatch):
     parser, status_path, history_path, active_path = parser_module
 
-    status_path.write_text(
-        """
+    status_path.write_text("""
 Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since
 client1,[2001:db8::1]:443,1024,2048,2024-01-01 12:00:00
 
 ROUTING TABLE
 10.8.0.2,client1
 2001:db8:abcd::100,client1
-""".strip()
-    )
+""".strip())
 
     _freeze_time(monkeypatch, parser, hour=12, minute=10)
 
@@ -86,7 +74,8 @@ ROUTING TABLE
     assert client["vpn_ip"] == "10.8.0.2"
     assert client["vpn_ipv4"] == "10.8.0.2"
     assert client["vpn_ipv6"] == "2001:db8:abcd::100"
-    assert client["time_online"].startswith("0:")
+    # Derived from connected_since per response, so a parse cache hit cannot freeze it.
+    assert "time_online" not in client
 
     with active_path.open() as fh:
         data = json.load(fh)
@@ -96,7 +85,7 @@ ROUTING TABLE
     assert data["client1"]["vpn_ipv4"] == "10.8.0.2"
     assert data["client1"]["vpn_ipv6"] == "2001:db8:abcd::100"
 
-    history_entries = json.loads(history_path.read_text())
+    history_entries = _read_history(history_path)
     assert history_entries == [
         {
             "timestamp": "2024-01-01 12:00:00",
@@ -114,6 +103,133 @@ ROUTING TABLE
     ]
 
 
+@pytest.mark.parametrize("separator", ["\t", ","], ids=["status-version-3", "status-version-2"])
+def test_parse_status_log_reads_header_driven_formats(parser_module, monkeypatch, separator):
+    parser, status_path, history_path, _ = parser_module
+
+    epoch = int(parser.LOCAL_TZ.localize(RealDateTime(2024, 1, 1, 11, 30, 0)).timestamp())
+    rows = [
+        ["TITLE", "OpenVPN 2.6.8 x86_64-pc-linux-gnu"],
+        ["TIME", "2024-01-01 12:00:00", "1704110400"],
+        [
+            "HEADER",
+            "CLIENT_LIST",
+            "Common Name",
+            "Real Address",
+            "Virtual Address",
+            "Virtual IPv6 Address",
+            "Bytes Received",
+            "Bytes Sent",
+            "Connected Since",
+            "Connected Since (time_t)",
+            "Username",
+            "Client ID",
+            "Peer ID",
+            "Data Channel Cipher",
+        ],
+        [
+            "CLIENT_LIST",
+            "client1",
+            "198.51.100.10:1194",
+            "10.8.0.2",
+            "2001:db8:abcd::100",
+            "1024",
+            "2048",
+            "Mon Jan  1 11:30:00 2024",
+            str(epoch),
+            "UNDEF",
+            "7",
+            "0",
+            "AES-256-GCM",
+        ],
+        [
+            "HEADER",
+            "ROUTING_TABLE",
+            "Virtual Address",
+            "Common Name",
+            "Real Address",
+            "Last Ref",
+            "Last Ref (time_t)",
+        ],
+        ["ROUTING_TABLE", "10.8.0.2", "client1", "198.51.100.10:1194", "-", str(epoch)],
+        ["GLOBAL_STATS", "Max bcast/mcast queue length", "0"],
+        ["END"],
+    ]
+    status_path.write_text("\n".join(separator.join(row) for row in rows) + "\n")
+
+    _freeze_time(monkeypatch, parser, hour=12, minute=0)
+
+    clients = parser.parse_status_log(str(status_path))
+
+    assert clients == [
+        {
+            "common_name": "client1",
+            "real_ip": "198.51.100.10",
+            "port": "1194",
+            "bytes_received": 1024,
+            "bytes_sent": 2048,
+            "connected_since": "2024-01-01 11:30:00",
+            "vpn_ip": "10.8.0.2",
+            "vpn_ipv4": "10.8.0.2",
+            "vpn_ipv6": "2001:db8:abcd::100",
+        }
+    ]
+    assert [(e["name"], e["timestamp"]) for e in _read_history(history_path)] == [
+        ("client1", "2024-01-01 11:30:00")
+    ]
+
+
+def test_format_duration_matches_timedelta():
+    from app import parser
+    from datetime import timedelta
+
+    for seconds in (0, 59, 3600, 86399, 86400, 90061, 2 * 86400 + 5, 400 * 86400, -1, -90061):
+        assert parser.format_duration(seconds) == str(timedelta(seconds=seconds))
+
+
+def test_fast_path_matches_strptime_reference(parser_module):
+    parser, _, _, _ = parser_module
+
+    rows = [
+        ("alice", "198.51.100.10:1194", "2024-01-01 11:59:59"),
+        ("bob", "[2001:db8::1]:443", "2023-12-30 08:15:00"),
+        ("carol", "2001:db8::2", "2023-06-01 00:00:00"),
+        ("dave", "vpn.example.net:1194", "2024-01-01 12:00:30"),
+    ]
+    lines = ["Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since\n"]
+    lines += [f"{name},{address},10,20,{since}\n" for name, address, since in rows]
+
+    expected = []
+    for name, address, since in rows:
+        real_ip, port = parser._split_real_address.__wrapped__(address)
+        expected.append(
+            {
+                "common_name": name,
+                "real_ip": real_ip,
+                "port": port,
+                "bytes_received": 10,
+                "bytes_sent": 20,
+                "connected_since": since,
+            }
+        )
+
+    # Cold and warm caches give the same rows.
+    assert parser._parse_status_v1(lines)[0] == expected
+    assert parser._parse_status_v1(lines)[0] == expected
+
+    with pytest.raises(ValueError):
+        parser._parse_status_v1(lines[:1] + ["eve,198.51.100.1:1,1,1,2024-13-01 00:00:00\n"])
+
+
+def test_detect_status_format():
+    from app import parser
+
+    assert parser.detect_status_format("TITLE\tOpenVPN 2.6.8\n") == "\t"
+    assert parser.detect_status_format("TITLE,OpenVPN 2.6.8\n") == ","
+    assert parser.detect_status_format("OpenVPN CLIENT LIST\n") is None
+    assert parser.detect_status_format("") is None
+
+
 def test_parse_status_log_records_disconnect(parser_module, monkeypatch):
     parser, status_path, history_path, active_path = parser_module
 
@@ -132,13 +248,11 @@ def test_parse_status_log_records_disconnect(parser_module, monkeypatch):
         str(active_path),
     )
 
-    status_path.write_text(
-        """
+    status_path.write_text("""
 Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since
 
 ROUTING TABLE
-""".strip()
-    )
+""".strip())
 
     _freeze_time(monkeypatch, parser, hour=13)
 
@@ -149,7 +263,7 @@ ROUTING TABLE
         data = json.load(fh)
     assert data == {}
 
-    history_entries = json.loads(history_path.read_text())
+    history_entries = _read_history(history_path)
     assert history_entries == [
         {
             "timestamp": "2024-01-01 09:00:00",
@@ -172,15 +286,13 @@ def test_parse_status_log_recovers_from_corrupted_state(parser_module, monkeypat
 
     active_path.write_text("{")
 
-    status_path.write_text(
-        """
+    status_path.write_text("""
 Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since
 alice,198.51.100.20:51820,2048,1024,2024-01-01 11:45:00
 
 ROUTING TABLE
 10.8.0.6,alice
-""".strip()
-    )
+""".strip())
 
     _freeze_time(monkeypatch, parser, hour=12)
 
@@ -213,7 +325,7 @@ ROUTING TABLE
         }
     }
 
-    history_entries = json.loads(history_path.read_text())
+    history_entries = _read_history(history_path)
     assert history_entries[0]["timestamp"] == "2024-01-01 11:45:00"
     assert history_entries[0]["name"] == "alice"
     assert history_entries[0]["ip"] == "198.51.100.20"
@@ -223,15 +335,13 @@ ROUTING TABLE
 def test_parse_status_log_avoids_duplicate_history_entries(parser_module, monkeypatch):
     parser, status_path, history_path, _ = parser_module
 
-    status_path.write_text(
-        """
+    status_path.write_text("""
 Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since
 client1,198.51.100.50:1194,1024,2048,2024-01-01 12:00:00
 
 ROUTING TABLE
 10.8.0.2,client1
-""".strip()
-    )
+""".strip())
 
     _freeze_time(monkeypatch, parser, hour=12, minute=5)
 
@@ -258,8 +368,82 @@ ROUTING TABLE
     thread_one.join()
     thread_two.join()
 
-    history_entries = json.loads(history_path.read_text())
+    history_entries = _read_history(history_path)
     assert len(history_entries) == 1
     entry = history_entries[0]
     assert entry["timestamp"] == "2024-01-01 12:00:00"
     assert entry["name"] == "client1"
+
+
+_SINGLE_CLIENT_STATUS = """
+Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since
+client1,198.51.100.50:1194,1024,2048,2024-01-01 12:00:00
+
+ROUTING TABLE
+10.8.0.2,client1
+""".strip()
+
+
+def _count_saves(monkeypatch, parser):
+    calls = []
+    real_save = parser.save_active_sessions
+
+    def _save(sessions, *args, **kwargs):
+        calls.append(sessions)
+        return real_save(sessions, *args, **kwargs)
+
+    monkeypatch.setattr(parser, "save_active_sessions", _save)
+    return calls
+
+
+def test_parse_status_log_skips_unchanged_file(parser_module, monkeypatch):
+    parser, status_path, history_path, _ = parser_module
+
+    status_path.write_text(_SINGLE_CLIENT_STATUS)
+    _freeze_time(monkeypatch, parser, hour=12, minute=5)
+    saves = _count_saves(monkeypatch, parser)
+
+    first = parser.parse_status_log(str(status_path))
+    second = parser.parse_status_log(str(status_path))
+
+    assert second == first
+    assert len(saves) == 1
+    assert len(_read_history(history_path)) == 1
+
+    # Truncation changes the size and must be picked up.
+    status_path.write_text(_SINGLE_CLIENT_STATUS.replace("1024,2048", "1,2"))
+    third = parser.parse_status_log(str(status_path))
+    assert third[0]["bytes_received"] == 1
+    assert len(saves) == 2
+
+
+def test_parse_status_log_detects_rotation_and_same_size_rewrites(parser_module, monkeypatch):
+    parser, status_path, _, _ = parser_module
+
+    status_path.write_text(_SINGLE_CLIENT_STATUS)
+    _freeze_time(monkeypatch, parser, hour=12, minute=5)
+    saves = _count_saves(monkeypatch, parser)
+
+    parser.parse_status_log(str(status_path))
+    stat = status_path.stat()
+
+    # Same size and mtime, new inode: a rotated file.
+    rotated = status_path.with_name("status.log.new")
+    rotated.write_text(_SINGLE_CLIENT_STATUS.replace("1024,2048", "4096,2048"))
+    os.utime(rotated, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(rotated, status_path)
+
+    clients = parser.parse_status_log(str(status_path))
+    assert clients[0]["bytes_received"] == 4096
+    assert len(saves) == 2
+
+    # Same inode, size and mtime: only the content hash can tell.
+    stat = status_path.stat()
+    status_path.write_text(_SINGLE_CLIENT_STATUS.replace("1024,2048", "8192,2048"))
+    os.utime(status_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert parser.parse_status_log(str(status_path))[0]["bytes_received"] == 4096
+
+    monkeypatch.setattr(parser, "STATUS_LOG_HASH", True)
+
+    assert parser.parse_status_log(str(status_path))[0]["bytes_received"] == 8192
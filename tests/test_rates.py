@@ -0,0 +1,89 @@
+import pytest
+
+
+@pytest.fixture
+def rates_env(app_env, tmp_path):
+    app_env()
+
+    from app import collector, rates, routes
+
+    return rates, collector, routes.app.test_client(), tmp_path
+
+
+def _client(name, rx, tx, since="2024-01-01 12:00:00", instance=None):
+    client = {
+        "common_name": name,
+        "bytes_received": rx,
+        "bytes_sent": tx,
+        "connected_since": since,
+    }
+    if instance:
+        client["instance"] = instance
+    return client
+
+
+def test_tracker_derives_instant_smoothed_and_peak_rates(rates_env):
+    rates, _, _, _ = rates_env
+    tracker = rates.RateTracker(capacity=4, smoothing=10)
+
+    tracker.sample([_client("alice", 0, 0)], now=100.0)
+    assert tracker.rates()["alice"]["samples"] == 0
+
+    tracker.sample([_client("alice", 1000, 100)], now=110.0)
+    tracker.sample([_client("alice", 5000, 200)], now=120.0)
+    alice = tracker.rates()["alice"]
+    assert alice["rx_rate"] == 400.0
+    assert alice["tx_rate"] == 10.0
+    assert alice["rx_rate_peak"] == 400.0
+    assert 100.0 < alice["rx_rate_avg"] < 400.0
+    assert alice["samples"] == 2
+    assert alice["window_seconds"] == 20.0
+
+    # Wrap around the ring: only the last capacity - 1 intervals remain.
+    tracker.sample([_client("alice", 5500, 300)], now=130.0)
+    tracker.sample([_client("alice", 5600, 400)], now=140.0)
+    tracker.sample([_client("alice", 5700, 500)], now=150.0)
+    alice = tracker.rates()["alice"]
+    assert alice["samples"] == 3
+    assert alice["window_seconds"] == 30.0
+    assert alice["rx_rate_peak"] == 50.0
+    assert alice["rx_rate"] == 10.0
+
+
+def test_tracker_restarts_on_reconnect_and_drops_gone_sessions(rates_env):
+    rates, _, _, _ = rates_env
+    tracker = rates.RateTracker(capacity=8)
+
+    tracker.sample([_client("alice", 0, 0), _client("bob", 0, 0)], now=0.0)
+    tracker.sample([_client("alice", 100, 0), _client("bob", 100, 0)], now=10.0)
+    tracker.sample([_client("alice", 50, 0, since="2024-01-01 12:05:00")], now=20.0)
+
+    assert set(tracker.rates()) == {"alice"}
+    assert tracker.rates()["alice"]["samples"] == 0
+
+
+def test_rates_endpoint_serves_published_rates(rates_env):
+    rates, collector, client, tmp_path = rates_env
+
+    (tmp_path / "status.log").write_text(
+        "Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since\n"
+        "alice,198.51.100.10:1194,1024,2048,2024-01-01 12:00:00\n"
+        "ROUTING TABLE\nGLOBAL STATS\n"
+    )
+    snapshot = collector.collect_once()
+    assert rates.rate_tracker.version == snapshot.version
+    assert client.get("/api/clients/rates").get_json() == {
+        "version": snapshot.version,
+        "clients": {"alice": rates.rate_tracker.rates()["alice"]},
+    }
+
+    tracker = rates.RateTracker()
+    tracker.sample([_client("alice", 0, 0, instance="udp"), _client("bob", 0, 0)], now=0.0)
+    tracker.sample([_client("alice", 800, 80, instance="udp"), _client("bob", 8, 8)], now=8.0)
+    rates.publish_rates(7, tracker)
+
+    payload = client.get("/api/clients/rates?instance=udp").get_json()
+    assert payload["version"] == 7
+    assert list(payload["clients"]) == ["udp/alice"]
+    assert payload["clients"]["udp/alice"]["rx_rate"] == 100.0
+    assert payload["clients"]["udp/alice"]["tx_rate"] == 10.0
@@ -0,0 +1,143 @@
+import pytest
+
+
+@pytest.fixture
+def rollups_env(app_env, tmp_path):
+    app_env()
+
+    from app import collector, rollups, routes
+
+    return rollups, collector, routes.app.test_client(), tmp_path
+
+
+def test_counter_deltas_follow_sessions(rollups_env):
+    rollups, _, _, _ = rollups_env
+    deltas = rollups.CounterDeltas()
+
+    def client(name, rx, tx, since="2024-01-01 12:00:00"):
+        return {
+            "common_name": name,
+            "bytes_received": rx,
+            "bytes_sent": tx,
+            "connected_since": since,
+        }
+
+    assert deltas.update([client("alice", 1000, 100)]) == {}
+    assert deltas.update([client("alice", 1500, 100), client("bob", 20, 30)]) == {
+        "alice": (500, 0),
+        "bob": (20, 30),
+    }
+    # Reconnected: the new session's counters are all new traffic.
+    assert deltas.update([client("alice", 40, 4, since="2024-01-01 13:00:00")]) == {
+        "alice": (40, 4)
+    }
+
+
+def test_rollups_compact_and_serve_every_resolution(rollups_env, tmp_path):
+    rollups, _, _, _ = rollups_env
+    store = rollups.RollupStore(
+        str(tmp_path / "rollups.sqlite3"),
+        retention_days={rollups.MINUTE: 1, rollups.HOUR: 30, rollups.DAY: 365},
+    )
+    hour, day = rollups.HOUR, rollups.DAY
+    base = rollups.day_start(1704103200)
+
+    store.record({"alice": (100, 10)}, now=base + 30)
+    store.record({"alice": (50, 5), "bob": (7, 7)}, now=base + 90)
+    store.record({"alice": (1, 1)}, now=base + hour + 10)
+
+    assert store.series("alice", base, base + 2 * hour, rollups.MINUTE) == (
+        rollups.MINUTE,
+        [(base, 100, 10), (base + 60, 50, 5), (base + hour, 1, 1)],
+    )
+    # Hours that have not been compacted yet are folded from minutes.
+    expected_hours = [(base, 150, 15), (base + hour, 1, 1)]
+    assert store.series("alice", base, base + 2 * hour, hour)[1] == expected_hours
+
+    store.compact(now=base + 2 * hour)
+    assert store.series("alice", base, base + 2 * hour, hour)[1] == expected_hours
+    assert store.series(rollups.SERVER, base, base + hour, hour)[1] == [(base, 157, 22)]
+
+    store.record({"alice": (9, 9)}, now=base + day + 10)
+    store.compact(now=base + day + 20)
+    assert store.series("alice", base, base + 2 * day, day) == (
+        day,
+        [(base, 151, 16), (base + day, 9, 9)],
+    )
+
+    # Minute buckets expire after a day; the compacted hours remain.
+    store.compact(now=base + 3 * day)
+    conn = store._connect()
+    minutes = conn.execute("SELECT COUNT(*) FROM rollups WHERE resolution = 60").fetchone()[0]
+    assert minutes == 0
+    assert store.series("alice", base, base + 2 * hour, hour)[1] == expected_hours
+    assert store.series("alice", base, base + 2 * hour, rollups.MINUTE)[1] == []
+
+
+def test_auto_resolution_keeps_long_ranges_short(rollups_env):
+    rollups, _, _, _ = rollups_env
+
+    assert rollups.auto_resolution(0, 6 * rollups.HOUR) == rollups.MINUTE
+    assert rollups.auto_resolution(0, 30 * rollups.DAY) == rollups.HOUR
+    assert rollups.auto_resolution(0, 365 * rollups.DAY) == rollups.DAY
+
+
+def test_traffic_endpoint_reads_collector_rollups(rollups_env):
+    _, collector, client, tmp_path = rollups_env
+    status_path = tmp_path / "status.log"
+
+    def write_status(*rows):
+        lines = ["Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since"]
+        lines += [
+            f"{name},198.51.100.10:1194,{rx},{tx},2024-01-01 12:00:00" for name, rx, tx in rows
+        ]
+        status_path.write_text("\n".join(lines + ["ROUTING TABLE", "GLOBAL STATS"]) + "\n")
+
+    write_status(("alice", 1000, 2000))
+    collector.collect_once()
+    write_status(("alice", 1600, 2100), ("bob", 10, 20))
+    collector.collect_once()
+
+    payload = client.get("/api/traffic?resolution=1h").get_json()
+    assert payload["client"] == ""
+    assert payload["resolution"] == "1h"
+    assert [(p["rx"], p["tx"]) for p in payload["points"]] == [(610, 120)]
+
+    payload = client.get("/api/traffic?client=alice").get_json()
+    assert payload["resolution"] == "1h"
+    assert [(p["rx"], p["tx"]) for p in payload["points"]] == [(600, 100)]
+
+    response = client.get("/api/traffic?resolution=5m")
+    assert response.status_code == 400
+    assert response.get_json()["error"]["code"] == "bad_request"
+
+
+def test_traffic_default_window_includes_the_current_second(rollups_env, monkeypatch):
+    rollups, _, client, _ = rollups_env
+
+    # Traffic recorded at the very start of a minute, queried in that second.
+    now = rollups.day_start(1704103200) + rollups.HOUR
+    rollups.get_rollup_store().record({"alice": (5, 6)}, now=now)
+    monkeypatch.setattr("time.time", lambda: now + 0.5)
+
+    payload = client.get("/api/traffic?client=alice&resolution=1m").get_json()
+    assert [(p["rx"], p["tx"]) for p in payload["points"]] == [(5, 6)]
+
+
+def test_idle_traffic_still_compacts(rollups_env, tmp_path):
+    rollups, _, _, _ = rollups_env
+    store = rollups.RollupStore(str(tmp_path / "rollups.sqlite3"))
+    deltas = rollups.CounterDeltas()
+    base = rollups.day_start(1704103200)
+    from app.snapshot import ClientSnapshot
+
+    snapshot = ClientSnapshot(
+        version=1, clients=({"common_name": "alice", "bytes_received": 10, "bytes_sent": 1},)
+    )
+
+    rollups.record_traffic(snapshot, store, deltas, now=base)
+    compacted = []
+    store.compact = compacted.append
+    # The same snapshot two hours later: no traffic, but compaction is due.
+    rollups.record_traffic(snapshot, store, deltas, now=base + 2 * rollups.HOUR)
+    assert compacted == [base + 2 * rollups.HOUR]
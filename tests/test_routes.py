@@ -1,37 +1,16 @@
-import importlib
 import json
-import sys
-from pathlib import Path
+import os
 
 import pytest
 
 
-PROJECT_ROOT = Path(__file__).resolve().parents[1]
-if str(PROJECT_ROOT) not in sys.path:
-    sys.path.insert(0, str(PROJECT_ROOT))
-
-
 @pytest.fixture
-def app_client(tmp_path, monkeypatch):
-    history_path = tmp_path / "history.json"
-    geo_path = tmp_path / "client_geo.json"
-
-    monkeypatch.setenv("OPENVPN_HISTORY_LOG", str(history_path))
-    monkeypatch.setenv("OPENVPN_CLIENT_GEO_DB", str(geo_path))
-
-    from app import config
-
-    importlib.reload(config)
-
-    from app import geo_store, routes
-
-    importlib.reload(geo_store)
-    importlib.reload(routes)
+def app_client(app_env, tmp_path):
+    app_env()
 
-    routes.app.config.update(TESTING=True)
-    client = routes.app.test_client()
+    from app import routes
 
-    return client, history_path, geo_path
+    return routes.app.test_client(), tmp_path / "history.json", tmp_path / "client_geo.json"
 
 
 def test_api_history_includes_vpn_ip_versions(app_client):
@@ -147,10 +126,10 @@ def test_geo_db_populated_from_history(app_client):
     ]
     history_path.write_text(json.dumps(history_entries))
 
-    response = client.get("/api/history")
-    assert response.status_code == 200
+    from app import geo_store
 
-    assert geo_path.exists()
+    assert geo_store.sync_geo_db() == 3
+    assert geo_store.flush_geo_db(force=True)
 
     payload = json.loads(geo_path.read_text())
     clients = payload["clients"]
@@ -176,7 +155,90 @@ def test_geo_db_populated_from_history(app_client):
     assert bob_ip["vpn_ipv6"] == ["2001:db8::abcd"]
 
 
-def test_clients_summary_counts_closed_sessions(app_client, monkeypatch):
+def test_geo_sync_reads_only_new_history(app_client):
+    _, history_path, geo_path = app_client
+
+    from app import geo_store, history_store
+
+    def event(session_id, vpn_ip, timestamp="2024-01-01 09:00:00"):
+        return {
+            "timestamp": timestamp,
+            "name": "alice",
+            "ip": "198.51.100.10",
+            "session_id": session_id,
+            "vpn_ip": vpn_ip,
+        }
+
+    store = history_store.get_history_store()
+    store.append(event("s1", "10.8.0.5"))
+    store.append(event("s2", "10.8.0.5"))
+    assert geo_store.sync_geo_db() == 2
+    assert geo_store.sync_geo_db() == 0
+
+    store.append(event("s3", "10.8.0.9", "2024-01-02 09:00:00"))
+    assert geo_store.sync_geo_db() == 1
+
+    geo_store.flush_geo_db(force=True)
+    alice = json.loads(geo_path.read_text())["clients"]["alice"]
+    assert alice["ips"]["198.51.100.10"]["vpn_ipv4"] == ["10.8.0.5", "10.8.0.9"]
+    assert alice["last_seen"] == "2024-01-02 09:00:00"
+
+    # A replaced history file is read from the start again.
+    history_path.unlink()
+    store.append(event("s4", "10.8.0.7"))
+    assert geo_store.sync_geo_db() == 1
+    geo_store.flush_geo_db(force=True)
+    alice = json.loads(geo_path.read_text())["clients"]["alice"]
+    assert alice["ips"]["198.51.100.10"]["vpn_ipv4"] == ["10.8.0.5", "10.8.0.9", "10.8.0.7"]
+
+
+def test_geo_db_is_cached_and_written_behind(app_client, monkeypatch):
+    _, _, geo_path = app_client
+
+    from app import geo_store, history_store
+
+    monkeypatch.setattr(geo_store, "GEO_FLUSH_INTERVAL", 3600)
+    # Three clients plus the GeoIP version recorded by the first sync.
+    monkeypatch.setattr(geo_store, "GEO_FLUSH_CHANGES", 4)
+    store = history_store.get_history_store()
+
+    def add(name):
+        store.append(
+            {
+                "timestamp": "2024-01-01 09:00:00",
+                "name": name,
+                "ip": "198.51.100.10",
+                "session_id": name,
+            }
+        )
+        geo_store.sync_geo_db()
+
+    add("alice")
+    add("bob")
+    # Pending changes are visible to readers but not written yet.
+    assert set(geo_store._load_db()["clients"]) == {"alice", "bob"}
+    assert json.loads(geo_path.read_text())["clients"] == {}
+
+    add("carol")
+    assert set(json.loads(geo_path.read_text())["clients"]) == {"alice", "bob", "carol"}
+    assert [p.name for p in geo_path.parent.iterdir() if p.name.endswith(".tmp")] == []
+
+    # Parsed once per file version; an outside rewrite is picked up.
+    assert geo_store._load_db() is geo_store._load_db()
+    geo_path.write_text(json.dumps({"clients": {"dave": {"name": "dave", "ips": {}}}}))
+    assert set(geo_store._load_db()["clients"]) == {"dave"}
+
+    # Updates go to a private copy; the shared parsed file stays read-only.
+    from app import fileutil
+
+    shared = fileutil.load_cached_json(str(geo_path), geo_store._db_from_data)
+    add("erin")
+    assert {"dave", "erin"} <= set(geo_store._load_db()["clients"])
+    assert set(shared["clients"]) == {"dave"}
+    assert "history_marks" not in shared
+
+
+def test_clients_summary_counts_closed_sessions(app_client):
     client, history_path, _ = app_client
 
     history_entries = [
@@ -222,10 +284,6 @@ def test_clients_summary_counts_closed_sessions(app_client, monkeypatch):
     ]
     history_path.write_text(json.dumps(history_entries))
 
-    from app import routes
-
-    monkeypatch.setattr(routes, "parse_status_log", lambda: [])
-
     response = client.get("/api/clients/summary")
     assert response.status_code == 200
 
@@ -233,7 +291,7 @@ def test_clients_summary_counts_closed_sessions(app_client, monkeypatch):
     assert payload["clients"][0]["sessions"] == 2
 
 
-def test_clients_summary_includes_active_session(app_client, monkeypatch):
+def test_clients_summary_includes_active_session(app_client):
     client, history_path, _ = app_client
 
     history_entries = [
@@ -257,7 +315,6 @@ def test_clients_summary_includes_active_session(app_client, monkeypatch):
         {
             "common_name": "alice",
             "connected_since": "2024-01-02 09:00:00",
-            "time_online": "01:00:00",
             "real_ip": "198.51.100.10",
             "port": "443",
             "vpn_ipv4": "10.8.0.5",
@@ -267,9 +324,9 @@ def test_clients_summary_includes_active_session(app_client, monkeypatch):
         }
     ]
 
-    from app import routes
+    from app import snapshot
 
-    monkeypatch.setattr(routes, "parse_status_log", lambda: active_clients)
+    snapshot.publish_snapshot(active_clients)
 
     response = client.get("/api/clients/summary")
     assert response.status_code == 200
@@ -277,3 +334,319 @@ def test_clients_summary_includes_active_session(app_client, monkeypatch):
     payload = json.loads(response.data)
     assert payload["clients"][0]["sessions"] == 2
     assert payload["clients"][0]["is_online"] is True
+
+
+def test_client_endpoints_read_published_snapshot(app_client, monkeypatch):
+    client, _, _ = app_client
+
+    from app import parser, snapshot
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("API requests must not parse the status log")
+
+    monkeypatch.setattr(parser, "parse_status_log", _fail)
+
+    response = client.get("/api/clients")
+    assert json.loads(response.data) == {"clients": []}
+
+    snapshot.publish_snapshot(
+        [{"common_name": "alice", "bytes_received": 1048576, "bytes_sent": 2097152}]
+    )
+
+    response = client.get("/api/clients")
+    assert [c["common_name"] for c in json.loads(response.data)["clients"]] == ["alice"]
+
+    status = json.loads(client.get("/api/server-status").data)
+    assert status["clients"] == 1
+    assert status["total_rx"] == 1.0
+    assert status["total_tx"] == 2.0
+
+
+def test_client_payloads_do_not_depend_on_the_clock(app_client, monkeypatch):
+    client, _, _ = app_client
+
+    from app import snapshot, timeutil
+
+    alice = {
+        "common_name": "alice",
+        "connected_since": "2024-01-01 12:00:00",
+        "bytes_received": 1,
+        "bytes_sent": 0,
+    }
+    snapshot.publish_snapshot([alice])
+    connected = timeutil.local_epoch("2024-01-01 12:00:00")
+
+    monkeypatch.setattr("time.time", lambda: connected + 90)
+    clients = client.get("/api/clients")
+    assert json.loads(clients.data)["clients"] == [dict(alice, connected_since_ts=connected)]
+    assert float(clients.headers["X-Server-Time"]) == connected + 90
+    summary = client.get("/api/clients/summary")
+    alice_summary = json.loads(summary.data)["clients"][0]
+    assert alice_summary["current_session"]["connected_since_ts"] == connected
+    assert alice_summary["total_duration_seconds"] == 0
+
+    # A minute later the same snapshot is still not modified; only the
+    # server time moves on.
+    monkeypatch.setattr("time.time", lambda: connected + 150)
+    for url, response in (("/api/clients", clients), ("/api/clients/summary", summary)):
+        again = client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+        assert again.status_code == 304
+        assert float(again.headers["X-Server-Time"]) == connected + 150
+
+
+def test_client_endpoints_honour_if_none_match(app_client, monkeypatch):
+    client, history_path, _ = app_client
+
+    from app import routes, snapshot
+
+    snapshot.publish_snapshot([{"common_name": "alice", "bytes_received": 1, "bytes_sent": 0}])
+
+    for url in ("/api/clients", "/api/server-status", "/api/clients/summary"):
+        response = client.get(url)
+        etag = response.headers["ETag"]
+        assert response.status_code == 200
+
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+
+    # An unchanged snapshot reuses the serialized body.
+    def _fail(*args, **kwargs):
+        raise AssertionError("unchanged payload must not be rebuilt")
+
+    monkeypatch.setattr(routes, "_server_status_payload", _fail)
+    assert client.get("/api/server-status").status_code == 200
+    monkeypatch.undo()
+
+    etag = client.get("/api/clients").headers["ETag"]
+    snapshot.publish_snapshot([{"common_name": "bob", "bytes_received": 1, "bytes_sent": 0}])
+    response = client.get("/api/clients", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert [c["common_name"] for c in json.loads(response.data)["clients"]] == ["bob"]
+
+    history_path.write_text("")
+    etag = client.get("/api/history").headers["ETag"]
+    assert client.get("/api/history", headers={"If-None-Match": etag}).status_code == 304
+    history_path.write_text(
+        json.dumps({"timestamp": "2024-01-01 09:00:00", "name": "alice", "session_id": "s1"}) + "\n"
+    )
+    assert client.get("/api/history", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_api_clients_since_returns_delta(app_client):
+    client, _, _ = app_client
+
+    from app import snapshot
+
+    alice = {"common_name": "alice", "bytes_received": 1, "bytes_sent": 0}
+    bob = {"common_name": "bob", "bytes_received": 1, "bytes_sent": 0}
+    snapshot.publish_snapshot([alice, bob])
+    snapshot.publish_snapshot([dict(alice, bytes_received=5)])
+
+    payload = json.loads(client.get("/api/clients?since=1").data)
+    assert payload == {
+        "version": 2,
+        "full": False,
+        "clients": [dict(alice, bytes_received=5, connected_since_ts=None)],
+        "removed": ["bob"],
+    }
+
+    payload = json.loads(client.get("/api/clients?since=2").data)
+    assert payload["clients"] == [] and payload["removed"] == []
+
+    payload = json.loads(client.get("/api/clients?since=7").data)
+    assert payload["full"] is True
+    assert payload["clients"] == [dict(alice, bytes_received=5, connected_since_ts=None)]
+
+    response = client.get("/api/clients?since=abc")
+    assert response.status_code == 400
+    assert json.loads(response.data)["error"]["code"] == "bad_request"
+
+
+def test_clients_delta_leaves_out_unchanged_clients(app_client, tmp_path, monkeypatch):
+    client, _, _ = app_client
+
+    from datetime import datetime as RealDateTime
+
+    from app import collector, parser
+
+    clock = [RealDateTime(2024, 1, 1, 12, 0, 0)]
+
+    class Clock(RealDateTime):
+        @classmethod
+        def now(cls, tz=None):
+            return clock[0].replace(tzinfo=tz)
+
+    monkeypatch.setattr(parser.datetime, "datetime", Clock)
+
+    def collect(bob_rx):
+        (tmp_path / "status.log").write_text(
+            "Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since\n"
+            "alice,198.51.100.10:1194,1024,2048,2024-01-01 11:00:00\n"
+            f"bob,198.51.100.11:1194,{bob_rx},2048,2024-01-01 11:30:00\n"
+            "ROUTING TABLE\nGLOBAL STATS\n"
+        )
+        return collector.collect_once()
+
+    first = collect(1024)
+    # A minute later only bob has moved any traffic.
+    clock[0] = RealDateTime(2024, 1, 1, 12, 1, 0)
+    second = collect(4096)
+
+    assert second.version == first.version + 1
+    payload = json.loads(client.get(f"/api/clients?since={first.version}").data)
+    assert [row["common_name"] for row in payload["clients"]] == ["bob"]
+    assert payload["clients"][0]["bytes_received"] == 4096
+    assert payload["removed"] == []
+
+
+def test_client_endpoints_filter_by_instance(app_client):
+    client, _, _ = app_client
+
+    from app import snapshot
+
+    udp_alice = {"common_name": "alice", "instance": "udp", "bytes_received": 1, "bytes_sent": 0}
+    tcp_alice = {
+        "common_name": "alice",
+        "instance": "tcp",
+        "bytes_received": 2097152,
+        "bytes_sent": 0,
+    }
+    snapshot.publish_snapshot([udp_alice, tcp_alice])
+
+    assert len(json.loads(client.get("/api/clients").data)["clients"]) == 2
+    assert json.loads(client.get("/api/clients?instance=tcp").data)["clients"] == [
+        dict(tcp_alice, connected_since_ts=None)
+    ]
+
+    snapshot.publish_snapshot([tcp_alice])
+
+    payload = json.loads(client.get("/api/clients?since=1&instance=udp").data)
+    assert payload["clients"] == [] and payload["removed"] == ["udp/alice"]
+    payload = json.loads(client.get("/api/clients?since=1&instance=tcp").data)
+    assert payload["clients"] == [] and payload["removed"] == []
+
+    status = json.loads(client.get("/api/server-status?instance=tcp").data)
+    assert status["clients"] == 1
+    assert status["total_rx"] == 2.0
+
+
+def test_api_history_filters_and_paginates(app_client):
+    client, history_path, _ = app_client
+
+    lines = [
+        {
+            "timestamp": f"2024-01-0{day} 09:00:00",
+            "name": name,
+            "ip": "198.51.100.10",
+            "session_id": f"s{day}",
+            "rx": 1.0,
+            "tx": 2.0,
+            "vpn_ip": "10.8.0.5",
+            "vpn_ipv4": "10.8.0.5",
+            "vpn_ipv6": "",
+            "port": "443",
+            "session_end": f"2024-01-0{day} 10:00:00",
+        }
+        for day, name in ((1, "alice"), (2, "bob"), (3, "alice"), (4, "alice"))
+    ]
+    history_path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+
+    response = client.get("/api/history?name=alice&limit=2")
+    assert response.status_code == 200
+    assert [e["session_id"] for e in json.loads(response.data)] == ["s4", "s3"]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f"/api/history?name=alice&limit=2&cursor={cursor}")
+    assert [e["session_id"] for e in json.loads(response.data)] == ["s1"]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = client.get("/api/history?from=2024-01-02&to=2024-01-03")
+    assert [e["session_id"] for e in json.loads(response.data)] == ["s3", "s2"]
+
+    # A cursor issued for another version of the log is rejected.
+    replacement = history_path.with_name("history.new")
+    replacement.write_text(history_path.read_text())
+    os.replace(replacement, history_path)
+    response = client.get(f"/api/history?name=alice&limit=2&cursor={cursor}")
+    assert response.status_code == 400
+
+    for bad in ("limit=0", "limit=abc", "from=yesterday", "cursor=%%%"):
+        response = client.get(f"/api/history?{bad}")
+        assert response.status_code == 400
+        assert json.loads(response.data)["error"]["code"] == "bad_request"
+
+
+def test_api_history_is_streamed(app_client, monkeypatch):
+    client, history_path, geo_path = app_client
+
+    from app import routes
+
+    monkeypatch.setattr(routes, "_STREAM_CHUNK_SIZE", 512)
+
+    lines = [
+        {
+            "timestamp": "2024-01-01 09:00:00",
+            "name": f"client{i}",
+            "ip": "198.51.100.10",
+            "session_id": f"s{i}",
+            "rx": 1.0,
+            "tx": 2.0,
+            "vpn_ip": "10.8.0.5",
+            "session_end": "2024-01-01 10:00:00",
+        }
+        for i in range(50)
+    ]
+    history_path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+
+    response = client.get("/api/history")
+    assert response.is_streamed
+    assert response.mimetype == "application/json"
+
+    chunks = list(response.response)
+    assert len(chunks) > 1
+
+    entries = json.loads(b"".join(c if isinstance(c, bytes) else c.encode() for c in chunks))
+    assert [e["session_id"] for e in entries] == [f"s{i}" for i in range(50)]
+    # The collector maintains the geo DB; reading history does not write it.
+    assert json.loads(geo_path.read_text())["clients"] == {}
+
+
+def _parse_sse(message):
+    fields = dict(line.split(": ", 1) for line in message.strip().splitlines())
+    return fields["event"], json.loads(fields["data"])
+
+
+def test_stream_pushes_snapshot_then_deltas(app_client):
+    from app import routes, snapshot
+
+    snapshot.publish_snapshot([{"common_name": "alice", "bytes_received": 1, "bytes_sent": 0}])
+
+    stream = routes._client_event_stream(poll_interval=0, keepalive_interval=3600)
+    assert next(stream).startswith("retry:")
+
+    event, data = _parse_sse(next(stream))
+    assert event == "snapshot"
+    assert data["version"] == 1
+    assert [c["common_name"] for c in data["clients"]] == ["alice"]
+    assert data["server_status"]["clients"] == 1
+
+    snapshot.publish_snapshot(
+        [
+            {"common_name": "alice", "bytes_received": 5, "bytes_sent": 0},
+            {"common_name": "bob", "bytes_received": 1, "bytes_sent": 0},
+        ]
+    )
+    event, data = _parse_sse(next(stream))
+    assert event == "delta"
+    assert (data["since"], data["version"]) == (1, 2)
+    assert [c["common_name"] for c in data["added"]] == ["bob"]
+    assert [c["bytes_received"] for c in data["changed"]] == [5]
+    assert data["removed"] == []
+
+    snapshot.publish_snapshot([{"common_name": "bob", "bytes_received": 1, "bytes_sent": 0}])
+    event, data = _parse_sse(next(stream))
+    assert event == "delta"
+    assert data["removed"] == ["alice"]
+    assert data["server_status"]["clients"] == 1
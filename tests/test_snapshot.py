@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def snapshot_module(app_env, tmp_path):
+    app_env()
+
+    from app import snapshot
+
+    return snapshot, tmp_path / "client_snapshot.json"
+
+
+def test_missing_snapshot_is_empty(snapshot_module):
+    snapshot, _ = snapshot_module
+
+    current = snapshot.load_client_snapshot()
+    assert current.version == 0
+    assert current.clients == ()
+
+
+def test_version_only_changes_with_clients(snapshot_module):
+    snapshot, snapshot_path = snapshot_module
+
+    first = snapshot.publish_snapshot([{"common_name": "alice", "bytes_received": 1}])
+    assert first.version == 1
+
+    mtime = snapshot_path.stat().st_mtime_ns
+    same = snapshot.publish_snapshot([{"common_name": "alice", "bytes_received": 1}])
+    assert same.version == 1
+    assert snapshot_path.stat().st_mtime_ns == mtime
+
+    second = snapshot.publish_snapshot([{"common_name": "alice", "bytes_received": 2}])
+    assert second.version == 2
+    assert json.loads(snapshot_path.read_text())["version"] == 2
+
+
+def test_reader_picks_up_snapshots_from_another_process(snapshot_module):
+    snapshot, snapshot_path = snapshot_module
+
+    snapshot.publish_snapshot([{"common_name": "alice"}])
+    assert snapshot.load_client_snapshot().version == 1
+
+    snapshot_path.write_text(
+        json.dumps({"version": 7, "generated_at": None, "clients": [{"common_name": "bob"}]})
+    )
+
+    current = snapshot.load_client_snapshot()
+    assert current.version == 7
+    assert current.clients == ({"common_name": "bob"},)
+
+
+def test_diff_clients_reports_added_changed_and_removed(snapshot_module):
+    snapshot, _ = snapshot_module
+
+    old = [
+        {"common_name": "alice", "bytes_received": 1},
+        {"common_name": "bob", "bytes_received": 1},
+    ]
+    new = [
+        {"common_name": "alice", "bytes_received": 2},
+        {"common_name": "carol", "bytes_received": 1},
+    ]
+
+    assert snapshot.diff_clients(old, new) == {
+        "added": [{"common_name": "carol", "bytes_received": 1}],
+        "changed": [{"common_name": "alice", "bytes_received": 2}],
+        "removed": ["bob"],
+    }
+
+
+def test_clients_since_tracks_changes_and_tombstones(snapshot_module, monkeypatch):
+    snapshot, snapshot_path = snapshot_module
+
+    alice = {"common_name": "alice", "bytes_received": 1}
+    bob = {"common_name": "bob", "bytes_received": 1}
+    snapshot.publish_snapshot([alice, bob])
+    snapshot.publish_snapshot([alice, dict(bob, bytes_received=2)])
+    current = snapshot.publish_snapshot([dict(bob, bytes_received=2)])
+    assert current.version == 3
+
+    bob_changed = {"clients": [dict(bob, bytes_received=2)], "removed": ["alice"]}
+    assert snapshot.clients_since(current, 0) == bob_changed
+    assert snapshot.clients_since(current, 1) == bob_changed
+    assert snapshot.clients_since(current, 2) == {"clients": [], "removed": ["alice"]}
+    assert snapshot.clients_since(current, 3) == {"clients": [], "removed": []}
+    assert snapshot.clients_since(current, 4) is None
+
+    # Change tracking survives a reload from disk, and a returning client
+    # drops its tombstone.
+    from app import fileutil
+
+    fileutil.clear_caches()
+    current = snapshot.publish_snapshot([alice, dict(bob, bytes_received=2)])
+    assert current.tombstones == {}
+    assert snapshot.clients_since(current, 3) == {"clients": [alice], "removed": []}
+
+    # Forgetting old tombstones moves the floor past them.
+    monkeypatch.setattr(snapshot, "_MAX_TOMBSTONES", 0)
+    current = snapshot.publish_snapshot([alice])
+    assert current.delta_floor == current.version
+    assert snapshot.clients_since(current, current.version - 1) is None
+
+    # Snapshots written without change tracking only answer for their own version.
+    snapshot_path.write_text(json.dumps({"version": 9, "clients": [alice]}))
+    legacy = snapshot.load_client_snapshot()
+    assert snapshot.clients_since(legacy, 8) is None
+    assert snapshot.clients_since(legacy, 9) == {"clients": [], "removed": []}
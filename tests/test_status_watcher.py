@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def watcher(app_env, tmp_path):
+    status_path = tmp_path / "status.log"
+    status_path.write_text("TITLE\n")
+    app_env()
+
+    from app import status_watcher
+
+    instance = status_watcher.StatusFileWatcher(str(status_path), debounce=0.02)
+    if not instance._open():
+        pytest.skip("inotify is not available on this platform")
+    yield instance, status_path
+    instance.close()
+
+
+def _later(action, delay=0.05):
+    timer = threading.Timer(delay, action)
+    timer.start()
+    return timer
+
+
+def test_wait_times_out_without_changes(watcher, tmp_path):
+    instance, _ = watcher
+
+    (tmp_path / "unrelated.txt").write_text("x")
+    started = time.monotonic()
+    assert instance.wait(0.2) is False
+    assert time.monotonic() - started >= 0.2
+
+
+def test_wait_wakes_on_in_place_rewrite(watcher):
+    instance, status_path = watcher
+
+    _later(lambda: status_path.write_text("TITLE\nEND\n"))
+    started = time.monotonic()
+    assert instance.wait(5) is True
+    assert time.monotonic() - started < 1
+
+
+def test_wait_coalesces_temp_file_and_rename(watcher, tmp_path):
+    instance, status_path = watcher
+
+    def _flush():
+        tmp = tmp_path / "status.log.tmp"
+        tmp.write_text("TITLE\nEND\n")
+        os.replace(tmp, status_path)
+
+    _later(_flush)
+    assert instance.wait(5) is True
+    # The whole flush was consumed by the first wake-up.
+    assert instance.wait(0.1) is False
+
+
+def test_wait_falls_back_to_sleep_when_directory_is_missing(tmp_path):
+    from app import status_watcher
+
+    instance = status_watcher.StatusFileWatcher(str(tmp_path / "missing" / "status.log"))
+    started = time.monotonic()
+    assert instance.wait(0.1) is False
+    assert time.monotonic() - started >= 0.1
+    assert not instance.active
+    instance.close()
@@ -0,0 +1,89 @@
+import logging
+
+import pytest
+
+
+def _reload_app(app_env, enabled):
+    app_env(OPENVPN_TIMING="1" if enabled else None)
+
+    from app import collector, routes, timing
+
+    return timing, collector, routes.app.test_client()
+
+
+@pytest.fixture
+def timed_app(app_env):
+    yield _reload_app(app_env, enabled=True)
+
+    from app import timing
+
+    timing.configure(enabled=False, slow_ms=0)
+    timing.reset()
+
+
+def test_disabled_spans_are_noops(app_env):
+    timing, _, client = _reload_app(app_env, enabled=False)
+
+    assert timing.span("parser.parse") is timing.span("geo.read")
+    with timing.span("parser.parse"):
+        pass
+    assert timing.summary() == {}
+    assert client.get("/api/debug/timings").status_code == 404
+
+
+def test_summary_reports_rolling_percentiles(timed_app):
+    timing, _, _ = timed_app
+
+    for value in range(100, 0, -1):
+        timing.record("stage", value / 1000)
+
+    assert timing.summary()["stage"] == {
+        "count": 100,
+        "window": 100,
+        "p50_ms": 50.0,
+        "p95_ms": 95.0,
+        "p99_ms": 99.0,
+        "max_ms": 100.0,
+    }
+
+
+def test_slow_spans_are_logged(timed_app, caplog):
+    timing, _, _ = timed_app
+    timing.configure(slow_ms=5)
+
+    with caplog.at_level(logging.WARNING, logger="app.timing"):
+        timing.record("fast", 0.001)
+        timing.record("slow", 0.010)
+
+    assert [record.getMessage() for record in caplog.records] == ["Slow slow: 10.0 ms"]
+
+
+def test_debug_endpoint_reports_web_and_collector_spans(timed_app, tmp_path):
+    _, collector, client = timed_app
+
+    (tmp_path / "status.log").write_text(
+        "Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since\n"
+        "alice,198.51.100.10:1194,1024,2048,2024-01-01 12:00:00\n"
+        "ROUTING TABLE\nGLOBAL STATS\n"
+    )
+    collector.collect_once()
+
+    assert client.get("/api/clients").status_code == 200
+    payload = client.get("/api/debug/timings").get_json()
+
+    assert {"routes.request.api_clients", "routes.snapshot.load", "routes.render"} <= set(
+        payload["web"]
+    )
+    assert {
+        "parser.sessions_lock.wait",
+        "parser.parse",
+        "parser.apply",
+        "parser.sessions.dump",
+        "parser.sessions.fsync",
+        "history.lock.wait",
+        "history.fsync",
+    } <= set(payload["collector"])
+
+    stats = payload["collector"]["parser.parse"]
+    assert stats["count"] == 1
+    assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"] <= stats["max_ms"]